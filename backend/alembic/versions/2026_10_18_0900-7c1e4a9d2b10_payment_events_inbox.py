@@ -0,0 +1,79 @@
+"""payment_events inbox columns
+
+Revision ID: 7c1e4a9d2b10
+Revises: 3bf3381ee982
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "7c1e4a9d2b10"
+down_revision: Union[str, Sequence[str], None] = "3bf3381ee982"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "payment_events",
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        schema="seranking",
+    )
+    op.add_column(
+        "payment_events",
+        sa.Column("last_error", sa.String(length=512), nullable=True),
+        schema="seranking",
+    )
+    op.add_column(
+        "payment_events",
+        sa.Column(
+            "received_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.text("now()"),
+        ),
+        schema="seranking",
+    )
+    # Backfill arrival time for historical rows that were processed inline.
+    op.execute("UPDATE seranking.payment_events SET received_at = processed_at")
+    op.alter_column("payment_events", "attempts", server_default=None, schema="seranking")
+    op.alter_column("payment_events", "received_at", server_default=None, schema="seranking")
+    op.alter_column(
+        "payment_events",
+        "processed_at",
+        existing_type=sa.DateTime(timezone=True),
+        nullable=True,
+        schema="seranking",
+    )
+    op.create_index(
+        "ix_payment_events_process_result_received_at",
+        "payment_events",
+        ["process_result", "received_at"],
+        unique=False,
+        schema="seranking",
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        "ix_payment_events_process_result_received_at",
+        table_name="payment_events",
+        schema="seranking",
+    )
+    op.execute("UPDATE seranking.payment_events SET processed_at = received_at WHERE processed_at IS NULL")
+    op.alter_column(
+        "payment_events",
+        "processed_at",
+        existing_type=sa.DateTime(timezone=True),
+        nullable=False,
+        schema="seranking",
+    )
+    op.drop_column("payment_events", "received_at", schema="seranking")
+    op.drop_column("payment_events", "last_error", schema="seranking")
+    op.drop_column("payment_events", "attempts", schema="seranking")
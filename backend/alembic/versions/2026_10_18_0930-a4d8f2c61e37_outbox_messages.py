@@ -0,0 +1,70 @@
+"""outbox messages
+
+Revision ID: a4d8f2c61e37
+Revises: 7c1e4a9d2b10
+Create Date: 2026-10-18 09:30:00.000000
+
+"""
+
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "a4d8f2c61e37"
+down_revision: Union[str, Sequence[str], None] = "7c1e4a9d2b10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "outbox_messages",
+        sa.Column("id", sa.String(length=36), nullable=False),
+        sa.Column("order_id", sa.String(length=36), nullable=False),
+        sa.Column("kind", sa.String(length=32), nullable=False),
+        sa.Column(
+            "payload_json",
+            postgresql.JSONB(astext_type=sa.Text()).with_variant(sa.JSON(), "sqlite"),
+            nullable=False,
+        ),
+        sa.Column("status", sa.String(length=32), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("last_error", sa.String(length=512), nullable=True),
+        sa.Column("next_attempt_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("sent_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        schema="seranking",
+    )
+    op.create_index(
+        op.f("ix_seranking_outbox_messages_order_id"),
+        "outbox_messages",
+        ["order_id"],
+        unique=False,
+        schema="seranking",
+    )
+    op.create_index(
+        "ix_outbox_messages_status_next_attempt_at",
+        "outbox_messages",
+        ["status", "next_attempt_at"],
+        unique=False,
+        schema="seranking",
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        "ix_outbox_messages_status_next_attempt_at",
+        table_name="outbox_messages",
+        schema="seranking",
+    )
+    op.drop_index(
+        op.f("ix_seranking_outbox_messages_order_id"),
+        table_name="outbox_messages",
+        schema="seranking",
+    )
+    op.drop_table("outbox_messages", schema="seranking")
@@ -0,0 +1,43 @@
+"""payment_events partition key
+
+Revision ID: 5e2b7d90c4f1
+Revises: a4d8f2c61e37
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "5e2b7d90c4f1"
+down_revision: Union[str, Sequence[str], None] = "a4d8f2c61e37"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "payment_events",
+        sa.Column("partition_key", sa.String(length=128), nullable=True),
+        schema="seranking",
+    )
+    op.create_index(
+        "ix_payment_events_partition_key_received_at",
+        "payment_events",
+        ["partition_key", "received_at"],
+        unique=False,
+        schema="seranking",
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        "ix_payment_events_partition_key_received_at",
+        table_name="payment_events",
+        schema="seranking",
+    )
+    op.drop_column("payment_events", "partition_key", schema="seranking")
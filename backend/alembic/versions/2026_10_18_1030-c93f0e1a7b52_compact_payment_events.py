@@ -0,0 +1,103 @@
+"""compact payment_events payloads
+
+Revision ID: c93f0e1a7b52
+Revises: 5e2b7d90c4f1
+Create Date: 2026-10-18 10:30:00.000000
+
+"""
+
+import json
+import logging
+from typing import Any, Mapping, Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "c93f0e1a7b52"
+down_revision: Union[str, Sequence[str], None] = "5e2b7d90c4f1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger("quiz.migrations")
+
+BATCH_SIZE = 500
+# Frozen copy of the projection at this revision; later changes to app code must not alter what it executes.
+PROJECTED_OBJECT_FIELDS = ("id", "customer", "subscription", "payment_intent", "status", "current_period_end")
+
+payment_events = sa.table(
+    "payment_events",
+    sa.column("id", sa.String(length=36)),
+    sa.column("payload_json", postgresql.JSONB(astext_type=sa.Text())),
+    schema="seranking",
+)
+
+
+def _project_event(event: Mapping[str, Any]) -> dict[str, Any]:
+    obj: Mapping[str, Any] = (event.get("data") or {}).get("object") or {}
+    projected_object: dict[str, Any] = {key: obj[key] for key in PROJECTED_OBJECT_FIELDS if obj.get(key) is not None}
+    order_id = (obj.get("metadata") or {}).get("order_id")
+    if order_id:
+        projected_object["metadata"] = {"order_id": order_id}
+    period_end = (((obj.get("lines") or {}).get("data") or [{}])[0].get("period") or {}).get("end")
+    if period_end is not None:
+        projected_object["lines"] = {"data": [{"period": {"end": period_end}}]}
+    projected: dict[str, Any] = {"id": event.get("id"), "type": event.get("type"), "data": {"object": projected_object}}
+    if event.get("created") is not None:
+        projected["created"] = event.get("created")
+    return projected
+
+
+def _payload_size(payload: Mapping[str, Any]) -> int:
+    return len(json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8"))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "payment_events",
+        sa.Column("raw_body_compressed", sa.LargeBinary(), nullable=True),
+        schema="seranking",
+    )
+    connection = op.get_bind()
+    rows_scanned = rows_rewritten = bytes_before = bytes_after = 0
+    last_id = ""
+    while True:
+        rows = connection.execute(
+            sa.select(payment_events.c.id, payment_events.c.payload_json)
+            .where(payment_events.c.id > last_id)
+            .order_by(payment_events.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        for row_id, payload in rows:
+            rows_scanned += 1
+            current: dict[str, Any] = payload or {}
+            projected = _project_event(current)
+            before = _payload_size(current)
+            after = _payload_size(projected)
+            bytes_before += before
+            if after < before:
+                connection.execute(
+                    sa.update(payment_events).where(payment_events.c.id == row_id).values(payload_json=projected)
+                )
+                rows_rewritten += 1
+                bytes_after += after
+            else:
+                bytes_after += before
+        last_id = rows[-1][0]
+    logger.info(
+        "payment_events_compacted rows_scanned=%d rows_rewritten=%d bytes_before=%d bytes_after=%d bytes_saved=%d",
+        rows_scanned,
+        rows_rewritten,
+        bytes_before,
+        bytes_after,
+        bytes_before - bytes_after,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Projected payloads cannot be expanded back; only the raw-body column is removed.
+    op.drop_column("payment_events", "raw_body_compressed", schema="seranking")
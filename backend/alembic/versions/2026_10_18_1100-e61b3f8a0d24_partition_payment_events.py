@@ -0,0 +1,174 @@
+"""partition payment_events by month
+
+Revision ID: e61b3f8a0d24
+Revises: c93f0e1a7b52
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+
+from datetime import datetime, timezone
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "e61b3f8a0d24"
+down_revision: Union[str, Sequence[str], None] = "c93f0e1a7b52"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = (
+    "id, stripe_event_id, event_type, partition_key, payload_json, raw_body_compressed, "
+    "process_result, attempts, last_error, received_at, processed_at"
+)
+
+
+# Partition helpers are frozen copies of app.core.db.partitions as of this revision; the
+# app module may change, this migration must not.
+def _month_start(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    value = value.astimezone(timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def _add_months(value: datetime, months: int) -> datetime:
+    month_index = value.year * 12 + (value.month - 1) + months
+    return value.replace(year=month_index // 12, month=month_index % 12 + 1, day=1)
+
+
+def _create_monthly_partitions(first_month: datetime, last_month: datetime) -> None:
+    lower = _month_start(first_month)
+    last = _month_start(last_month)
+    while lower <= last:
+        upper = _add_months(lower, 1)
+        op.execute(
+            f"CREATE TABLE IF NOT EXISTS seranking.payment_events_{lower.year:04d}_{lower.month:02d} "
+            f"PARTITION OF seranking.payment_events FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+        )
+        lower = upper
+
+
+def _create_payment_events(partitioned: bool) -> None:
+    primary_key = "PRIMARY KEY (id, received_at)" if partitioned else "PRIMARY KEY (id)"
+    suffix = " PARTITION BY RANGE (received_at)" if partitioned else ""
+    op.execute(
+        f"""
+        CREATE TABLE seranking.payment_events (
+            id VARCHAR(36) NOT NULL,
+            stripe_event_id VARCHAR(128) NOT NULL,
+            event_type VARCHAR(128) NOT NULL,
+            partition_key VARCHAR(128),
+            payload_json JSONB NOT NULL,
+            raw_body_compressed BYTEA,
+            process_result VARCHAR(32) NOT NULL,
+            attempts INTEGER NOT NULL,
+            last_error VARCHAR(512),
+            received_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            processed_at TIMESTAMP WITH TIME ZONE,
+            CONSTRAINT payment_events_pkey {primary_key}
+        ){suffix}
+        """
+    )
+
+
+def _rename_legacy_payment_events() -> None:
+    op.execute("ALTER TABLE seranking.payment_events RENAME TO payment_events_legacy")
+    op.execute("ALTER TABLE seranking.payment_events_legacy RENAME CONSTRAINT payment_events_pkey TO payment_events_legacy_pkey")
+    for index_name in (
+        "ix_seranking_payment_events_stripe_event_id",
+        "ix_payment_events_process_result_received_at",
+        "ix_payment_events_partition_key_received_at",
+    ):
+        op.execute(f"ALTER INDEX seranking.{index_name} RENAME TO {index_name.replace('payment_events', 'payment_events_legacy')}")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "payment_event_keys",
+        sa.Column("stripe_event_id", sa.String(length=128), nullable=False),
+        sa.Column("received_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("stripe_event_id"),
+        schema="seranking",
+    )
+    op.create_index(
+        op.f("ix_seranking_payment_event_keys_received_at"),
+        "payment_event_keys",
+        ["received_at"],
+        unique=False,
+        schema="seranking",
+    )
+    op.execute(
+        "INSERT INTO seranking.payment_event_keys (stripe_event_id, received_at) "
+        "SELECT stripe_event_id, received_at FROM seranking.payment_events"
+    )
+
+    _rename_legacy_payment_events()
+    _create_payment_events(partitioned=True)
+    op.create_index(
+        op.f("ix_seranking_payment_events_stripe_event_id"),
+        "payment_events",
+        ["stripe_event_id"],
+        unique=False,
+        schema="seranking",
+    )
+    op.create_index(
+        "ix_payment_events_process_result_received_at",
+        "payment_events",
+        ["process_result", "received_at"],
+        unique=False,
+        schema="seranking",
+    )
+    op.create_index(
+        "ix_payment_events_partition_key_received_at",
+        "payment_events",
+        ["partition_key", "received_at"],
+        unique=False,
+        schema="seranking",
+    )
+    # Safety net for rows outside the pre-created months; run_retention keeps it empty.
+    op.execute("CREATE TABLE seranking.payment_events_default PARTITION OF seranking.payment_events DEFAULT")
+
+    connection = op.get_bind()
+    now = datetime.now(timezone.utc)
+    oldest = connection.execute(sa.text("SELECT min(received_at) FROM seranking.payment_events_legacy")).scalar()
+    _create_monthly_partitions(_month_start(oldest or now), _add_months(_month_start(now), 2))
+
+    op.execute(f"INSERT INTO seranking.payment_events ({COLUMNS}) SELECT {COLUMNS} FROM seranking.payment_events_legacy")
+    op.execute("DROP TABLE seranking.payment_events_legacy")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _rename_legacy_payment_events()
+    _create_payment_events(partitioned=False)
+    op.execute(f"INSERT INTO seranking.payment_events ({COLUMNS}) SELECT {COLUMNS} FROM seranking.payment_events_legacy")
+    op.execute("DROP TABLE seranking.payment_events_legacy CASCADE")
+    op.create_index(
+        op.f("ix_seranking_payment_events_stripe_event_id"),
+        "payment_events",
+        ["stripe_event_id"],
+        unique=True,
+        schema="seranking",
+    )
+    op.create_index(
+        "ix_payment_events_process_result_received_at",
+        "payment_events",
+        ["process_result", "received_at"],
+        unique=False,
+        schema="seranking",
+    )
+    op.create_index(
+        "ix_payment_events_partition_key_received_at",
+        "payment_events",
+        ["partition_key", "received_at"],
+        unique=False,
+        schema="seranking",
+    )
+    op.drop_index(
+        op.f("ix_seranking_payment_event_keys_received_at"),
+        table_name="payment_event_keys",
+        schema="seranking",
+    )
+    op.drop_table("payment_event_keys", schema="seranking")
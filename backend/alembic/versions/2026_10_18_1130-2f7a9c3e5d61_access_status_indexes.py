@@ -0,0 +1,65 @@
+"""composite indexes for access status lookup
+
+Revision ID: 2f7a9c3e5d61
+Revises: e61b3f8a0d24
+Create Date: 2026-10-18 11:30:00.000000
+
+"""
+
+from typing import Sequence, Union
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "2f7a9c3e5d61"
+down_revision: Union[str, Sequence[str], None] = "e61b3f8a0d24"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        "ix_access_bindings_telegram_user_id_status_bound_at",
+        "access_bindings",
+        ["telegram_user_id", "status", "bound_at"],
+        unique=False,
+        schema="seranking",
+    )
+    op.create_index(
+        "ix_access_bindings_telegram_user_id_bound_at",
+        "access_bindings",
+        ["telegram_user_id", "bound_at"],
+        unique=False,
+        schema="seranking",
+    )
+    # Superseded by the composite indexes above (same leading column).
+    op.drop_index(
+        op.f("ix_seranking_access_bindings_telegram_user_id"),
+        table_name="access_bindings",
+        schema="seranking",
+    )
+    op.create_index(
+        "ix_orders_telegram_chat_id_updated_at",
+        "orders",
+        ["telegram_chat_id", "updated_at"],
+        unique=False,
+        schema="seranking",
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_orders_telegram_chat_id_updated_at", table_name="orders", schema="seranking")
+    op.create_index(
+        op.f("ix_seranking_access_bindings_telegram_user_id"),
+        "access_bindings",
+        ["telegram_user_id"],
+        unique=False,
+        schema="seranking",
+    )
+    op.drop_index("ix_access_bindings_telegram_user_id_bound_at", table_name="access_bindings", schema="seranking")
+    op.drop_index(
+        "ix_access_bindings_telegram_user_id_status_bound_at",
+        table_name="access_bindings",
+        schema="seranking",
+    )
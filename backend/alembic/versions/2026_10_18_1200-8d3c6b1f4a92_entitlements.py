@@ -0,0 +1,72 @@
+"""entitlements table
+
+Revision ID: 8d3c6b1f4a92
+Revises: 2f7a9c3e5d61
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "8d3c6b1f4a92"
+down_revision: Union[str, Sequence[str], None] = "2f7a9c3e5d61"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Frozen copy of the access resolution at this revision, as one set-based statement:
+# tier 0 = latest active binding, 1 = latest binding of any status, 2 = latest order with matching chat id.
+BACKFILL_ENTITLEMENTS = """
+INSERT INTO seranking.entitlements (telegram_user_id, order_id, plan, access_status, is_paid, valid_until, updated_at)
+SELECT DISTINCT ON (candidates.telegram_user_id)
+    candidates.telegram_user_id,
+    orders.id,
+    orders.plan,
+    orders.access_status,
+    COALESCE(candidates.tier <> 1 AND (orders.access_status = 'active' OR orders.status IN ('paid', 'active')), false),
+    orders.stripe_current_period_end,
+    now()
+FROM (
+    SELECT telegram_user_id, order_id, CASE WHEN status = 'active' THEN 0 ELSE 1 END AS tier, bound_at AS ranked_at
+    FROM seranking.access_bindings
+    UNION ALL
+    SELECT telegram_chat_id, id, 2, updated_at
+    FROM seranking.orders
+    WHERE telegram_chat_id IS NOT NULL
+) AS candidates
+JOIN seranking.orders AS orders ON orders.id = candidates.order_id
+ORDER BY candidates.telegram_user_id, candidates.tier, candidates.ranked_at DESC
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "entitlements",
+        sa.Column("telegram_user_id", sa.String(length=64), nullable=False),
+        sa.Column("order_id", sa.String(length=36), nullable=True),
+        sa.Column("plan", sa.String(length=64), nullable=True),
+        sa.Column("access_status", sa.String(length=32), nullable=True),
+        sa.Column("is_paid", sa.Boolean(), nullable=False),
+        sa.Column("valid_until", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("telegram_user_id"),
+        schema="seranking",
+    )
+    op.create_index(
+        op.f("ix_seranking_entitlements_order_id"),
+        "entitlements",
+        ["order_id"],
+        unique=False,
+        schema="seranking",
+    )
+    # Access checks read only this table, so it must be complete before the new code serves traffic.
+    op.execute(BACKFILL_ENTITLEMENTS)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_seranking_entitlements_order_id"), table_name="entitlements", schema="seranking")
+    op.drop_table("entitlements", schema="seranking")
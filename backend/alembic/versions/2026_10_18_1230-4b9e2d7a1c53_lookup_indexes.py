@@ -0,0 +1,82 @@
+"""lookup indexes for webhook, restore and token paths
+
+Revision ID: 4b9e2d7a1c53
+Revises: 8d3c6b1f4a92
+Create Date: 2026-10-18 12:30:00.000000
+
+"""
+
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "4b9e2d7a1c53"
+down_revision: Union[str, Sequence[str], None] = "8d3c6b1f4a92"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, table, columns, partial predicate). Access binding and telegram_chat_id lookups are
+# covered by 2f7a9c3e5d61.
+INDEXES: list[tuple[str, str, list[str], str | None]] = [
+    ("ix_orders_stripe_subscription_id", "orders", ["stripe_subscription_id"], None),
+    ("ix_orders_stripe_customer_id_updated_at", "orders", ["stripe_customer_id", "updated_at"], None),
+    ("ix_orders_stripe_payment_intent_id", "orders", ["stripe_payment_intent_id"], None),
+    ("ix_access_tokens_order_id_status_issued_at", "access_tokens", ["order_id", "status", "issued_at"], None),
+    ("ix_restore_otps_email_created_at", "restore_otps", ["email", "created_at"], None),
+    ("ix_restore_otps_email_created_at_unused", "restore_otps", ["email", "created_at"], "used_at IS NULL"),
+]
+# Superseded by the composite indexes above (same leading column).
+SUPERSEDED: list[tuple[str, str, list[str]]] = [
+    ("ix_seranking_access_tokens_order_id", "access_tokens", ["order_id"]),
+    ("ix_seranking_restore_otps_email", "restore_otps", ["email"]),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY cannot run inside a transaction block. If a build fails it leaves an INVALID
+    # index behind: drop it and rerun the migration.
+    with op.get_context().autocommit_block():
+        for name, table_name, columns, where in INDEXES:
+            op.create_index(
+                name,
+                table_name,
+                columns,
+                unique=False,
+                schema="seranking",
+                postgresql_concurrently=True,
+                postgresql_where=sa.text(where) if where else None,
+                if_not_exists=True,
+            )
+        for name, table_name, _ in SUPERSEDED:
+            op.drop_index(
+                op.f(name),
+                table_name=table_name,
+                schema="seranking",
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table_name, columns in SUPERSEDED:
+            op.create_index(
+                op.f(name),
+                table_name,
+                columns,
+                unique=False,
+                schema="seranking",
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+        for name, table_name, _, _ in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name=table_name,
+                schema="seranking",
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
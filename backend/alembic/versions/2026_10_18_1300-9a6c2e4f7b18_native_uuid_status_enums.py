@@ -0,0 +1,91 @@
+"""native uuid ids and enum statuses
+
+Revision ID: 9a6c2e4f7b18
+Revises: 4b9e2d7a1c53
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "9a6c2e4f7b18"
+down_revision: Union[str, Sequence[str], None] = "4b9e2d7a1c53"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Frozen copy of the status sets in app.core.models.payment at this revision.
+ENUM_TYPES: dict[str, tuple[str, ...]] = {
+    "order_status": (
+        "created",
+        "session_created",
+        "paid",
+        "expired",
+        "failed",
+        "past_due",
+        "canceled",
+        "active",
+        "trialing",
+        "incomplete",
+        "incomplete_expired",
+        "unpaid",
+        "paused",
+    ),
+    "fulfillment_status": ("pending", "partial", "done"),
+    "access_status": ("pending", "token_issued", "active", "grace_period", "expired", "revoked"),
+    "access_token_status": ("issued", "activated", "revoked"),
+    "access_binding_status": ("active", "inactive", "revoked"),
+}
+UUID_COLUMNS: dict[str, list[str]] = {
+    "orders": ["id"],
+    "payment_events": ["id"],
+    "access_tokens": ["id", "order_id"],
+    "access_bindings": ["id", "order_id"],
+    "entitlements": ["order_id"],
+    "restore_otps": ["id"],
+    "outbox_messages": ["id", "order_id"],
+}
+# table -> [(column, enum type)]
+STATUS_COLUMNS: dict[str, list[tuple[str, str]]] = {
+    "orders": [("status", "order_status"), ("fulfillment_status", "fulfillment_status"), ("access_status", "access_status")],
+    "access_tokens": [("status", "access_token_status")],
+    "access_bindings": [("status", "access_binding_status")],
+    "entitlements": [("access_status", "access_status")],
+}
+
+
+def _alter_table(table_name: str, clauses: list[str]) -> None:
+    # One ALTER TABLE per table so every table and its indexes are rewritten once.
+    op.execute(f"ALTER TABLE seranking.{table_name} " + ", ".join(clauses))
+    op.execute(f"ANALYZE seranking.{table_name}")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    for name, values in ENUM_TYPES.items():
+        postgresql.ENUM(*values, name=name, schema="seranking").create(bind, checkfirst=True)
+
+    # Rewrites each table under ACCESS EXCLUSIVE (payment_events: every partition); run it in a
+    # maintenance window. A status outside the enum aborts the migration with "invalid input value".
+    for table_name in sorted(UUID_COLUMNS.keys() | STATUS_COLUMNS.keys()):
+        clauses = [f"ALTER COLUMN {column} TYPE uuid USING {column}::uuid" for column in UUID_COLUMNS.get(table_name, [])]
+        clauses += [
+            f"ALTER COLUMN {column} TYPE seranking.{type_name} USING {column}::seranking.{type_name}"
+            for column, type_name in STATUS_COLUMNS.get(table_name, [])
+        ]
+        _alter_table(table_name, clauses)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table_name in sorted(UUID_COLUMNS.keys() | STATUS_COLUMNS.keys()):
+        clauses = [f"ALTER COLUMN {column} TYPE varchar(36) USING {column}::text" for column in UUID_COLUMNS.get(table_name, [])]
+        clauses += [f"ALTER COLUMN {column} TYPE varchar(32) USING {column}::text" for column, _ in STATUS_COLUMNS.get(table_name, [])]
+        _alter_table(table_name, clauses)
+
+    bind = op.get_bind()
+    for name in reversed(list(ENUM_TYPES)):
+        postgresql.ENUM(name=name, schema="seranking").drop(bind, checkfirst=True)
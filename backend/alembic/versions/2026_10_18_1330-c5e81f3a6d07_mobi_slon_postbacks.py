@@ -0,0 +1,60 @@
+"""mobi-slon postback queue
+
+Revision ID: c5e81f3a6d07
+Revises: 9a6c2e4f7b18
+Create Date: 2026-10-18 13:30:00.000000
+
+"""
+
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "c5e81f3a6d07"
+down_revision: Union[str, Sequence[str], None] = "9a6c2e4f7b18"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "mobi_slon_postbacks",
+        sa.Column("id", sa.Uuid(as_uuid=False), nullable=False),
+        sa.Column("clickid", sa.String(length=256), nullable=False),
+        sa.Column("cnv_status", sa.String(length=64), nullable=False),
+        sa.Column(
+            "params_json",
+            postgresql.JSONB(astext_type=sa.Text()).with_variant(sa.JSON(), "sqlite"),
+            nullable=False,
+        ),
+        sa.Column("source", sa.String(length=32), nullable=False),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("last_error", sa.String(length=512), nullable=True),
+        sa.Column("next_attempt_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("sent_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("clickid", "cnv_status", name="uq_mobi_slon_postbacks_clickid_cnv_status"),
+        schema="seranking",
+    )
+    op.create_index(
+        "ix_mobi_slon_postbacks_status_next_attempt_at",
+        "mobi_slon_postbacks",
+        ["status", "next_attempt_at"],
+        unique=False,
+        schema="seranking",
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        "ix_mobi_slon_postbacks_status_next_attempt_at",
+        table_name="mobi_slon_postbacks",
+        schema="seranking",
+    )
+    op.drop_table("mobi_slon_postbacks", schema="seranking")
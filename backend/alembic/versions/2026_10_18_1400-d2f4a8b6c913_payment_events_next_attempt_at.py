@@ -0,0 +1,32 @@
+"""payment_events inbox retry backoff
+
+Revision ID: d2f4a8b6c913
+Revises: c5e81f3a6d07
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "d2f4a8b6c913"
+down_revision: Union[str, Sequence[str], None] = "c5e81f3a6d07"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Nullable without a default: on the partitioned table this is a catalog-only change.
+    op.add_column(
+        "payment_events",
+        sa.Column("next_attempt_at", sa.DateTime(timezone=True), nullable=True),
+        schema="seranking",
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("payment_events", "next_attempt_at", schema="seranking")
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import secrets
+
+from fastapi import Depends, Header, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import Settings, get_settings
+from app.core.container import AppContainer, get_container
+from app.core.db.session import get_async_db, get_async_replica_db, get_db, get_replica_db
+from app.services.async_payment_service import AsyncPaymentService
+from app.services.payment_service import PaymentService
+
+
+def require_internal_token(
+    x_internal_token: str | None = Header(default=None, alias="X-Internal-Token"),
+    settings: Settings = Depends(get_settings),
+) -> None:
+    if not settings.bot_internal_token:
+        raise HTTPException(status_code=503, detail="Bot internal auth is not configured")
+    if not x_internal_token or not secrets.compare_digest(x_internal_token, settings.bot_internal_token):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+
+async def get_app_container(request: Request) -> AppContainer:
+    # Set by the lifespan; the lazy process container covers apps served without it.
+    # Async so DB-free endpoints resolve it on the event loop instead of the threadpool.
+    return getattr(request.app.state, "container", None) or get_container()
+
+
+def get_payment_service(
+    db: Session = Depends(get_db), container: AppContainer = Depends(get_app_container)
+) -> PaymentService:
+    return PaymentService(container.settings, db, container=container)
+
+
+def get_replica_payment_service(
+    db: Session = Depends(get_replica_db), container: AppContainer = Depends(get_app_container)
+) -> PaymentService:
+    return PaymentService(container.settings, db, container=container)
+
+
+def get_async_payment_service(
+    db: AsyncSession = Depends(get_async_db), container: AppContainer = Depends(get_app_container)
+) -> AsyncPaymentService:
+    return AsyncPaymentService(container.settings, db, container=container)
+
+
+def get_async_replica_payment_service(
+    db: AsyncSession = Depends(get_async_db),
+    replica: AsyncSession = Depends(get_async_replica_db),
+    container: AppContainer = Depends(get_app_container),
+) -> AsyncPaymentService:
+    return AsyncPaymentService(container.settings, db, replica=replica, container=container)
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import logging
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.db.query_stats import track_queries
+
+logger = logging.getLogger("quiz.http")
+
+
+class QueryStatsMiddleware:
+    """Counts SQL statements and DB time per request; reported in Server-Timing and one log line."""
+
+    def __init__(self, app: ASGIApp, *, server_timing: bool = True) -> None:
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+        with track_queries() as stats:
+
+            async def send_with_timing(message: Message) -> None:
+                nonlocal status_code
+                if message["type"] == "http.response.start":
+                    status_code = message["status"]
+                    if self.server_timing:
+                        app_ms = (time.perf_counter() - started) * 1000
+                        MutableHeaders(scope=message).append(
+                            "Server-Timing",
+                            f'db;dur={stats.db_ms:.1f};desc="{stats.statements} queries", app;dur={app_ms:.1f}',
+                        )
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                if stats.statements:
+                    logger.info(
+                        "http_request method=%s path=%s status=%d queries=%d db_ms=%.1f duration_ms=%.1f",
+                        scope["method"],
+                        scope["path"],
+                        status_code,
+                        stats.statements,
+                        stats.db_ms,
+                        (time.perf_counter() - started) * 1000,
+                    )
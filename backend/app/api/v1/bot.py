@@ -1,21 +1,33 @@
 from __future__ import annotations
 
+import asyncio
+from collections.abc import AsyncIterator
+import json
 import logging
-import secrets
 
-from fastapi import APIRouter, Depends, Header, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
 
-from app.core.config import Settings, get_settings
-from app.core.db.session import get_db
+from app.api.deps import (
+    get_async_payment_service,
+    get_async_replica_payment_service,
+    get_payment_service,
+    require_internal_token,
+)
+from app.core.config import get_settings
 from app.core.security import mask_email
 from app.schemas.bot import (
+    BotAccessStatusBatchRequest,
+    BotAccessStatusBatchResponse,
     BotAccessStatusRequest,
     BotAccessStatusResponse,
     BotActivateAccessRequest,
     BotRestoreConfirmRequest,
     BotRestoreRequest,
 )
+from app.services.async_payment_service import AsyncPaymentService
+from app.services.entitlement_feed import CLOSE_EVENT
+from app.services.entitlements import ENTITLEMENT_FEED
 from app.services.payment_service import PaymentService
 
 logger = logging.getLogger("quiz.bot_api")
@@ -23,34 +35,77 @@ logger = logging.getLogger("quiz.bot_api")
 router = APIRouter()
 
 
-def _require_internal_token(
-    x_internal_token: str | None = Header(default=None, alias="X-Internal-Token"),
-    settings: Settings = Depends(get_settings),
-) -> None:
-    if not settings.bot_internal_token:
-        raise HTTPException(status_code=503, detail="Bot internal auth is not configured")
-    if not x_internal_token or not secrets.compare_digest(x_internal_token, settings.bot_internal_token):
-        raise HTTPException(status_code=401, detail="Unauthorized")
-
-
 @router.post(
     "/api/bot/access/status",
     response_model=BotAccessStatusResponse,
-    dependencies=[Depends(_require_internal_token)],
+    dependencies=[Depends(require_internal_token)],
 )
-def bot_access_status(payload: BotAccessStatusRequest, db: Session = Depends(get_db)) -> BotAccessStatusResponse:
-    service = PaymentService(get_settings(), db)
-    status = service.get_access_status_by_telegram_user(payload.telegram_user_id)
+async def bot_access_status(
+    payload: BotAccessStatusRequest,
+    service: AsyncPaymentService = Depends(get_async_replica_payment_service),
+) -> BotAccessStatusResponse:
+    status = await service.get_access_status_by_telegram_user(payload.telegram_user_id)
     logger.info("bot_access_check", extra={"telegram_user_id": payload.telegram_user_id, "is_paid": status["is_paid"]})
     return BotAccessStatusResponse(**status)
 
 
+@router.post(
+    "/api/bot/access/status/batch",
+    response_model=BotAccessStatusBatchResponse,
+    dependencies=[Depends(require_internal_token)],
+)
+async def bot_access_status_batch(
+    payload: BotAccessStatusBatchRequest,
+    service: AsyncPaymentService = Depends(get_async_replica_payment_service),
+) -> BotAccessStatusBatchResponse:
+    statuses = await service.get_access_statuses_by_telegram_users(payload.telegram_user_ids)
+    logger.info(
+        "bot_access_check_batch users=%d paid=%d",
+        len(statuses),
+        sum(1 for status in statuses.values() if status["is_paid"]),
+    )
+    return BotAccessStatusBatchResponse(
+        statuses={user_id: BotAccessStatusResponse.model_validate(status) for user_id, status in statuses.items()}
+    )
+
+
+@router.get(
+    "/api/bot/access/changes",
+    dependencies=[Depends(require_internal_token)],
+)
+async def bot_access_changes(request: Request) -> StreamingResponse:
+    heartbeat_seconds = get_settings().entitlement_feed_heartbeat_seconds
+
+    async def stream() -> AsyncIterator[str]:
+        async with ENTITLEMENT_FEED.subscribe() as queue:
+            logger.info("bot_access_feed_connected subscribers=%d", ENTITLEMENT_FEED.stats()["subscribers"])
+            yield "event: ready\ndata: {}\n\n"
+            # Ends with the app lifespan (the feed is closed on shutdown); the bot then reconnects.
+            while not ENTITLEMENT_FEED.closing and not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=heartbeat_seconds)
+                except TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if event is CLOSE_EVENT:
+                    break
+                yield f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+        logger.info("bot_access_feed_disconnected")
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post(
     "/api/bot/access/activate",
-    dependencies=[Depends(_require_internal_token)],
+    dependencies=[Depends(require_internal_token)],
 )
-def bot_activate_access(payload: BotActivateAccessRequest, db: Session = Depends(get_db)) -> dict[str, str | bool]:
-    service = PaymentService(get_settings(), db)
+async def bot_activate_access(
+    payload: BotActivateAccessRequest, service: AsyncPaymentService = Depends(get_async_payment_service)
+) -> dict[str, str | bool]:
     token = payload.activation_token.strip()
     token_preview = f"{token[:8]}...{token[-6:]}" if len(token) > 16 else token
     logger.info(
@@ -59,7 +114,7 @@ def bot_activate_access(payload: BotActivateAccessRequest, db: Session = Depends
         len(token),
         token_preview,
     )
-    result = service.activate_access(activation_token=token, telegram_user_id=payload.telegram_user_id)
+    result = await service.activate_access(activation_token=token, telegram_user_id=payload.telegram_user_id)
     logger.info(
         "bot_activation_result telegram_user_id=%s access_granted=%s order_id=%s",
         payload.telegram_user_id,
@@ -71,20 +126,24 @@ def bot_activate_access(payload: BotActivateAccessRequest, db: Session = Depends
 
 @router.post(
     "/api/bot/restore/request",
-    dependencies=[Depends(_require_internal_token)],
+    dependencies=[Depends(require_internal_token)],
 )
-def bot_restore_request(payload: BotRestoreRequest, db: Session = Depends(get_db)) -> dict[str, str]:
-    service = PaymentService(get_settings(), db)
+def bot_restore_request(
+    payload: BotRestoreRequest,
+    service: PaymentService = Depends(get_payment_service),
+) -> dict[str, str]:
     logger.info("bot_restore_request", extra={"email": mask_email(payload.email)})
     return service.restore_request(email=payload.email)
 
 
 @router.post(
     "/api/bot/restore/confirm",
-    dependencies=[Depends(_require_internal_token)],
+    dependencies=[Depends(require_internal_token)],
 )
-def bot_restore_confirm(payload: BotRestoreConfirmRequest, db: Session = Depends(get_db)) -> dict[str, str | bool | None]:
-    service = PaymentService(get_settings(), db)
+def bot_restore_confirm(
+    payload: BotRestoreConfirmRequest,
+    service: PaymentService = Depends(get_payment_service),
+) -> dict[str, str | bool | None]:
     logger.info(
         "bot_restore_confirm",
         extra={"email": mask_email(payload.email), "telegram_user_id": payload.telegram_user_id},
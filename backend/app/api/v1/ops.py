@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from typing import Any
+
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+
+from app.api.deps import get_app_container, require_internal_token
+from app.core.container import AppContainer
+from app.core.db.pool_metrics import pool_stats
+from app.core.db.session import get_db
+from app.services.entitlements import ACCESS_STATUS_CACHE, ENTITLEMENT_FEED
+from app.services.meta_capi import META_EVENT_RELAY
+from app.services.mobi_slon_postbacks import postback_stats
+from app.services.outbox import outbox_stats
+from app.services.webhook_inbox import inbox_stats
+
+router = APIRouter(dependencies=[Depends(require_internal_token)])
+
+
+@router.get("/api/internal/webhook-inbox")
+def webhook_inbox_stats(db: Session = Depends(get_db)) -> dict[str, int | float | None]:
+    return inbox_stats(db)
+
+
+@router.get("/api/internal/outbox")
+def fulfillment_outbox_stats(db: Session = Depends(get_db)) -> dict[str, int]:
+    return outbox_stats(db)
+
+
+@router.get("/api/internal/mobi-slon-postbacks")
+def mobi_slon_postback_stats(db: Session = Depends(get_db)) -> dict[str, Any]:
+    return postback_stats(db)
+
+
+@router.get("/api/internal/access-cache")
+def access_status_cache_stats() -> dict[str, int | float]:
+    return ACCESS_STATUS_CACHE.stats()
+
+
+@router.get("/api/internal/db-pool")
+def db_pool_stats() -> dict[str, dict[str, Any]]:
+    return pool_stats()
+
+
+@router.get("/api/internal/http-clients")
+def outbound_http_stats(container: AppContainer = Depends(get_app_container)) -> dict[str, dict[str, Any]]:
+    return container.http.stats()
+
+
+@router.get("/api/internal/entitlement-feed")
+def entitlement_feed_stats() -> dict[str, int]:
+    return ENTITLEMENT_FEED.stats()
+
+
+@router.get("/api/internal/meta-capi")
+def meta_capi_relay_stats() -> dict[str, int | float]:
+    return META_EVENT_RELAY.stats()
@@ -1,13 +1,12 @@
 from __future__ import annotations
 
-import time
+import asyncio
 import logging
 from typing import cast
 
 import httpx
 from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
 
 from app.schemas.payment import (
     ActivateAccessRequest,
@@ -20,8 +19,16 @@ from app.schemas.payment import (
     RestoreRequest,
     SessionStatusResponse,
 )
-from app.core.config import get_settings
-from app.core.db.session import get_db
+from app.api.deps import (
+    get_app_container,
+    get_async_payment_service,
+    get_payment_service,
+    get_replica_payment_service,
+)
+from app.core.container import AppContainer
+from app.services.async_payment_service import AsyncPaymentService
+from app.services.mobi_slon_relay import relay_mobi_slon_event as relay_to_intake
+from app.services.meta_capi import META_EVENT_RELAY, build_meta_event, send_meta_events
 from app.services.payment_service import PaymentService
 
 router = APIRouter()
@@ -29,8 +36,10 @@ logger = logging.getLogger(__name__)
 
 
 @router.post("/api/payment/checkout-session", response_model=CheckoutSessionResponse)
-def create_checkout_session(payload: CheckoutSessionRequest, db: Session = Depends(get_db)) -> CheckoutSessionResponse:
-    service = PaymentService(get_settings(), db)
+def create_checkout_session(
+    payload: CheckoutSessionRequest,
+    service: PaymentService = Depends(get_payment_service),
+) -> CheckoutSessionResponse:
     checkout_url, session_id, order_id = service.create_checkout_session(
         mode=payload.mode,
         plan=payload.plan,
@@ -46,16 +55,18 @@ def create_checkout_session(payload: CheckoutSessionRequest, db: Session = Depen
 async def stripe_webhook(
     request: Request,
     stripe_signature: str | None = Header(default=None, alias="stripe-signature"),
-    db: Session = Depends(get_db),
+    service: PaymentService = Depends(get_payment_service),
 ) -> dict[str, bool]:
     payload = await request.body()
-    service = PaymentService(get_settings(), db)
-    return service.handle_webhook(payload, stripe_signature)
+    # handle_webhook blocks on the DB (and on the partition advisory lock); keep it off the event loop.
+    return await asyncio.to_thread(service.handle_webhook, payload, stripe_signature)
 
 
 @router.get("/api/payment/session-status", response_model=SessionStatusResponse)
-def session_status(session_id: str = Query(min_length=1), db: Session = Depends(get_db)) -> SessionStatusResponse:
-    service = PaymentService(get_settings(), db)
+def session_status(
+    session_id: str = Query(min_length=1),
+    service: PaymentService = Depends(get_replica_payment_service),
+) -> SessionStatusResponse:
     payload = service.get_session_status(session_id)
     return SessionStatusResponse(
         payment_status=cast(str, payload["payment_status"]),
@@ -66,32 +77,40 @@ def session_status(session_id: str = Query(min_length=1), db: Session = Depends(
 
 
 @router.post("/api/payment/customer-portal")
-def customer_portal(payload: CustomerPortalRequest, db: Session = Depends(get_db)) -> dict[str, str]:
-    service = PaymentService(get_settings(), db)
+def customer_portal(
+    payload: CustomerPortalRequest,
+    service: PaymentService = Depends(get_replica_payment_service),
+) -> dict[str, str]:
     return {"portal_url": service.create_customer_portal(payload.email)}
 
 
 @router.post("/api/access/activate")
-def activate_access(payload: ActivateAccessRequest, db: Session = Depends(get_db)) -> dict[str, str | bool]:
-    service = PaymentService(get_settings(), db)
-    return service.activate_access(activation_token=payload.activation_token, telegram_user_id=payload.telegram_user_id)
+async def activate_access(
+    payload: ActivateAccessRequest,
+    service: AsyncPaymentService = Depends(get_async_payment_service),
+) -> dict[str, str | bool]:
+    return await service.activate_access(activation_token=payload.activation_token, telegram_user_id=payload.telegram_user_id)
 
 
 @router.post("/api/auth/restore/request")
-def restore_request(payload: RestoreRequest, db: Session = Depends(get_db)) -> dict[str, str]:
-    service = PaymentService(get_settings(), db)
+def restore_request(payload: RestoreRequest, service: PaymentService = Depends(get_payment_service)) -> dict[str, str]:
     return service.restore_request(email=payload.email)
 
 
 @router.post("/api/auth/restore/confirm")
-def restore_confirm(payload: RestoreConfirmRequest, db: Session = Depends(get_db)) -> dict[str, str | bool | None]:
-    service = PaymentService(get_settings(), db)
+def restore_confirm(
+    payload: RestoreConfirmRequest,
+    service: PaymentService = Depends(get_payment_service),
+) -> dict[str, str | bool | None]:
     return service.restore_confirm(email=payload.email, otp=payload.otp, telegram_user_id=payload.telegram_user_id)
 
 
 @router.post("/api/events/mobi-slon", response_model=MobiSlonEventResponse)
 @router.post("/api/tracking/mobi-slon-event", response_model=MobiSlonEventResponse)
-def relay_mobi_slon_event(payload: MobiSlonEventRequest, db: Session = Depends(get_db)) -> MobiSlonEventResponse:
+async def relay_mobi_slon_event(
+    payload: MobiSlonEventRequest,
+    container: AppContainer = Depends(get_app_container),
+) -> MobiSlonEventResponse:
     logger.info(
         "mobi_relay_http_in method=POST status=%s clickid=%s session_id=%s params=%d",
         payload.status,
@@ -99,26 +118,26 @@ def relay_mobi_slon_event(payload: MobiSlonEventRequest, db: Session = Depends(g
         (payload.session_id or "")[:64],
         len(payload.tracking_params or {}),
     )
-    service = PaymentService(get_settings(), db)
-    forwarded = service.relay_mobi_slon_event(
+    result = relay_to_intake(
+        container.settings,
         status=payload.status,
         clickid=payload.clickid,
         tracking_params=payload.tracking_params,
         session_id=payload.session_id,
         page_path=payload.page_path,
     )
-    return MobiSlonEventResponse(accepted=True, forwarded=forwarded)
+    return MobiSlonEventResponse(accepted=True, forwarded=result != "skipped", duplicate=result == "duplicate")
 
 
 @router.get("/api/events/mobi-slon", response_model=MobiSlonEventResponse)
 @router.get("/api/tracking/mobi-slon-event", response_model=MobiSlonEventResponse)
-def relay_mobi_slon_event_fallback(
+async def relay_mobi_slon_event_fallback(
     request: Request,
-    status: str = Query(min_length=1),
-    clickid: str = Query(min_length=1),
+    status: str = Query(min_length=1, max_length=64),
+    clickid: str = Query(min_length=1, max_length=256),
     session_id: str | None = Query(default=None),
     page_path: str | None = Query(default=None),
-    db: Session = Depends(get_db),
+    container: AppContainer = Depends(get_app_container),
 ) -> MobiSlonEventResponse:
     tracking_params = {
         key: value
@@ -132,15 +151,15 @@ def relay_mobi_slon_event_fallback(
         (session_id or "")[:64],
         len(tracking_params),
     )
-    service = PaymentService(get_settings(), db)
-    forwarded = service.relay_mobi_slon_event(
+    result = relay_to_intake(
+        container.settings,
         status=status,
         clickid=clickid,
         tracking_params=tracking_params,
         session_id=session_id,
         page_path=page_path,
     )
-    return MobiSlonEventResponse(accepted=True, forwarded=forwarded)
+    return MobiSlonEventResponse(accepted=True, forwarded=result != "skipped", duplicate=result == "duplicate")
 
 
 @router.get("/api/payment/redirect")
@@ -149,45 +168,37 @@ def legacy_payment_redirect() -> None:
 
 
 @router.get("/api/tracking/meta-event")
-def send_meta_event(
+async def send_meta_event(
     request: Request,
     status: str | None = Query(default=None),
     fbclid: str = Query(default=""),
     ip: str = Query(default=""),
     ua: str = Query(default=""),
+    event_id: str = Query(default="", max_length=128),
+    container: AppContainer = Depends(get_app_container),
 ) -> JSONResponse:
     if not status:
         return JSONResponse(status_code=400, content={"error": "status is required"})
 
-    settings = get_settings()
+    settings = container.settings
     if not settings.meta_pixel_id or not settings.meta_access_token:
         raise HTTPException(status_code=503, detail="Meta CAPI is not configured")
 
-    client_ip = ip or (request.client.host if request.client else "")
-    client_user_agent = ua or request.headers.get("user-agent", "")
-    payload = {
-        "data": [
-            {
-                "event_name": status,
-                "event_time": int(time.time()),
-                "action_source": "website",
-                "user_data": {
-                    "fbc": fbclid,
-                    "client_ip_address": client_ip,
-                    "client_user_agent": client_user_agent,
-                },
-            }
-        ]
-    }
-    url = f"https://graph.facebook.com/{settings.meta_graph_api_version}/{settings.meta_pixel_id}/events"
+    event = build_meta_event(
+        status=status,
+        fbclid=fbclid,
+        client_ip=ip or (request.client.host if request.client else ""),
+        client_user_agent=ua or request.headers.get("user-agent", ""),
+        event_id=event_id.strip(),
+    )
+    if settings.normalized_meta_capi_mode == "batched":
+        result = META_EVENT_RELAY.enqueue(event)
+        if result == "full":
+            raise HTTPException(status_code=503, detail="Meta event queue is full")
+        return JSONResponse(status_code=202, content={"accepted": True, "duplicate": result == "duplicate"})
 
     try:
-        response = httpx.post(
-            url,
-            params={"access_token": settings.meta_access_token},
-            json=payload,
-            timeout=15.0,
-        )
+        response = await asyncio.to_thread(send_meta_events, container, [event])
     except httpx.HTTPError as exc:
         raise HTTPException(status_code=502, detail=f"Meta API request failed: {exc.__class__.__name__}") from exc
 
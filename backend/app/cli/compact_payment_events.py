@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import argparse
+import logging
+
+from app.core.db.session import engine
+from app.core.event_storage import compact_payment_events
+
+logger = logging.getLogger("quiz.event_storage")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rewrite payment_events payloads to the projected shape")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="Report bytes that would be saved without writing")
+    args = parser.parse_args()
+
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        report = compact_payment_events(connection, batch_size=args.batch_size)
+        if args.dry_run:
+            transaction.rollback()
+        else:
+            transaction.commit()
+
+    logger.info(
+        "payment_events_compacted dry_run=%s rows_scanned=%d rows_rewritten=%d bytes_before=%d bytes_after=%d bytes_saved=%d",
+        args.dry_run,
+        report.rows_scanned,
+        report.rows_rewritten,
+        report.bytes_before,
+        report.bytes_after,
+        report.bytes_saved,
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    main()
@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+import argparse
+import logging
+
+from app.core.db.session import SessionLocal
+from app.services.entitlements import REBUILD_BATCH_SIZE, rebuild_entitlements
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recompute the entitlements table from orders and access bindings")
+    parser.add_argument("--batch-size", type=int, default=REBUILD_BATCH_SIZE)
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        rebuild_entitlements(db, batch_size=args.batch_size)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    main()
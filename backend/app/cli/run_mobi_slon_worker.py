@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+
+from app.core.config import get_settings
+from app.core.db.session import SessionLocal
+from app.services.mobi_slon_postbacks import MobiSlonPostbackWorker, requeue_dead_postbacks
+
+logger = logging.getLogger("quiz.mobi_slon")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Deliver queued Mobi-Slon postbacks")
+    parser.add_argument("--replay-dead", action="store_true", help="Move dead postbacks back to pending and exit")
+    parser.add_argument("--clickid", default=None, help="Limit --replay-dead to a single clickid")
+    args = parser.parse_args()
+
+    if args.replay_dead:
+        with SessionLocal() as db:
+            requeued = requeue_dead_postbacks(db, clickid=args.clickid)
+        logger.info("mobi_slon_dead_requeued count=%d clickid=%s", requeued, args.clickid)
+        return
+
+    asyncio.run(MobiSlonPostbackWorker(get_settings(), SessionLocal).run())
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    main()
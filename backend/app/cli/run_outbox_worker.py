@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+
+from app.core.config import get_settings
+from app.core.db.session import SessionLocal
+from app.services.outbox import OutboxDispatcher, requeue_dead_messages
+
+logger = logging.getLogger("quiz.outbox")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Deliver fulfillment outbox messages")
+    parser.add_argument("--replay-dead", action="store_true", help="Move dead-lettered messages back to pending and exit")
+    parser.add_argument("--order-id", default=None, help="Limit --replay-dead to a single order")
+    args = parser.parse_args()
+
+    if args.replay_dead:
+        with SessionLocal() as db:
+            requeued = requeue_dead_messages(db, order_id=args.order_id)
+        logger.info("outbox_dead_requeued count=%d order_id=%s", requeued, args.order_id)
+        return
+
+    asyncio.run(OutboxDispatcher(get_settings(), SessionLocal).run())
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    main()
@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import argparse
+import logging
+from pathlib import Path
+
+from app.core.config import get_settings
+from app.core.db.session import engine
+from app.services.retention import run_retention
+
+
+def main() -> None:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Archive and drop payment events, OTPs and revoked tokens past retention")
+    parser.add_argument("--days", type=int, default=settings.retention_days)
+    parser.add_argument("--archive-dir", type=Path, default=Path(settings.retention_archive_dir))
+    parser.add_argument("--months-ahead", type=int, default=settings.retention_partitions_ahead_months)
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be archived without writing")
+    args = parser.parse_args()
+
+    run_retention(
+        engine,
+        days=args.days,
+        archive_dir=args.archive_dir,
+        months_ahead=args.months_ahead,
+        dry_run=args.dry_run,
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    main()
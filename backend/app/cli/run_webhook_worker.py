@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+
+from app.core.config import get_settings
+from app.core.db.session import SessionLocal
+from app.services.webhook_inbox import WebhookInboxWorker, requeue_failed_events
+
+logger = logging.getLogger("quiz.webhook_inbox")
+
+
+def run_webhook_worker() -> None:
+    parser = argparse.ArgumentParser(description="Apply Stripe events stored by the inbox webhook mode")
+    parser.add_argument("--replay-failed", action="store_true", help="Move failed events back to pending and exit")
+    parser.add_argument("--event-id", default=None, help="Limit --replay-failed to a single Stripe event id")
+    args = parser.parse_args()
+
+    if args.replay_failed:
+        with SessionLocal() as db:
+            requeued = requeue_failed_events(db, stripe_event_id=args.event_id)
+        logger.info("stripe_inbox_failed_requeued count=%d event_id=%s", requeued, args.event_id)
+        return
+
+    settings = get_settings()
+    if settings.normalized_stripe_webhook_mode != "inbox":
+        logger.warning("stripe_inbox_worker_mode_mismatch mode=%s", settings.normalized_stripe_webhook_mode)
+    asyncio.run(WebhookInboxWorker(settings, SessionLocal).run())
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    run_webhook_worker()
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import argparse
+import logging
+from pathlib import Path
+
+from app.core.config import get_settings
+from app.core.db.session import SessionLocal
+from app.services.entitlement_snapshot import write_entitlement_snapshot
+
+logger = logging.getLogger("quiz.entitlement_snapshot")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write the memory-mappable snapshot of entitled Telegram users")
+    parser.add_argument("--path", default=get_settings().entitlement_snapshot_path)
+    args = parser.parse_args()
+    if not args.path:
+        parser.error("--path or ENTITLEMENT_SNAPSHOT_PATH is required")
+
+    with SessionLocal() as db:
+        info = write_entitlement_snapshot(db, Path(args.path))
+    logger.info("entitlement_snapshot_written path=%s version=%d count=%d bytes=%d", info.path, info.version, info.count, info.size_bytes)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    main()
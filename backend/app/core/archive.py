@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import base64
+import bisect
+from datetime import date, datetime
+import gzip
+import json
+import os
+from pathlib import Path
+from typing import Any, Mapping
+
+INDEX_SUFFIX = ".idx.json"
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {"$b64": base64.b64encode(bytes(value)).decode("ascii")}
+    return str(value)
+
+
+def index_path_for(archive_path: Path) -> Path:
+    return archive_path.with_name(archive_path.name + INDEX_SUFFIX)
+
+
+class ArchiveWriter:
+    """Writes key-ordered records as NDJSON split into independent gzip members.
+
+    Each member is listed in a small sidecar index (first key, last key, byte offset, length), so a
+    point lookup decompresses a single member instead of the whole file.
+    """
+
+    def __init__(self, path: Path, *, key_field: str, records_per_member: int = 1000) -> None:
+        self.path = path
+        self.key_field = key_field
+        self.records_per_member = max(1, records_per_member)
+        self._buffer: list[bytes] = []
+        self._buffer_first_key: str | None = None
+        self._buffer_last_key: str | None = None
+        self._members: list[dict[str, Any]] = []
+        self._offset = 0
+        self._count = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self._file = open(self._tmp_path, "wb")  # noqa: SIM115
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def write(self, record: Mapping[str, Any]) -> None:
+        key = str(record[self.key_field])
+        if self._buffer_last_key is not None and key < self._buffer_last_key:
+            raise ValueError(f"Archive records must be written in {self.key_field} order")
+        if self._buffer_first_key is None:
+            self._buffer_first_key = key
+        self._buffer_last_key = key
+        self._buffer.append(json.dumps(record, default=_json_default, separators=(",", ":")).encode("utf-8") + b"\n")
+        self._count += 1
+        if len(self._buffer) >= self.records_per_member:
+            self._flush_member()
+
+    def _flush_member(self) -> None:
+        if not self._buffer:
+            return
+        member = gzip.compress(b"".join(self._buffer), compresslevel=6)
+        self._file.write(member)
+        self._members.append(
+            {
+                "first_key": self._buffer_first_key,
+                "last_key": self._buffer_last_key,
+                "offset": self._offset,
+                "length": len(member),
+                "count": len(self._buffer),
+            }
+        )
+        self._offset += len(member)
+        self._buffer = []
+        self._buffer_first_key = None
+
+    def close(self) -> None:
+        self._flush_member()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        index = {"key_field": self.key_field, "count": self._count, "members": self._members}
+        index_tmp = index_path_for(self._tmp_path)
+        index_tmp.write_text(json.dumps(index, separators=(",", ":")), encoding="utf-8")
+        # Publish data before index so a visible index never points at a missing archive.
+        os.replace(self._tmp_path, self.path)
+        os.replace(index_tmp, index_path_for(self.path))
+
+    def abort(self) -> None:
+        self._file.close()
+        self._tmp_path.unlink(missing_ok=True)
+
+
+def lookup_archive(archive_path: Path, key: str) -> dict[str, Any] | None:
+    index = json.loads(index_path_for(archive_path).read_text(encoding="utf-8"))
+    members: list[dict[str, Any]] = index["members"]
+    key_field: str = index["key_field"]
+    position = bisect.bisect_right([member["first_key"] for member in members], key) - 1
+    if position < 0 or key > members[position]["last_key"]:
+        return None
+
+    member = members[position]
+    with open(archive_path, "rb") as archive:
+        archive.seek(member["offset"])
+        chunk = gzip.decompress(archive.read(member["length"]))
+    for line in chunk.splitlines():
+        record: dict[str, Any] = json.loads(line)
+        if str(record.get(key_field)) == key:
+            return record
+    return None
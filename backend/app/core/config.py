@@ -6,6 +6,9 @@ from functools import lru_cache
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+# Largest IN list sent in one statement by bulk entitlement lookups, and the batch endpoint limit.
+BULK_LOOKUP_CHUNK_SIZE = 5000
+
 
 @dataclass(frozen=True)
 class PlanConfig:
@@ -24,6 +27,26 @@ class Settings(BaseSettings):
     pay_cancel_url: str | None = None
     pay_portal_return_url: str | None = None
     database_url: str | None = None
+    # Optional streaming replica for read-only endpoints; empty routes everything to the primary.
+    database_replica_url: str = ""
+    # Users whose entitlement changed this recently are read from the primary (read-your-writes).
+    database_replica_lag_seconds: float = 5.0
+    # Applied to each engine (primary, async primary and their replica counterparts) separately.
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout_seconds: float = 30.0
+    db_pool_recycle_seconds: int = 1800
+    db_pool_pre_ping: bool = True
+    # Per-request SQL statement count and DB time in a Server-Timing response header.
+    server_timing_enabled: bool = True
+    # Statements slower than this are logged as slow_query (0 disables); the plan is captured in the background.
+    slow_query_threshold_ms: float = 500.0
+    slow_query_explain: bool = True
+    # Pool of each outbound client (Telegram, Meta, Mobi-Slon, Stripe); HTTP/2 needs the optional `h2` package.
+    outbound_http_max_connections: int = 20
+    outbound_http_max_keepalive: int = 10
+    outbound_http_keepalive_seconds: float = 30.0
+    outbound_http2: bool = False
     postgres_db: str = "dating_quiz"
     postgres_user: str = "dating_quiz"
     postgres_password: str = "dating_quiz"
@@ -48,7 +71,59 @@ class Settings(BaseSettings):
     meta_pixel_id: str = ""
     meta_access_token: str = ""
     meta_graph_api_version: str = "v18.0"
+    # batched: the tracking endpoint answers 202 and events go to CAPI in batches; sync: one Graph call per request.
+    meta_capi_mode: str = "batched"
+    meta_capi_batch_size: int = 200
+    meta_capi_flush_interval_seconds: float = 2.0
+    meta_capi_queue_size: int = 10_000
+    meta_capi_max_attempts: int = 3
     mobi_slon_postback_url: str = Field(default="", validation_alias="VITE_MOBI_SLON_URL")
+    # Postback queue (mobi_slon_postbacks): worker pool, backoff and a circuit breaker for tracker outages.
+    mobi_slon_worker_enabled: bool = True
+    mobi_slon_concurrency: int = 4
+    mobi_slon_batch_size: int = 100
+    mobi_slon_poll_interval_seconds: float = 1.0
+    mobi_slon_max_attempts: int = 10
+    mobi_slon_backoff_base_seconds: float = 5.0
+    mobi_slon_backoff_max_seconds: float = 1800.0
+    # A claimed postback is not picked up again for this long while its request is in flight.
+    mobi_slon_claim_lease_seconds: float = 120.0
+    mobi_slon_breaker_failure_threshold: int = 5
+    mobi_slon_breaker_cooldown_seconds: float = 30.0
+    # Relay intake: browser events are buffered in memory and written to the queue table in multi-row batches.
+    mobi_slon_intake_batch_size: int = 200
+    mobi_slon_intake_flush_interval_seconds: float = 0.2
+    mobi_slon_intake_queue_size: int = 10_000
+    stripe_webhook_mode: str = "inline"
+    webhook_inbox_worker_enabled: bool = True
+    webhook_inbox_concurrency: int = 4
+    webhook_inbox_batch_size: int = 50
+    webhook_inbox_poll_interval_seconds: float = 1.0
+    webhook_inbox_max_attempts: int = 5
+    webhook_inbox_backoff_base_seconds: float = 5.0
+    webhook_inbox_backoff_max_seconds: float = 900.0
+    webhook_dedup_cache_size: int = 10_000
+    payment_event_storage_policy: str = "projected"
+    payment_event_keep_raw_body: bool = False
+    payment_event_record_ignored: bool = True
+    access_status_cache_size: int = 50_000
+    access_status_cache_ttl_seconds: float = 30.0
+    entitlement_feed_enabled: bool = True
+    entitlement_feed_channel: str = "entitlement_changes"
+    entitlement_feed_heartbeat_seconds: float = 15.0
+    entitlement_feed_queue_size: int = 1000
+    entitlement_snapshot_path: str = ""
+    entitlement_snapshot_interval_seconds: float = 30.0
+    retention_days: int = 180
+    retention_archive_dir: str = "/var/lib/dating-quiz/archive"
+    retention_partitions_ahead_months: int = 2
+    outbox_worker_enabled: bool = True
+    outbox_concurrency: int = 4
+    outbox_batch_size: int = 50
+    outbox_poll_interval_seconds: float = 1.0
+    outbox_max_attempts: int = 8
+    outbox_backoff_base_seconds: float = 5.0
+    outbox_backoff_max_seconds: float = 900.0
 
     pay_one_time_basic_amount_minor: int = 999
     pay_one_time_basic_currency: str = "usd"
@@ -67,6 +142,43 @@ class Settings(BaseSettings):
             f"@{self.postgres_host}:{self.postgres_port}/{self.postgres_db}"
         )
 
+    @property
+    def resolved_async_database_url(self) -> str:
+        return _async_database_url(self.resolved_database_url)
+
+    @property
+    def has_database_replica(self) -> bool:
+        return bool(self.database_replica_url.strip())
+
+    @property
+    def resolved_replica_database_url(self) -> str:
+        return self.database_replica_url.strip() or self.resolved_database_url
+
+    @property
+    def resolved_async_replica_database_url(self) -> str:
+        return _async_database_url(self.resolved_replica_database_url)
+
+    @property
+    def normalized_stripe_webhook_mode(self) -> str:
+        mode = self.stripe_webhook_mode.strip().lower()
+        if mode not in {"inline", "inbox"}:
+            return "inline"
+        return mode
+
+    @property
+    def normalized_meta_capi_mode(self) -> str:
+        mode = self.meta_capi_mode.strip().lower()
+        if mode not in {"batched", "sync"}:
+            return "batched"
+        return mode
+
+    @property
+    def normalized_payment_event_storage_policy(self) -> str:
+        policy = self.payment_event_storage_policy.strip().lower()
+        if policy not in {"full", "projected"}:
+            return "projected"
+        return policy
+
     @property
     def resolved_pay_success_url(self) -> str:
         return self.pay_success_url or f"{self.app_base_url}/pay/success"
@@ -95,6 +207,14 @@ class Settings(BaseSettings):
         )
 
 
+def _async_database_url(url: str) -> str:
+    # postgresql+psycopg picks psycopg's async connection under create_async_engine.
+    for sync_prefix in ("sqlite+pysqlite://", "sqlite://"):
+        if url.startswith(sync_prefix):
+            return "sqlite+aiosqlite://" + url[len(sync_prefix):]
+    return url
+
+
 @lru_cache(maxsize=1)
 def get_settings() -> Settings:
     return Settings()
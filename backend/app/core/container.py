@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from collections.abc import Mapping
+from dataclasses import dataclass
+import threading
+from types import MappingProxyType
+
+import stripe
+
+from app.core.config import PlanConfig, Settings, get_plan_map, get_settings
+from app.core.http_clients import OutboundClients, StripeHTTPClient
+from app.core.notifications import LogOnlyEmailSender, SmtpEmailSender, TelegramSender, build_email_sender
+
+
+@dataclass(frozen=True)
+class AppContainer:
+    """Process-wide config, plan catalog and integration clients shared by every request.
+
+    Built once in the app lifespan (and lazily by workers and scripts); per-request services only
+    bind a database session to it.
+    """
+
+    settings: Settings
+    plan_map: Mapping[str, PlanConfig]
+    email_sender: LogOnlyEmailSender | SmtpEmailSender
+    telegram_sender: TelegramSender
+    http: OutboundClients
+
+    @classmethod
+    def build(cls, settings: Settings) -> AppContainer:
+        http = OutboundClients(settings)
+        return cls(
+            settings=settings,
+            plan_map=MappingProxyType(get_plan_map(settings)),
+            email_sender=build_email_sender(settings),
+            telegram_sender=TelegramSender(settings, http),
+            http=http,
+        )
+
+
+_CONTAINER: AppContainer | None = None
+# Keyed by id(); each container holds its settings object, so an id cannot be reused while cached.
+_AD_HOC_CONTAINERS: dict[int, AppContainer] = {}
+_AD_HOC_LOCK = threading.Lock()
+
+
+def get_container() -> AppContainer:
+    global _CONTAINER
+    if _CONTAINER is None:
+        _CONTAINER = AppContainer.build(get_settings())
+        # Only the process container owns the SDK globals; ad-hoc containers leave them alone.
+        stripe.api_key = _CONTAINER.settings.stripe_secret_key
+        stripe.default_http_client = StripeHTTPClient(_CONTAINER.http)
+    return _CONTAINER
+
+
+def container_for(settings: Settings) -> AppContainer:
+    """The process container, or one private container per ad-hoc settings object."""
+    container = get_container()
+    if settings is container.settings:
+        return container
+    with _AD_HOC_LOCK:
+        ad_hoc = _AD_HOC_CONTAINERS.get(id(settings))
+        if ad_hoc is None:
+            ad_hoc = _AD_HOC_CONTAINERS[id(settings)] = AppContainer.build(settings)
+        return ad_hoc
+
+
+def close_ad_hoc_containers() -> None:
+    with _AD_HOC_LOCK:
+        containers = list(_AD_HOC_CONTAINERS.values())
+        _AD_HOC_CONTAINERS.clear()
+    for container in containers:
+        container.http.close()
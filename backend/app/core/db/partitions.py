@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import logging
+import re
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+logger = logging.getLogger("quiz.partitions")
+
+
+@dataclass(frozen=True)
+class MonthlyPartition:
+    name: str
+    lower: datetime
+    upper: datetime
+
+
+def month_start(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    value = value.astimezone(timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    month_index = value.year * 12 + (value.month - 1) + months
+    return value.replace(year=month_index // 12, month=month_index % 12 + 1, day=1)
+
+
+def partition_name(table: str, lower: datetime) -> str:
+    return f"{table}_{lower.year:04d}_{lower.month:02d}"
+
+
+def list_monthly_partitions(connection: Connection, *, schema: str, table: str) -> list[MonthlyPartition]:
+    # Partitions follow the <table>_YYYY_MM naming convention, so bounds are derived from the name.
+    rows = connection.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "JOIN pg_namespace ns ON ns.oid = parent.relnamespace "
+            "WHERE ns.nspname = :schema AND parent.relname = :table"
+        ),
+        {"schema": schema, "table": table},
+    ).scalars()
+    pattern = re.compile(rf"^{re.escape(table)}_(\d{{4}})_(\d{{2}})$")
+    partitions: list[MonthlyPartition] = []
+    for name in rows:
+        match = pattern.match(name)
+        if match is None:
+            continue
+        lower = datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+        partitions.append(MonthlyPartition(name=name, lower=lower, upper=add_months(lower, 1)))
+    return sorted(partitions, key=lambda partition: partition.lower)
+
+
+def ensure_monthly_partitions(
+    connection: Connection,
+    *,
+    schema: str,
+    table: str,
+    first_month: datetime,
+    last_month: datetime,
+    default_partition: str | None = None,
+    partition_column: str = "received_at",
+) -> list[str]:
+    """Create the missing `<table>_YYYY_MM` partitions from `first_month` through `last_month`.
+
+    PostgreSQL refuses a new partition while `default_partition` holds rows in its range; such
+    rows are moved into the new partition in the caller's transaction.
+    """
+    existing = {partition.name for partition in list_monthly_partitions(connection, schema=schema, table=table)}
+    created: list[str] = []
+    lower = month_start(first_month)
+    last = month_start(last_month)
+    while lower <= last:
+        name = partition_name(table, lower)
+        if name not in existing:
+            upper = add_months(lower, 1)
+            bounds = f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+            in_range = f""""{partition_column}" >= '{lower.isoformat()}' AND "{partition_column}" < '{upper.isoformat()}'"""
+            if default_partition is not None and connection.scalar(
+                text(f'SELECT EXISTS (SELECT 1 FROM "{schema}"."{default_partition}" WHERE {in_range})')
+            ):
+                connection.execute(
+                    text(f'CREATE TABLE "{schema}"."{name}" (LIKE "{schema}"."{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+                )
+                moved = connection.execute(
+                    text(
+                        f'WITH moved AS (DELETE FROM "{schema}"."{default_partition}" WHERE {in_range} RETURNING *) '
+                        f'INSERT INTO "{schema}"."{name}" SELECT * FROM moved'
+                    )
+                )
+                connection.execute(text(f'ALTER TABLE "{schema}"."{table}" ATTACH PARTITION "{schema}"."{name}" {bounds}'))
+                logger.warning(
+                    "partition_rows_moved_from_default partition=%s default=%s rows=%d",
+                    name,
+                    default_partition,
+                    int(getattr(moved, "rowcount", 0) or 0),
+                )
+            else:
+                connection.execute(text(f'CREATE TABLE IF NOT EXISTS "{schema}"."{name}" PARTITION OF "{schema}"."{table}" {bounds}'))
+            created.append(name)
+        lower = add_months(lower, 1)
+    return created
+
+
+def drop_partition(connection: Connection, *, schema: str, table: str, name: str) -> None:
+    connection.execute(text(f'ALTER TABLE "{schema}"."{table}" DETACH PARTITION "{schema}"."{name}"'))
+    connection.execute(text(f'DROP TABLE "{schema}"."{name}"'))
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+from collections import deque
+import threading
+import time
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+# Checkout waits kept per pool for the percentiles reported by `stats()`.
+WAIT_SAMPLE_SIZE = 2048
+
+
+class PoolMetrics:
+    """Counters for one connection pool, fed by pool events and the timed checkout below."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._engine: Engine | None = None
+        self._lock = threading.Lock()
+        self._waits_ms: deque[float] = deque(maxlen=WAIT_SAMPLE_SIZE)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.soft_invalidations = 0
+        self.max_wait_ms = 0.0
+        self.max_in_use = 0
+
+    def observe_wait(self, wait_ms: float, *, timed_out: bool) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self._waits_ms.append(wait_ms)
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    @property
+    def pool(self) -> Pool | None:
+        # engine.dispose() swaps in a new pool of the same class, so always read it from the engine.
+        return self._engine.pool if self._engine is not None else None
+
+    def attach(self, engine: Engine) -> None:
+        self._engine = engine
+
+        @event.listens_for(engine, "connect")
+        def _on_connect(*_: Any) -> None:
+            self.connects += 1
+
+        @event.listens_for(engine, "checkout")
+        def _on_checkout(*_: Any) -> None:
+            pool = self.pool
+            if isinstance(pool, QueuePool):
+                self.max_in_use = max(self.max_in_use, pool.checkedout())
+
+        @event.listens_for(engine, "invalidate")
+        def _on_invalidate(*_: Any) -> None:
+            self.invalidations += 1
+
+        @event.listens_for(engine, "soft_invalidate")
+        def _on_soft_invalidate(*_: Any) -> None:
+            self.soft_invalidations += 1
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits_ms)
+        pool = self.pool
+        stats: dict[str, Any] = {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "connects": self.connects,
+            "invalidations": self.invalidations,
+            "soft_invalidations": self.soft_invalidations,
+            "wait_ms_p50": round(waits[len(waits) // 2], 3) if waits else 0.0,
+            "wait_ms_p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else 0.0,
+            "wait_ms_max": round(self.max_wait_ms, 3),
+            "max_in_use": self.max_in_use,
+        }
+        if isinstance(pool, QueuePool):
+            stats.update(
+                size=pool.size(),
+                in_use=pool.checkedout(),
+                idle=pool.checkedin(),
+                overflow=max(0, pool.overflow()),
+                max_overflow=pool._max_overflow,
+            )
+        return stats
+
+
+class _TimedQueuePool(QueuePool):
+    metrics: PoolMetrics
+
+    def _do_get(self) -> Any:
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.observe_wait((time.perf_counter() - started) * 1000, timed_out=True)
+            raise
+        self.metrics.observe_wait((time.perf_counter() - started) * 1000, timed_out=False)
+        return connection
+
+
+class _TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool, _TimedQueuePool):
+    pass
+
+
+POOL_METRICS: dict[str, PoolMetrics] = {}
+
+
+def instrumented_pool_class(name: str, *, is_async: bool) -> tuple[type[QueuePool], PoolMetrics]:
+    """Pool class bound to the metrics registered under `name`; survives pool.recreate()."""
+    metrics = POOL_METRICS.setdefault(name, PoolMetrics(name))
+    base: type[QueuePool] = _TimedAsyncAdaptedQueuePool if is_async else _TimedQueuePool
+    return type(f"{base.__name__}_{name}", (base,), {"metrics": metrics}), metrics
+
+
+def pool_stats() -> dict[str, dict[str, Any]]:
+    return {name: metrics.stats() for name, metrics in POOL_METRICS.items()}
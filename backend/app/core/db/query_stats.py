@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+import time
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine
+
+_STARTED_KEY = "query_stats_started"
+
+
+@dataclass
+class QueryStats:
+    statements: int = 0
+    db_ms: float = 0.0
+    # Statement texts, kept only by query_budget() for its failure message.
+    sql: list[str] | None = None
+
+
+# Set per HTTP request by QueryStatsMiddleware. Starlette copies the context into the threadpool
+# for sync endpoints, and async engines run their cursor events in the caller's context.
+_CURRENT: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+def current_query_stats() -> QueryStats | None:
+    return _CURRENT.get()
+
+
+@contextmanager
+def track_queries(*, keep_sql: bool = False) -> Iterator[QueryStats]:
+    stats = QueryStats(sql=[] if keep_sql else None)
+    token = _CURRENT.set(stats)
+    try:
+        yield stats
+    finally:
+        _CURRENT.reset(token)
+
+
+@contextmanager
+def query_budget(max_statements: int) -> Iterator[QueryStats]:
+    """Fail with AssertionError when the block issues more than `max_statements` SQL statements."""
+    with track_queries(keep_sql=True) as stats:
+        yield stats
+    if stats.statements > max_statements:
+        listing = "\n".join(f"  {index}. {statement}" for index, statement in enumerate(stats.sql or [], start=1))
+        raise AssertionError(f"{stats.statements} SQL statements, budget is {max_statements}:\n{listing}")
+
+
+def attach(engine: Engine) -> None:
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn: Connection, *_: Any) -> None:
+        conn.info[_STARTED_KEY] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn: Connection, cursor: Any, statement: str, *_: Any) -> None:
+        stats = _CURRENT.get()
+        started = conn.info.pop(_STARTED_KEY, None)
+        if stats is None or started is None:
+            return
+        stats.statements += 1
+        stats.db_ms += (time.perf_counter() - started) * 1000
+        if stats.sql is not None:
+            stats.sql.append(statement)
@@ -1,17 +1,80 @@
 from __future__ import annotations
 
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Generator
+from typing import Any
 
-from sqlalchemy import create_engine
+from sqlalchemy import Engine, create_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import Session, sessionmaker
 
 from app.core.config import get_settings
+from app.core.db import query_stats
+from app.core.db.pool_metrics import POOL_METRICS, instrumented_pool_class
+from app.core.db.slow_queries import SLOW_QUERY_LOG
 from app.core.models.payment import Base
 
 settings = get_settings()
-connect_args = {"check_same_thread": False} if settings.resolved_database_url.startswith("sqlite") else {}
-engine = create_engine(settings.resolved_database_url, future=True, pool_pre_ping=True, connect_args=connect_args)
+
+
+def _connect_args(url: str) -> dict[str, bool]:
+    return {"check_same_thread": False} if url.startswith("sqlite") else {}
+
+
+def _pool_options(name: str, *, is_async: bool) -> dict[str, Any]:
+    poolclass, _ = instrumented_pool_class(name, is_async=is_async)
+    return {
+        "poolclass": poolclass,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout_seconds,
+        "pool_recycle": settings.db_pool_recycle_seconds,
+        # Pre-ping costs a round trip per checkout; without it, recycle plus disconnect
+        # invalidation on first use replace stale connections instead.
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+
+def _create_engine(name: str, url: str) -> Engine:
+    created = create_engine(url, future=True, connect_args=_connect_args(url), **_pool_options(name, is_async=False))
+    POOL_METRICS[name].attach(created)
+    query_stats.attach(created)
+    SLOW_QUERY_LOG.attach(created)
+    return created
+
+
+def _create_async_engine(name: str, url: str, *, sync_twin: Engine) -> AsyncEngine:
+    created = create_async_engine(url, **_pool_options(name, is_async=True))
+    POOL_METRICS[name].attach(created.sync_engine)
+    query_stats.attach(created.sync_engine)
+    SLOW_QUERY_LOG.attach(created.sync_engine, explain_engine=sync_twin)
+    return created
+
+
+engine = _create_engine("primary", settings.resolved_database_url)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False, class_=Session)
+# Async endpoints use their own pool, so their concurrency is bounded by connections rather than
+# by Starlette's threadpool.
+async_engine = _create_async_engine("primary_async", settings.resolved_async_database_url, sync_twin=engine)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False, class_=AsyncSession)
+
+# Read-only endpoints (session status polling, bot access status, customer portal lookup) go to
+# the replica when DATABASE_REPLICA_URL is set; without it these are the primary's factories.
+if settings.has_database_replica:
+    replica_engine = _create_engine("replica", settings.resolved_replica_database_url)
+    ReplicaSessionLocal = sessionmaker(
+        bind=replica_engine, autoflush=False, autocommit=False, expire_on_commit=False, class_=Session
+    )
+    async_replica_engine = _create_async_engine(
+        "replica_async", settings.resolved_async_replica_database_url, sync_twin=replica_engine
+    )
+    AsyncReplicaSessionLocal = async_sessionmaker(
+        bind=async_replica_engine, autoflush=False, expire_on_commit=False, class_=AsyncSession
+    )
+else:
+    replica_engine = engine
+    ReplicaSessionLocal = SessionLocal
+    async_replica_engine = async_engine
+    AsyncReplicaSessionLocal = AsyncSessionLocal
 
 
 def init_db() -> None:
@@ -24,3 +87,21 @@ def get_db() -> Generator[Session]:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_replica_db() -> Generator[Session]:
+    db = ReplicaSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_replica_db() -> AsyncGenerator[AsyncSession]:
+    async with AsyncReplicaSessionLocal() as db:
+        yield db
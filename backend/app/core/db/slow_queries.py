@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+from collections.abc import Mapping, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import hashlib
+import logging
+import sys
+import threading
+import time
+from types import FrameType
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine
+
+from app.core.cache import TTLCache
+from app.core.config import get_settings
+
+logger = logging.getLogger("quiz.db.slow")
+
+_STARTED_KEY = "slow_query_started"
+# Set on the connections used for EXPLAIN so their own statements are never reported.
+_SKIP_KEY = "slow_query_skip"
+EXPLAIN_PREFIXES = {"postgresql": "EXPLAIN ", "sqlite": "EXPLAIN QUERY PLAN "}
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+# The same statement is explained at most once per window; plans do not change per call.
+EXPLAIN_DEDUP_SECONDS = 300.0
+MAX_PENDING_EXPLAINS = 4
+EXPLAIN_TIMEOUT_MS = 5000
+
+
+def _redact(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, (str, bytes)):
+        return f"<{type(value).__name__}:{len(value)}>"
+    return f"<{type(value).__name__}>"
+
+
+def redact_parameters(parameters: Any, *, executemany: bool = False) -> str:
+    """Parameter shapes (type and length) without values: emails, OTP hashes and tokens never reach logs."""
+    if executemany:
+        return f"<{len(parameters)} rows>"
+    if isinstance(parameters, Mapping):
+        return "{" + ", ".join(f"{key}={_redact(value)}" for key, value in parameters.items()) + "}"
+    if isinstance(parameters, Sequence) and not isinstance(parameters, (str, bytes)):
+        return "[" + ", ".join(_redact(value) for value in parameters) + "]"
+    return _redact(parameters)
+
+
+def _frame_name(frame: FrameType) -> str:
+    owner = frame.f_locals.get("self")
+    if owner is not None:
+        return f"{type(owner).__name__}.{frame.f_code.co_name}"
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}"
+
+
+def _caller_frames() -> list[FrameType]:
+    frames: list[FrameType] = []
+    frame: FrameType | None = sys._getframe(2)
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    # Async sessions run the statement in a child greenlet; the awaiting service code lives in its parent.
+    greenlet_module = sys.modules.get("greenlet")
+    if greenlet_module is not None:
+        parent = greenlet_module.getcurrent().parent
+        frame = parent.gr_frame if parent is not None else None
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+    return frames
+
+
+def calling_service_method() -> tuple[str, str]:
+    """(outermost app.services method, innermost app frame as module:function:line) of the running statement."""
+    service = "-"
+    site = "-"
+    for frame in _caller_frames():
+        module = frame.f_globals.get("__name__", "")
+        if not module.startswith("app.") or module.startswith("app.core.db"):
+            continue
+        if site == "-":
+            site = f"{module}:{frame.f_code.co_name}:{frame.f_lineno}"
+        if module.startswith("app.services."):
+            service = _frame_name(frame)
+    return service, site
+
+
+class SlowQueryLog:
+    """Logs statements slower than the threshold; the plan is captured off the request path."""
+
+    def __init__(self, threshold_ms: float, *, explain: bool) -> None:
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self._explained: TTLCache[bool] = TTLCache(1024, EXPLAIN_DEDUP_SECONDS)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+        self._pending: set[Future[None]] = set()
+        self._lock = threading.Lock()
+
+    def attach(self, engine: Engine, *, explain_engine: Engine | None = None) -> None:
+        # Async engines pass their sync twin: EXPLAIN runs in a worker thread, outside any event loop.
+        target = explain_engine or engine
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before_cursor_execute(conn: Connection, *_: Any) -> None:
+            conn.info[_STARTED_KEY] = time.perf_counter()
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after_cursor_execute(
+            conn: Connection, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool
+        ) -> None:
+            started = conn.info.pop(_STARTED_KEY, None)
+            if started is None or self.threshold_ms <= 0 or conn.info.get(_SKIP_KEY):
+                return
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if elapsed_ms >= self.threshold_ms:
+                self._report(target, statement, parameters, executemany, elapsed_ms)
+
+    def _report(self, target: Engine, statement: str, parameters: Any, executemany: bool, elapsed_ms: float) -> None:
+        fingerprint = hashlib.sha1(statement.encode("utf-8")).hexdigest()[:12]
+        service, site = calling_service_method()
+        logger.warning(
+            "slow_query fingerprint=%s elapsed_ms=%.1f caller=%s site=%s params=%s sql=%s",
+            fingerprint,
+            elapsed_ms,
+            service,
+            site,
+            redact_parameters(parameters, executemany=executemany),
+            " ".join(statement.split()),
+        )
+        prefix = EXPLAIN_PREFIXES.get(target.dialect.name)
+        if not self.explain or prefix is None or executemany:
+            return
+        if not statement.lstrip().upper().startswith(EXPLAINABLE) or self._explained.get(fingerprint):
+            return
+        with self._lock:
+            self._pending = {future for future in self._pending if not future.done()}
+            if len(self._pending) >= MAX_PENDING_EXPLAINS:
+                return
+            self._explained.set(fingerprint, True)
+            self._pending.add(self._executor.submit(self._explain, target, prefix + statement, parameters, fingerprint))
+
+    @staticmethod
+    def _explain(target: Engine, statement: str, parameters: Any, fingerprint: str) -> None:
+        # Plain EXPLAIN only plans the statement, so DML is not executed.
+        try:
+            with target.connect() as connection:
+                connection.info[_SKIP_KEY] = True
+                try:
+                    if connection.dialect.name == "postgresql":
+                        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {EXPLAIN_TIMEOUT_MS}")
+                    rows = connection.exec_driver_sql(statement, parameters).fetchall()
+                finally:
+                    connection.info.pop(_SKIP_KEY, None)
+                    connection.rollback()
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("slow_query_explain_failed fingerprint=%s error=%s", fingerprint, exc)
+            return
+        if rows:
+            logger.warning("slow_query_plan fingerprint=%s plan=%s", fingerprint, " | ".join(str(row[-1]) for row in rows))
+
+    def wait_idle(self, timeout: float = 5.0) -> None:
+        with self._lock:
+            pending = set(self._pending)
+        wait(pending, timeout=timeout)
+
+
+SLOW_QUERY_LOG = SlowQueryLog(get_settings().slow_query_threshold_ms, explain=get_settings().slow_query_explain)
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+import json
+from typing import Any, Mapping, cast
+import zlib
+
+from sqlalchemy import Table, select, update
+from sqlalchemy.engine import Connection
+
+from app.core.models.payment import PaymentEvent
+
+HANDLED_EVENT_TYPES: frozenset[str] = frozenset(
+    {
+        "checkout.session.completed",
+        "checkout.session.expired",
+        "payment_intent.payment_failed",
+        "invoice.paid",
+        "invoice.payment_failed",
+        "customer.subscription.updated",
+        "customer.subscription.deleted",
+    }
+)
+# Fields of `data.object` read by PaymentService webhook handlers; everything else is dropped.
+PROJECTED_OBJECT_FIELDS: tuple[str, ...] = (
+    "id",
+    "customer",
+    "subscription",
+    "payment_intent",
+    "status",
+    "current_period_end",
+)
+
+
+def project_event(event: Mapping[str, Any]) -> dict[str, Any]:
+    obj: Mapping[str, Any] = (event.get("data") or {}).get("object") or {}
+    projected_object: dict[str, Any] = {key: obj[key] for key in PROJECTED_OBJECT_FIELDS if obj.get(key) is not None}
+
+    order_id = (obj.get("metadata") or {}).get("order_id")
+    if order_id:
+        projected_object["metadata"] = {"order_id": order_id}
+
+    period_end = (((obj.get("lines") or {}).get("data") or [{}])[0].get("period") or {}).get("end")
+    if period_end is not None:
+        projected_object["lines"] = {"data": [{"period": {"end": period_end}}]}
+
+    projected: dict[str, Any] = {"id": event.get("id"), "type": event.get("type"), "data": {"object": projected_object}}
+    if event.get("created") is not None:
+        projected["created"] = event.get("created")
+    return projected
+
+
+def compress_raw_body(raw_body: bytes) -> bytes:
+    return zlib.compress(raw_body, 6)
+
+
+def decompress_raw_body(compressed: bytes) -> bytes:
+    return zlib.decompress(compressed)
+
+
+def payload_size(payload: Mapping[str, Any]) -> int:
+    return len(json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8"))
+
+
+@dataclass(frozen=True)
+class CompactionReport:
+    rows_scanned: int
+    rows_rewritten: int
+    bytes_before: int
+    bytes_after: int
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+
+def compact_payment_events(connection: Connection, *, batch_size: int = 500) -> CompactionReport:
+    """Rewrite stored payloads to the projected shape, walking the table in primary-key order."""
+    table = cast(Table, PaymentEvent.__table__)
+    rows_scanned = 0
+    rows_rewritten = 0
+    bytes_before = 0
+    bytes_after = 0
+    last_id: str | None = None
+    while True:
+        statement = select(table.c.id, table.c.payload_json).order_by(table.c.id).limit(batch_size)
+        if last_id is not None:
+            # No "" sentinel: ids are native uuid on Postgres and cannot be compared with text.
+            statement = statement.where(table.c.id > last_id)
+        rows = connection.execute(statement).all()
+        if not rows:
+            break
+        for row_id, payload in rows:
+            rows_scanned += 1
+            current: dict[str, Any] = payload or {}
+            projected = project_event(current)
+            before = payload_size(current)
+            after = payload_size(projected)
+            bytes_before += before
+            if after < before:
+                connection.execute(update(table).where(table.c.id == row_id).values(payload_json=projected))
+                rows_rewritten += 1
+                bytes_after += after
+            else:
+                bytes_after += before
+        last_id = rows[-1][0]
+    return CompactionReport(
+        rows_scanned=rows_scanned,
+        rows_rewritten=rows_rewritten,
+        bytes_before=bytes_before,
+        bytes_after=bytes_after,
+    )
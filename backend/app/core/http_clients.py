@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+from collections import Counter, deque
+from collections.abc import Mapping
+from dataclasses import dataclass
+import importlib.util
+import logging
+import threading
+import time
+from typing import Any
+
+import httpx
+import stripe
+
+from app.core.config import Settings
+
+logger = logging.getLogger("quiz.http")
+
+# Request latencies kept per upstream for the percentiles reported by `stats()`.
+LATENCY_SAMPLE_SIZE = 2048
+CONNECT_RETRY_BACKOFF_SECONDS = 0.2
+# Nothing reached the upstream for these, so a retry can never duplicate a postback or a charge.
+_RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+@dataclass(frozen=True)
+class UpstreamPolicy:
+    timeout_seconds: float
+    connect_retries: int
+
+
+UPSTREAM_POLICIES: Mapping[str, UpstreamPolicy] = {
+    "telegram": UpstreamPolicy(timeout_seconds=10.0, connect_retries=2),
+    "meta": UpstreamPolicy(timeout_seconds=15.0, connect_retries=2),
+    "mobi_slon": UpstreamPolicy(timeout_seconds=10.0, connect_retries=2),
+    # stripe-python retries on its own with idempotency keys; its per-request timeout wins.
+    "stripe": UpstreamPolicy(timeout_seconds=80.0, connect_retries=0),
+}
+
+
+class UpstreamMetrics:
+    """Counters for one upstream, fed by the metered transport of its client."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._lock = threading.Lock()
+        self._latencies_ms: deque[float] = deque(maxlen=LATENCY_SAMPLE_SIZE)
+        self._statuses: Counter[str] = Counter()
+        self._errors: Counter[str] = Counter()
+        self.requests = 0
+        self.retries = 0
+        self.max_latency_ms = 0.0
+
+    def observe_response(self, status_code: int, latency_ms: float) -> None:
+        with self._lock:
+            self.requests += 1
+            self._statuses[f"{status_code // 100}xx"] += 1
+            self._latencies_ms.append(latency_ms)
+            self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+
+    def observe_error(self, exc: Exception, *, retried: bool) -> None:
+        with self._lock:
+            self._errors[type(exc).__name__] += 1
+            if retried:
+                self.retries += 1
+            else:
+                self.requests += 1
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self._latencies_ms)
+            statuses = dict(self._statuses)
+            errors = dict(self._errors)
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "statuses": statuses,
+            "errors": errors,
+            "latency_ms_p50": round(latencies[len(latencies) // 2], 3) if latencies else 0.0,
+            "latency_ms_p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3) if latencies else 0.0,
+            "latency_ms_max": round(self.max_latency_ms, 3),
+        }
+
+
+class _MeteredTransport(httpx.BaseTransport):
+    """Times each request up to the response headers and retries failures that never reached the upstream."""
+
+    def __init__(self, inner: httpx.BaseTransport, metrics: UpstreamMetrics, connect_retries: int) -> None:
+        self._inner = inner
+        self._metrics = metrics
+        self._connect_retries = connect_retries
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                response = self._inner.handle_request(request)
+            except _RETRYABLE_ERRORS as exc:
+                retry = attempt < self._connect_retries
+                self._metrics.observe_error(exc, retried=retry)
+                if not retry:
+                    raise
+                logger.warning(
+                    "outbound_http_retry upstream=%s host=%s attempt=%d error=%s",
+                    self._metrics.name,
+                    request.url.host,
+                    attempt + 1,
+                    type(exc).__name__,
+                )
+                time.sleep(CONNECT_RETRY_BACKOFF_SECONDS * 2**attempt)
+                attempt += 1
+                continue
+            except httpx.TransportError as exc:
+                self._metrics.observe_error(exc, retried=False)
+                raise
+            self._metrics.observe_response(response.status_code, (time.perf_counter() - started) * 1000)
+            return response
+
+    def close(self) -> None:
+        self._inner.close()
+
+
+def _http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+class OutboundClients:
+    """One pooled httpx.Client per upstream (Telegram, Meta, Mobi-Slon, Stripe), owned by AppContainer.
+
+    Clients are created on first use and closed by the app lifespan on shutdown; a closed registry
+    reopens lazily, so workers and scripts can use it without a lifespan.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        self._limits = httpx.Limits(
+            max_connections=settings.outbound_http_max_connections,
+            max_keepalive_connections=settings.outbound_http_max_keepalive,
+            keepalive_expiry=settings.outbound_http_keepalive_seconds,
+        )
+        self._http2 = settings.outbound_http2 and _http2_available()
+        if settings.outbound_http2 and not self._http2:
+            logger.warning("outbound_http2_unavailable reason=h2_not_installed")
+        self._lock = threading.Lock()
+        self._clients: dict[str, httpx.Client] = {}
+        self.metrics = {name: UpstreamMetrics(name) for name in UPSTREAM_POLICIES}
+        # Replaces the network transport of every client built afterwards (tests use httpx.MockTransport).
+        self.transport: httpx.BaseTransport | None = None
+
+    def client(self, upstream: str) -> httpx.Client:
+        client = self._clients.get(upstream)
+        if client is not None and not client.is_closed:
+            return client
+        with self._lock:
+            client = self._clients.get(upstream)
+            if client is None or client.is_closed:
+                client = self._build(upstream)
+                self._clients[upstream] = client
+            return client
+
+    def _build(self, upstream: str) -> httpx.Client:
+        policy = UPSTREAM_POLICIES[upstream]
+        inner = self.transport or httpx.HTTPTransport(limits=self._limits, http2=self._http2)
+        return httpx.Client(
+            transport=_MeteredTransport(inner, self.metrics[upstream], policy.connect_retries),
+            timeout=httpx.Timeout(policy.timeout_seconds, connect=min(policy.timeout_seconds, 5.0)),
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        return {
+            name: {**metrics.stats(), "open": name in self._clients, "http2": self._http2}
+            for name, metrics in self.metrics.items()
+        }
+
+
+class StripeHTTPClient(stripe.HTTPXClient):
+    """Sends stripe-python's synchronous calls through the shared `stripe` client."""
+
+    def __init__(self, clients: OutboundClients) -> None:
+        # No sync httpx.Client of its own; timeout=None leaves the stripe upstream policy in charge.
+        super().__init__(timeout=None, allow_sync_methods=False)
+        self._clients = clients
+
+    # Same signature as stripe.HTTPXClient.request, which itself diverges from the HTTPClient base.
+    def request(  # type: ignore[override]
+        self,
+        method: str,
+        url: str,
+        headers: Mapping[str, str],
+        post_data: Any = None,
+    ) -> tuple[bytes, int, Mapping[str, str]]:
+        args, kwargs = self._get_request_args_kwargs(method, url, headers, post_data)
+        try:
+            response = self._clients.client("stripe").request(*args, **kwargs)
+        except Exception as exc:  # noqa: BLE001
+            self._handle_request_error(exc)
+        return response.content, response.status_code, response.headers
+
+    def close(self) -> None:
+        # The pooled client belongs to OutboundClients and is closed with the app.
+        return None
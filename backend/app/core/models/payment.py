@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import datetime, timezone
 import uuid
 
-from sqlalchemy import DateTime, Integer, MetaData, String, UniqueConstraint
+from sqlalchemy import Boolean, DateTime, Enum, Index, Integer, LargeBinary, MetaData, String, UniqueConstraint, Uuid, text
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from sqlalchemy.types import JSON
@@ -15,6 +15,52 @@ from app.core.config import get_settings
 SETTINGS = get_settings()
 DB_SCHEMA = "seranking" if SETTINGS.resolved_database_url.startswith("postgresql") else None
 
+# Ids are native 16-byte uuid columns on Postgres and stay plain strings at the ORM level.
+UUIDString = Uuid(as_uuid=False).with_variant(String(36), "sqlite")
+
+
+def is_uuid(value: str) -> bool:
+    """Externally supplied ids must be checked before they are bound to a uuid column on Postgres."""
+    try:
+        uuid.UUID(value)
+    except (TypeError, ValueError, AttributeError):
+        return False
+    return True
+
+
+ORDER_STATUSES = (
+    "created",
+    "session_created",
+    "paid",
+    "expired",
+    "failed",
+    "past_due",
+    "canceled",
+    # Stripe subscription statuses mirrored by customer.subscription.updated.
+    "active",
+    "trialing",
+    "incomplete",
+    "incomplete_expired",
+    "unpaid",
+    "paused",
+)
+FULFILLMENT_STATUSES = ("pending", "partial", "done")
+ACCESS_STATUSES = ("pending", "token_issued", "active", "grace_period", "expired", "revoked")
+ACCESS_TOKEN_STATUSES = ("issued", "activated", "revoked")
+ACCESS_BINDING_STATUSES = ("active", "inactive", "revoked")
+
+
+def _status_enum(name: str, values: tuple[str, ...]) -> Enum:
+    # Postgres enum (4 bytes) in the tables' schema; VARCHAR(32) elsewhere. Unknown values fail on bind.
+    return Enum(*values, name=name, inherit_schema=True, validate_strings=True, length=32)
+
+
+OrderStatus = _status_enum("order_status", ORDER_STATUSES)
+FulfillmentStatus = _status_enum("fulfillment_status", FULFILLMENT_STATUSES)
+AccessStatus = _status_enum("access_status", ACCESS_STATUSES)
+AccessTokenStatus = _status_enum("access_token_status", ACCESS_TOKEN_STATUSES)
+AccessBindingStatus = _status_enum("access_binding_status", ACCESS_BINDING_STATUSES)
+
 
 def utcnow() -> datetime:
     return datetime.now(timezone.utc)
@@ -26,8 +72,14 @@ class Base(DeclarativeBase):
 
 class Order(Base):
     __tablename__ = "orders"
-
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    __table_args__ = (
+        Index("ix_orders_telegram_chat_id_updated_at", "telegram_chat_id", "updated_at"),
+        Index("ix_orders_stripe_subscription_id", "stripe_subscription_id"),
+        Index("ix_orders_stripe_customer_id_updated_at", "stripe_customer_id", "updated_at"),
+        Index("ix_orders_stripe_payment_intent_id", "stripe_payment_intent_id"),
+    )
+
+    id: Mapped[str] = mapped_column(UUIDString, primary_key=True, default=lambda: str(uuid.uuid4()))
     email: Mapped[str] = mapped_column(String(320), index=True)
     clickid: Mapped[str] = mapped_column(String(128), default="")
     telegram_chat_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
@@ -36,9 +88,9 @@ class Order(Base):
     locale: Mapped[str] = mapped_column(String(8), default="en")
     amount_minor: Mapped[int] = mapped_column(Integer)
     currency: Mapped[str] = mapped_column(String(16))
-    status: Mapped[str] = mapped_column(String(32), default="created")
-    fulfillment_status: Mapped[str] = mapped_column(String(32), default="pending")
-    access_status: Mapped[str] = mapped_column(String(32), default="pending")
+    status: Mapped[str] = mapped_column(OrderStatus, default="created")
+    fulfillment_status: Mapped[str] = mapped_column(FulfillmentStatus, default="pending")
+    access_status: Mapped[str] = mapped_column(AccessStatus, default="pending")
     stripe_session_id: Mapped[str | None] = mapped_column(String(128), unique=True, nullable=True)
     stripe_payment_intent_id: Mapped[str | None] = mapped_column(String(128), nullable=True)
     stripe_customer_id: Mapped[str | None] = mapped_column(String(128), nullable=True)
@@ -50,21 +102,42 @@ class Order(Base):
 
 class PaymentEvent(Base):
     __tablename__ = "payment_events"
-
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    stripe_event_id: Mapped[str] = mapped_column(String(128), unique=True, index=True)
+    __table_args__ = (
+        Index("ix_payment_events_process_result_received_at", "process_result", "received_at"),
+        Index("ix_payment_events_partition_key_received_at", "partition_key", "received_at"),
+    )
+
+    id: Mapped[str] = mapped_column(UUIDString, primary_key=True, default=lambda: str(uuid.uuid4()))
+    # Uniqueness of stripe_event_id lives in payment_event_keys: on Postgres this table is
+    # range-partitioned by received_at, which cannot carry a global unique index.
+    stripe_event_id: Mapped[str] = mapped_column(String(128), index=True)
     event_type: Mapped[str] = mapped_column(String(128))
+    partition_key: Mapped[str | None] = mapped_column(String(128), nullable=True)
     payload_json: Mapped[dict] = mapped_column(JSONB().with_variant(JSON, "sqlite"))
+    raw_body_compressed: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
     process_result: Mapped[str] = mapped_column(String(32), default="processed")
-    processed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[str | None] = mapped_column(String(512), nullable=True)
+    # Inbox retries back off from here; NULL means due now.
+    next_attempt_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    received_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True, default=utcnow)
+    processed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+class PaymentEventKey(Base):
+    __tablename__ = "payment_event_keys"
+
+    stripe_event_id: Mapped[str] = mapped_column(String(128), primary_key=True)
+    received_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow, index=True)
 
 
 class AccessToken(Base):
     __tablename__ = "access_tokens"
+    __table_args__ = (Index("ix_access_tokens_order_id_status_issued_at", "order_id", "status", "issued_at"),)
 
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    order_id: Mapped[str] = mapped_column(String(36), index=True)
-    status: Mapped[str] = mapped_column(String(32), default="issued")
+    id: Mapped[str] = mapped_column(UUIDString, primary_key=True, default=lambda: str(uuid.uuid4()))
+    order_id: Mapped[str] = mapped_column(UUIDString)
+    status: Mapped[str] = mapped_column(AccessTokenStatus, default="issued")
     revoked_reason: Mapped[str | None] = mapped_column(String(128), nullable=True)
     issued_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow)
     activated_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -73,23 +146,90 @@ class AccessToken(Base):
 
 class AccessBinding(Base):
     __tablename__ = "access_bindings"
-    __table_args__ = (UniqueConstraint("order_id", "telegram_user_id", name="uq_access_order_telegram"),)
-
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    order_id: Mapped[str] = mapped_column(String(36), index=True)
-    telegram_user_id: Mapped[str] = mapped_column(String(64), index=True)
-    status: Mapped[str] = mapped_column(String(32), default="active")
+    __table_args__ = (
+        UniqueConstraint("order_id", "telegram_user_id", name="uq_access_order_telegram"),
+        Index("ix_access_bindings_telegram_user_id_status_bound_at", "telegram_user_id", "status", "bound_at"),
+        Index("ix_access_bindings_telegram_user_id_bound_at", "telegram_user_id", "bound_at"),
+    )
+
+    id: Mapped[str] = mapped_column(UUIDString, primary_key=True, default=lambda: str(uuid.uuid4()))
+    order_id: Mapped[str] = mapped_column(UUIDString, index=True)
+    telegram_user_id: Mapped[str] = mapped_column(String(64))
+    status: Mapped[str] = mapped_column(AccessBindingStatus, default="active")
     bound_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow)
 
 
+class Entitlement(Base):
+    """Current access state per Telegram user, maintained in the same transaction as order/binding changes."""
+
+    __tablename__ = "entitlements"
+
+    telegram_user_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    order_id: Mapped[str | None] = mapped_column(UUIDString, nullable=True, index=True)
+    plan: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    access_status: Mapped[str | None] = mapped_column(AccessStatus, nullable=True)
+    is_paid: Mapped[bool] = mapped_column(Boolean, default=False)
+    valid_until: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow, onupdate=utcnow)
+
+
 class RestoreOTP(Base):
     __tablename__ = "restore_otps"
-
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    email: Mapped[str] = mapped_column(String(320), index=True)
+    __table_args__ = (
+        Index("ix_restore_otps_email_created_at", "email", "created_at"),
+        # restore_confirm only ever looks at the newest unused OTP of an email.
+        Index(
+            "ix_restore_otps_email_created_at_unused",
+            "email",
+            "created_at",
+            postgresql_where=text("used_at IS NULL"),
+            sqlite_where=text("used_at IS NULL"),
+        ),
+    )
+
+    id: Mapped[str] = mapped_column(UUIDString, primary_key=True, default=lambda: str(uuid.uuid4()))
+    email: Mapped[str] = mapped_column(String(320))
     otp_hash: Mapped[str] = mapped_column(String(128), index=True)
     attempts: Mapped[int] = mapped_column(Integer, default=0)
     max_attempts: Mapped[int] = mapped_column(Integer, default=5)
     expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
     used_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow)
+
+
+class OutboxMessage(Base):
+    __tablename__ = "outbox_messages"
+    __table_args__ = (Index("ix_outbox_messages_status_next_attempt_at", "status", "next_attempt_at"),)
+
+    id: Mapped[str] = mapped_column(UUIDString, primary_key=True, default=lambda: str(uuid.uuid4()))
+    order_id: Mapped[str] = mapped_column(UUIDString, index=True)
+    kind: Mapped[str] = mapped_column(String(32))
+    payload_json: Mapped[dict] = mapped_column(JSONB().with_variant(JSON, "sqlite"))
+    status: Mapped[str] = mapped_column(String(32), default="pending")
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[str | None] = mapped_column(String(512), nullable=True)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow)
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+class MobiSlonPostback(Base):
+    """Durable tracker postback; a click converts to each funnel status at most once."""
+
+    __tablename__ = "mobi_slon_postbacks"
+    __table_args__ = (
+        UniqueConstraint("clickid", "cnv_status", name="uq_mobi_slon_postbacks_clickid_cnv_status"),
+        Index("ix_mobi_slon_postbacks_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+    id: Mapped[str] = mapped_column(UUIDString, primary_key=True, default=lambda: str(uuid.uuid4()))
+    clickid: Mapped[str] = mapped_column(String(256))
+    cnv_status: Mapped[str] = mapped_column(String(64))
+    params_json: Mapped[dict] = mapped_column(JSONB().with_variant(JSON, "sqlite"), default=dict)
+    source: Mapped[str] = mapped_column(String(32))
+    status: Mapped[str] = mapped_column(String(16), default="pending")
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[str | None] = mapped_column(String(512), nullable=True)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow)
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
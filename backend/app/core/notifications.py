@@ -3,15 +3,19 @@ from __future__ import annotations
 from email.message import EmailMessage
 import logging
 import smtplib
+import threading
+import time
 from urllib.parse import urlparse
 
-import httpx
-
 from app.core.config import Settings
+from app.core.http_clients import OutboundClients
 from app.core.security import mask_email
 
 logger = logging.getLogger("quiz.notifications")
 
+# A failed getMe is retried after this long rather than on every deep link.
+BOT_USERNAME_RETRY_SECONDS = 60.0
+
 
 class LogOnlyEmailSender:
     def send_access_email(self, *, email: str, order_id: str, activation_link: str, locale: str) -> None:
@@ -120,10 +124,14 @@ def build_email_sender(settings: Settings) -> LogOnlyEmailSender | SmtpEmailSend
 
 
 class TelegramSender:
-    def __init__(self, settings: Settings) -> None:
+    """One instance per process (see AppContainer): the bot username is resolved once and shared."""
+
+    def __init__(self, settings: Settings, http: OutboundClients) -> None:
+        self._http = http
         self._bot_token = settings.telegram_bot_token
         self._bot_username = self._normalize_bot_username(settings.telegram_bot_username)
-        self._bot_username_resolve_attempted = False
+        self._bot_username_failed_at: float | None = None
+        self._bot_username_lock = threading.Lock()
 
     @staticmethod
     def _normalize_bot_username(raw_value: str | None) -> str:
@@ -143,28 +151,35 @@ class TelegramSender:
 
         return value.strip()
 
-    def _resolve_bot_username(self) -> str:
+    def resolve_bot_username(self) -> str:
         if self._bot_username:
             return self._bot_username
-        if not self._bot_token or self._bot_username_resolve_attempted:
+        if not self._bot_token:
             return ""
 
-        self._bot_username_resolve_attempted = True
-        try:
-            response = httpx.get(f"https://api.telegram.org/bot{self._bot_token}/getMe", timeout=10)
-            response.raise_for_status()
-            payload = response.json()
-            username = self._normalize_bot_username(payload.get("result", {}).get("username"))
-            if username:
-                self._bot_username = username
-                logger.info("telegram_bot_username_resolved", extra={"bot_username": username})
-            return self._bot_username
-        except Exception as exc:  # noqa: BLE001
-            logger.warning("telegram_bot_username_resolve_failed", extra={"error": str(exc)})
-            return ""
+        with self._bot_username_lock:
+            if self._bot_username:
+                return self._bot_username
+            failed_at = self._bot_username_failed_at
+            if failed_at is not None and time.monotonic() - failed_at < BOT_USERNAME_RETRY_SECONDS:
+                return ""
+            try:
+                response = self._http.client("telegram").get(f"https://api.telegram.org/bot{self._bot_token}/getMe")
+                response.raise_for_status()
+                payload = response.json()
+                username = self._normalize_bot_username(payload.get("result", {}).get("username"))
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("telegram_bot_username_resolve_failed", extra={"error": str(exc)})
+                username = ""
+            if not username:
+                self._bot_username_failed_at = time.monotonic()
+                return ""
+            self._bot_username = username
+            logger.info("telegram_bot_username_resolved", extra={"bot_username": username})
+            return username
 
     def build_deep_link(self, token: str) -> str:
-        bot_username = self._resolve_bot_username()
+        bot_username = self.resolve_bot_username()
         if not bot_username:
             return ""
         return f"https://t.me/{bot_username}?start={token}"
@@ -182,7 +197,7 @@ class TelegramSender:
         text = f"Оплата подтверждена. Активируй доступ: {deep_link}"
         url = f"https://api.telegram.org/bot{self._bot_token}/sendMessage"
         try:
-            response = httpx.post(url, json={"chat_id": chat_id, "text": text}, timeout=10)
+            response = self._http.client("telegram").post(url, json={"chat_id": chat_id, "text": text})
             if response.status_code >= 400:
                 logger.warning(
                     "telegram_send_failed",
@@ -1,13 +1,33 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
 from contextlib import asynccontextmanager
+from typing import Any
 
 from fastapi import FastAPI
 
+from app.api.middleware import QueryStatsMiddleware
 from app.api.router import api_router
 from app.cli.run_migrations import run_migrations
+from app.core.config import get_settings
+from app.core.container import close_ad_hoc_containers, get_container
+from app.core.db.session import (
+    AsyncSessionLocal,
+    ReplicaSessionLocal,
+    SessionLocal,
+    async_engine,
+    async_replica_engine,
+    engine,
+)
+from app.services.entitlement_feed import PostgresEntitlementListener
+from app.services.entitlement_snapshot import EntitlementSnapshotWriter
+from app.services.entitlements import ENTITLEMENT_FEED, invalidate_from_event
+from app.services.meta_capi import META_EVENT_RELAY
+from app.services.mobi_slon_postbacks import POSTBACK_INTAKE, MobiSlonPostbackWorker
+from app.services.outbox import OutboxDispatcher
+from app.services.webhook_inbox import WebhookInboxWorker
 
 
 def _resolve_log_level() -> int:
@@ -32,10 +52,58 @@ async def lifespan(app: FastAPI):
     logging.info("app_startup logging_configured level=%s", logging.getLevelName(_resolve_log_level()))
     run_migrations()
     _configure_logging()
-    yield
+
+    settings = get_settings()
+    container = get_container()
+    app.state.container = container
+    stop_event = asyncio.Event()
+    background_tasks: list[asyncio.Task[Any]] = []
+    # Resolve the bot username (getMe) once per process, off the request path.
+    background_tasks.append(
+        asyncio.create_task(asyncio.to_thread(container.telegram_sender.resolve_bot_username), name="telegram-bot-username")
+    )
+    if settings.normalized_stripe_webhook_mode == "inbox" and settings.webhook_inbox_worker_enabled:
+        worker = WebhookInboxWorker(settings, SessionLocal)
+        background_tasks.append(asyncio.create_task(worker.run(stop_event), name="stripe-inbox-worker"))
+    if settings.outbox_worker_enabled:
+        dispatcher = OutboxDispatcher(settings, SessionLocal)
+        background_tasks.append(asyncio.create_task(dispatcher.run(stop_event), name="outbox-dispatcher"))
+    # Relay endpoints only buffer postbacks; the intake writes them to the queue table in batches.
+    POSTBACK_INTAKE.bind(AsyncSessionLocal)
+    background_tasks.append(asyncio.create_task(POSTBACK_INTAKE.run(stop_event), name="mobi-slon-intake"))
+    if settings.mobi_slon_worker_enabled:
+        postback_worker = MobiSlonPostbackWorker(settings, SessionLocal)
+        background_tasks.append(asyncio.create_task(postback_worker.run(stop_event), name="mobi-slon-postbacks"))
+    if settings.normalized_meta_capi_mode == "batched":
+        background_tasks.append(asyncio.create_task(META_EVENT_RELAY.run(stop_event), name="meta-capi-relay"))
+    ENTITLEMENT_FEED.bind(asyncio.get_running_loop())
+    if settings.entitlement_feed_enabled and engine.dialect.name == "postgresql":
+        listener = PostgresEntitlementListener(settings, ENTITLEMENT_FEED, on_change=invalidate_from_event)
+        background_tasks.append(asyncio.create_task(listener.run(stop_event), name="entitlement-feed-listener"))
+    if settings.entitlement_snapshot_path:
+        snapshot_writer = EntitlementSnapshotWriter(settings, ReplicaSessionLocal)
+        background_tasks.append(asyncio.create_task(snapshot_writer.run(stop_event), name="entitlement-snapshot-writer"))
+
+    try:
+        yield
+    finally:
+        # First, before any await: ends the SSE streams (the bot reconnects), so they do not hold up the shutdown.
+        ENTITLEMENT_FEED.close()
+        stop_event.set()
+        for task in background_tasks:
+            try:
+                await asyncio.wait_for(task, timeout=10)
+            except TimeoutError:
+                task.cancel()
+        container.http.close()
+        close_ad_hoc_containers()
+        await async_engine.dispose()
+        if async_replica_engine is not async_engine:
+            await async_replica_engine.dispose()
 
 
 app = FastAPI(title="quiz-backend", lifespan=lifespan, )
+app.add_middleware(QueryStatsMiddleware, server_timing=get_settings().server_timing_enabled)
 app.include_router(api_router)
 
 
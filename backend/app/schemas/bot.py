@@ -1,7 +1,11 @@
 from __future__ import annotations
 
+from typing import Annotated
+
 from pydantic import BaseModel, Field
 
+from app.core.config import BULK_LOOKUP_CHUNK_SIZE
+
 
 class BotAccessStatusRequest(BaseModel):
     telegram_user_id: str = Field(min_length=1)
@@ -14,6 +18,14 @@ class BotAccessStatusResponse(BaseModel):
     access_status: str | None = None
 
 
+class BotAccessStatusBatchRequest(BaseModel):
+    telegram_user_ids: list[Annotated[str, Field(min_length=1)]] = Field(min_length=1, max_length=BULK_LOOKUP_CHUNK_SIZE)
+
+
+class BotAccessStatusBatchResponse(BaseModel):
+    statuses: dict[str, BotAccessStatusResponse]
+
+
 class BotActivateAccessRequest(BaseModel):
     activation_token: str = Field(min_length=1)
     telegram_user_id: str = Field(min_length=1)
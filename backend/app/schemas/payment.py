@@ -54,4 +54,6 @@ class MobiSlonEventRequest(BaseModel):
 
 class MobiSlonEventResponse(BaseModel):
     accepted: bool
+    # Queued for delivery (now or earlier); false when the event is not sent to the tracker at all.
     forwarded: bool
+    duplicate: bool = False
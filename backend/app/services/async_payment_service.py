@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import Settings
+from app.core.container import AppContainer, container_for
+from app.services.entitlements import cached_access_state_async, cached_access_states_async, recently_changed
+from app.services.payment_service import PaymentService
+
+
+class AsyncPaymentService:
+    """PaymentService for `async def` endpoints on the async engine.
+
+    Access status reads are native async queries. Writes reuse the sync PaymentService through
+    AsyncSession.run_sync: the same ORM code and transaction, with I/O driven by the async driver
+    on the event loop instead of a threadpool worker. Only operations without outbound HTTP belong
+    here; anything calling Stripe, SMTP or Telegram would block the loop.
+
+    With a `replica` session, access status reads go to it, except for users whose entitlement
+    changed within DATABASE_REPLICA_LAG_SECONDS, who are read from the primary.
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        db: AsyncSession,
+        *,
+        replica: AsyncSession | None = None,
+        container: AppContainer | None = None,
+    ) -> None:
+        self.container = container or container_for(settings)
+        self.settings = self.container.settings
+        self.db = db
+        self.replica = replica
+
+    def _read_session(self, telegram_user_id: str) -> AsyncSession:
+        if self.replica is None or recently_changed(telegram_user_id):
+            return self.db
+        return self.replica
+
+    async def get_access_status_by_telegram_user(self, telegram_user_id: str) -> dict[str, str | bool | None]:
+        state = await cached_access_state_async(self._read_session(telegram_user_id), telegram_user_id)
+        return PaymentService.access_status_payload(state)
+
+    async def get_access_statuses_by_telegram_users(
+        self, telegram_user_ids: list[str]
+    ) -> dict[str, dict[str, str | bool | None]]:
+        user_ids = list(dict.fromkeys(telegram_user_ids))
+        primary_ids = [user_id for user_id in user_ids if self._read_session(user_id) is self.db]
+        on_primary = set(primary_ids)
+        replica_ids = [user_id for user_id in user_ids if user_id not in on_primary]
+        states = await cached_access_states_async(self.db, primary_ids) if primary_ids else {}
+        if replica_ids and self.replica is not None:
+            states.update(await cached_access_states_async(self.replica, replica_ids))
+        return {user_id: PaymentService.access_status_payload(states[user_id]) for user_id in user_ids}
+
+    async def activate_access(self, *, activation_token: str, telegram_user_id: str) -> dict[str, str | bool]:
+        return await self.db.run_sync(
+            lambda db: PaymentService(self.settings, db, container=self.container).activate_access(
+                activation_token=activation_token,
+                telegram_user_id=telegram_user_id,
+            )
+        )
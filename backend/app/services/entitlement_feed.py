@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+import json
+import logging
+from typing import Any
+
+import psycopg
+from sqlalchemy.engine import make_url
+
+from app.core.config import Settings
+
+logger = logging.getLogger("quiz.entitlement_feed")
+
+# Subscribers that fall behind, and all subscribers after a LISTEN reconnect, get this instead of
+# the missed changes and must treat every cached access status as unverified.
+RESET_EVENT: dict[str, Any] = {"type": "reset"}
+# Put on every subscriber queue when the app stops; streams end instead of waiting for the next change.
+CLOSE_EVENT: dict[str, Any] = {"type": "close"}
+
+
+class EntitlementFeed:
+    """In-process fan-out of entitlement changes to streaming subscribers (bot SSE connections).
+
+    Changes arrive from Postgres LISTEN (any backend process) or, without Postgres, straight from
+    the committing session. Publishing is safe from worker threads once bound to the event loop.
+    """
+
+    def __init__(self, queue_size: int) -> None:
+        self._queue_size = max(1, queue_size)
+        self._subscribers: set[asyncio.Queue[dict[str, Any]]] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.closing = False
+        self.published = 0
+        self.dropped = 0
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self.closing = False
+
+    def close(self) -> None:
+        self.closing = True
+        for queue in self._subscribers:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(CLOSE_EVENT)
+
+    def publish_threadsafe(self, events: list[dict[str, Any]]) -> None:
+        loop = self._loop
+        if loop is None or loop.is_closed() or not events:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self.publish(events)
+        else:
+            loop.call_soon_threadsafe(self.publish, events)
+
+    def publish(self, events: list[dict[str, Any]]) -> None:
+        self.published += len(events)
+        for queue in self._subscribers:
+            for event in events:
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait(RESET_EVENT)
+                    self.dropped += 1
+                    break
+
+    @asynccontextmanager
+    async def subscribe(self) -> AsyncIterator[asyncio.Queue[dict[str, Any]]]:
+        queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(maxsize=self._queue_size)
+        self._subscribers.add(queue)
+        try:
+            yield queue
+        finally:
+            self._subscribers.discard(queue)
+
+    def stats(self) -> dict[str, int]:
+        return {"subscribers": len(self._subscribers), "published": self.published, "dropped": self.dropped}
+
+
+class PostgresEntitlementListener:
+    """LISTENs on the entitlement channel and republishes notifications to the local feed."""
+
+    def __init__(
+        self,
+        settings: Settings,
+        feed: EntitlementFeed,
+        on_change: Callable[[dict[str, Any]], None] | None = None,
+    ) -> None:
+        self._settings = settings
+        self._feed = feed
+        self._on_change = on_change
+        self._dsn = make_url(settings.resolved_database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+    async def _consume(self, connection: psycopg.AsyncConnection[Any]) -> None:
+        while True:
+            async for notify in connection.notifies(timeout=self._settings.entitlement_feed_heartbeat_seconds):
+                event: dict[str, Any] = json.loads(notify.payload)
+                if self._on_change is not None:
+                    self._on_change(event)
+                self._feed.publish([event])
+
+    async def _listen(self, stop: asyncio.Event) -> None:
+        channel = self._settings.entitlement_feed_channel
+        async with await psycopg.AsyncConnection.connect(self._dsn, autocommit=True) as connection:
+            await connection.execute(f'LISTEN "{channel}"')
+            logger.info("entitlement_feed_listening channel=%s", channel)
+            # Changes committed while we were not listening are lost; subscribers must revalidate.
+            self._feed.publish([RESET_EVENT])
+            # Raced against stop: waiting out the notifies() timeout would hold up shutdown.
+            consumer = asyncio.ensure_future(self._consume(connection))
+            stopped = asyncio.ensure_future(stop.wait())
+            done: set[asyncio.Future[Any]] = set()
+            try:
+                done, _ = await asyncio.wait({consumer, stopped}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in (consumer, stopped):
+                    task.cancel()
+                await asyncio.gather(consumer, stopped, return_exceptions=True)
+            if consumer in done:
+                # Connection errors propagate to run(), which reconnects.
+                consumer.result()
+
+    async def run(self, stop_event: asyncio.Event | None = None) -> None:
+        stop = stop_event or asyncio.Event()
+        while not stop.is_set():
+            try:
+                await self._listen(stop)
+            except Exception as exc:  # noqa: BLE001
+                logger.error("entitlement_feed_listen_failed error=%s", str(exc))
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self._settings.entitlement_feed_heartbeat_seconds)
+            except TimeoutError:
+                pass
+        logger.info("entitlement_feed_stopped")
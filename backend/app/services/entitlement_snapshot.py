@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import asyncio
+from array import array
+from collections.abc import Callable
+from dataclasses import dataclass
+import logging
+import os
+from pathlib import Path
+import struct
+import sys
+import time
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from app.core.config import Settings
+from app.core.models.payment import Entitlement
+
+logger = logging.getLogger("quiz.entitlement_snapshot")
+
+# Layout shared with bot/app/client/entitlement_snapshot.py: 32-byte little-endian header
+# (magic, format, reserved, version, generated_at unix seconds, count) + `count` sorted int64 ids.
+SNAPSHOT_MAGIC = b"ENTS"
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_HEADER = struct.Struct("<4sHHQdQ")
+
+
+@dataclass(frozen=True)
+class SnapshotInfo:
+    path: Path
+    version: int
+    count: int
+    size_bytes: int
+
+
+def entitled_telegram_user_ids(db: Session) -> array[int]:
+    """Sorted numeric ids of users whose gate should open (paid or in grace period)."""
+    user_ids = db.scalars(
+        select(Entitlement.telegram_user_id).where(
+            or_(Entitlement.is_paid.is_(True), Entitlement.access_status == "grace_period")
+        )
+    )
+    ids = array("q", sorted(int(user_id) for user_id in user_ids if user_id.lstrip("-").isdigit()))
+    if sys.byteorder == "big":
+        ids.byteswap()
+    return ids
+
+
+def _previous_version(path: Path) -> int:
+    try:
+        with open(path, "rb") as snapshot:
+            magic, _, _, version, _, _ = SNAPSHOT_HEADER.unpack(snapshot.read(SNAPSHOT_HEADER.size))
+    except (OSError, struct.error):
+        return 0
+    return version if magic == SNAPSHOT_MAGIC else 0
+
+
+def write_entitlement_snapshot(db: Session, path: Path) -> SnapshotInfo:
+    ids = entitled_telegram_user_ids(db)
+    version = _previous_version(path) + 1
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT, 0, version, time.time(), len(ids))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as snapshot:
+        snapshot.write(header)
+        ids.tofile(snapshot)
+        snapshot.flush()
+        os.fsync(snapshot.fileno())
+    # Readers map whole files only: the rename swaps the inode they see next time they stat.
+    os.replace(tmp_path, path)
+    return SnapshotInfo(
+        path=path,
+        version=version,
+        count=len(ids),
+        size_bytes=SNAPSHOT_HEADER.size + len(ids) * ids.itemsize,
+    )
+
+
+class EntitlementSnapshotWriter:
+    """Rewrites the entitlement snapshot every `entitlement_snapshot_interval_seconds`."""
+
+    def __init__(self, settings: Settings, session_factory: Callable[[], Session]) -> None:
+        self._settings = settings
+        self._session_factory = session_factory
+        self._path = Path(settings.entitlement_snapshot_path)
+
+    def write_once(self) -> SnapshotInfo:
+        with self._session_factory() as db:
+            info = write_entitlement_snapshot(db, self._path)
+        logger.info(
+            "entitlement_snapshot_written path=%s version=%d count=%d bytes=%d",
+            info.path,
+            info.version,
+            info.count,
+            info.size_bytes,
+        )
+        return info
+
+    async def run(self, stop_event: asyncio.Event | None = None) -> None:
+        stop = stop_event or asyncio.Event()
+        while not stop.is_set():
+            try:
+                await asyncio.to_thread(self.write_once)
+            except Exception as exc:  # noqa: BLE001
+                logger.error("entitlement_snapshot_failed path=%s error=%s", self._path, str(exc))
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self._settings.entitlement_snapshot_interval_seconds)
+            except TimeoutError:
+                pass
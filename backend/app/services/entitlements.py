@@ -0,0 +1,335 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+from datetime import datetime
+import json
+import logging
+from typing import Any, TypedDict
+
+from sqlalchemy import BindParameter, Select, bindparam, delete, desc, event, literal, select, text, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.config import BULK_LOOKUP_CHUNK_SIZE, get_settings
+from app.core.models.payment import AccessBinding, Entitlement, Order
+from app.services.entitlement_feed import EntitlementFeed
+
+logger = logging.getLogger("quiz.entitlements")
+
+REBUILD_BATCH_SIZE = 500
+# Session.info key collecting users whose entitlement changed in the open transaction.
+CHANGED_USERS_KEY = "entitlements_changed"
+NOTIFY_QUERY = text("SELECT pg_notify(:channel, :payload)")
+
+
+class AccessState(TypedDict):
+    is_paid: bool
+    order_id: str | None
+    plan: str | None
+    access_status: str | None
+    valid_until: datetime | None
+
+
+NO_ACCESS: AccessState = {"is_paid": False, "order_id": None, "plan": None, "access_status": None, "valid_until": None}
+# Per-process; the TTL bounds staleness for writes committed by other workers.
+ACCESS_STATUS_CACHE: TTLCache[AccessState] = TTLCache(
+    get_settings().access_status_cache_size,
+    get_settings().access_status_cache_ttl_seconds,
+)
+ENTITLEMENT_FEED = EntitlementFeed(get_settings().entitlement_feed_queue_size)
+# Users whose entitlement changed within the replica lag window; their reads must hit the primary.
+RECENTLY_CHANGED: TTLCache[bool] = TTLCache(
+    get_settings().access_status_cache_size,
+    get_settings().database_replica_lag_seconds,
+)
+
+
+def _access_status_query() -> Select[Any]:
+    # One round trip: each branch is an index-ordered LIMIT 1, the lowest tier wins.
+    # 0 = latest active binding, 1 = latest binding of any status, 2 = order with matching chat id.
+    telegram_user_id: BindParameter[str] = bindparam("telegram_user_id")
+    order_columns = (Order.id, Order.plan, Order.status, Order.access_status, Order.stripe_current_period_end)
+    active_binding = (
+        select(literal(0).label("tier"), *order_columns)
+        .select_from(AccessBinding)
+        .join(Order, Order.id == AccessBinding.order_id)
+        .where(AccessBinding.telegram_user_id == telegram_user_id, AccessBinding.status == "active")
+        .order_by(desc(AccessBinding.bound_at))
+        .limit(1)
+        .subquery()
+    )
+    latest_binding = (
+        select(literal(1).label("tier"), *order_columns)
+        .select_from(AccessBinding)
+        .join(Order, Order.id == AccessBinding.order_id)
+        .where(AccessBinding.telegram_user_id == telegram_user_id)
+        .order_by(desc(AccessBinding.bound_at))
+        .limit(1)
+        .subquery()
+    )
+    chat_order = (
+        select(literal(2).label("tier"), *order_columns)
+        .where(Order.telegram_chat_id == telegram_user_id)
+        .order_by(desc(Order.updated_at))
+        .limit(1)
+        .subquery()
+    )
+    candidates = union_all(select(active_binding), select(latest_binding), select(chat_order)).subquery()
+    return select(candidates).order_by(candidates.c.tier).limit(1)
+
+
+# Built once: used for every entitlement recompute, statement construction would dominate.
+ACCESS_STATUS_QUERY = _access_status_query()
+
+
+def derive_access_state(db: Session, telegram_user_id: str) -> AccessState | None:
+    """Compute access from orders and bindings; None when the user is unknown."""
+    row = db.execute(ACCESS_STATUS_QUERY, {"telegram_user_id": telegram_user_id}).first()
+    if row is None:
+        return None
+    return {
+        "is_paid": row.tier != 1 and (row.access_status == "active" or row.status in {"paid", "active"}),
+        "order_id": row.id,
+        "plan": row.plan,
+        "access_status": row.access_status,
+        "valid_until": row.stripe_current_period_end,
+    }
+
+
+ENTITLEMENT_QUERY = select(
+    Entitlement.is_paid,
+    Entitlement.order_id,
+    Entitlement.plan,
+    Entitlement.access_status,
+    Entitlement.valid_until,
+).where(Entitlement.telegram_user_id == bindparam("telegram_user_id"))
+
+
+def _state_from_row(row: Any) -> AccessState:
+    if row is None:
+        return NO_ACCESS.copy()
+    return {
+        "is_paid": row.is_paid,
+        "order_id": row.order_id,
+        "plan": row.plan,
+        "access_status": row.access_status,
+        "valid_until": row.valid_until,
+    }
+
+
+def load_access_state(db: Session, telegram_user_id: str) -> AccessState:
+    """Primary-key lookup in entitlements; rows are kept current, so a miss means no access."""
+    return _state_from_row(db.execute(ENTITLEMENT_QUERY, {"telegram_user_id": telegram_user_id}).first())
+
+
+BULK_ENTITLEMENT_QUERY = select(
+    Entitlement.telegram_user_id,
+    Entitlement.is_paid,
+    Entitlement.order_id,
+    Entitlement.plan,
+    Entitlement.access_status,
+    Entitlement.valid_until,
+).where(Entitlement.telegram_user_id.in_(bindparam("telegram_user_ids", expanding=True)))
+
+
+def _bulk_chunks(telegram_user_ids: Iterable[str]) -> tuple[list[str], list[list[str]]]:
+    user_ids = list(dict.fromkeys(telegram_user_ids))
+    chunks = [user_ids[start:start + BULK_LOOKUP_CHUNK_SIZE] for start in range(0, len(user_ids), BULK_LOOKUP_CHUNK_SIZE)]
+    return user_ids, chunks
+
+
+def load_access_states(db: Session, telegram_user_ids: Iterable[str]) -> dict[str, AccessState]:
+    """Set-based load_access_state: one statement per BULK_LOOKUP_CHUNK_SIZE distinct ids."""
+    user_ids, chunks = _bulk_chunks(telegram_user_ids)
+    states: dict[str, AccessState] = {user_id: NO_ACCESS.copy() for user_id in user_ids}
+    for chunk in chunks:
+        for row in db.execute(BULK_ENTITLEMENT_QUERY, {"telegram_user_ids": chunk}):
+            states[row.telegram_user_id] = _state_from_row(row)
+    return states
+
+
+async def load_access_state_async(db: AsyncSession, telegram_user_id: str) -> AccessState:
+    result = await db.execute(ENTITLEMENT_QUERY, {"telegram_user_id": telegram_user_id})
+    return _state_from_row(result.first())
+
+
+async def load_access_states_async(db: AsyncSession, telegram_user_ids: Iterable[str]) -> dict[str, AccessState]:
+    user_ids, chunks = _bulk_chunks(telegram_user_ids)
+    states: dict[str, AccessState] = {user_id: NO_ACCESS.copy() for user_id in user_ids}
+    for chunk in chunks:
+        for row in await db.execute(BULK_ENTITLEMENT_QUERY, {"telegram_user_ids": chunk}):
+            states[row.telegram_user_id] = _state_from_row(row)
+    return states
+
+
+def _cached_states(telegram_user_ids: Iterable[str]) -> tuple[dict[str, AccessState], list[str]]:
+    states: dict[str, AccessState] = {}
+    missing: list[str] = []
+    for user_id in dict.fromkeys(telegram_user_ids):
+        state = ACCESS_STATUS_CACHE.get(user_id)
+        if state is None:
+            missing.append(user_id)
+        else:
+            states[user_id] = state
+    return states, missing
+
+
+def _store_loaded_states(states: dict[str, AccessState], loaded: dict[str, AccessState], version: int) -> dict[str, AccessState]:
+    for user_id, state in loaded.items():
+        ACCESS_STATUS_CACHE.set(user_id, state, version=version)
+        states[user_id] = state
+    return states
+
+
+def cached_access_state(db: Session, telegram_user_id: str) -> AccessState:
+    """Read-through ACCESS_STATUS_CACHE in front of load_access_state; treat the result as read-only."""
+    version = ACCESS_STATUS_CACHE.version
+    state = ACCESS_STATUS_CACHE.get(telegram_user_id)
+    if state is None:
+        state = load_access_state(db, telegram_user_id)
+        ACCESS_STATUS_CACHE.set(telegram_user_id, state, version=version)
+    return state
+
+
+async def cached_access_state_async(db: AsyncSession, telegram_user_id: str) -> AccessState:
+    version = ACCESS_STATUS_CACHE.version
+    state = ACCESS_STATUS_CACHE.get(telegram_user_id)
+    if state is None:
+        state = await load_access_state_async(db, telegram_user_id)
+        ACCESS_STATUS_CACHE.set(telegram_user_id, state, version=version)
+    return state
+
+
+def cached_access_states(db: Session, telegram_user_ids: Iterable[str]) -> dict[str, AccessState]:
+    """Bulk cached_access_state: cache hits are served in place, the misses are loaded together."""
+    version = ACCESS_STATUS_CACHE.version
+    states, missing = _cached_states(telegram_user_ids)
+    if not missing:
+        return states
+    return _store_loaded_states(states, load_access_states(db, missing), version)
+
+
+async def cached_access_states_async(db: AsyncSession, telegram_user_ids: Iterable[str]) -> dict[str, AccessState]:
+    version = ACCESS_STATUS_CACHE.version
+    states, missing = _cached_states(telegram_user_ids)
+    if not missing:
+        return states
+    return _store_loaded_states(states, await load_access_states_async(db, missing), version)
+
+
+def change_event(telegram_user_id: str, state: AccessState) -> dict[str, Any]:
+    valid_until = state["valid_until"]
+    return {
+        "type": "entitlement",
+        "telegram_user_id": telegram_user_id,
+        "is_paid": state["is_paid"],
+        "order_id": state["order_id"],
+        "plan": state["plan"],
+        "access_status": state["access_status"],
+        "valid_until": valid_until.isoformat() if valid_until is not None else None,
+    }
+
+
+def recently_changed(telegram_user_id: str) -> bool:
+    """True while a replica may still serve this user's pre-change entitlement."""
+    return RECENTLY_CHANGED.get(telegram_user_id) is not None
+
+
+def _mark_changed(telegram_user_ids: Iterable[str]) -> None:
+    for telegram_user_id in telegram_user_ids:
+        RECENTLY_CHANGED.set(telegram_user_id, True)
+
+
+def invalidate_from_event(event: dict[str, Any]) -> None:
+    telegram_user_id = event.get("telegram_user_id")
+    if telegram_user_id:
+        _mark_changed([telegram_user_id])
+        ACCESS_STATUS_CACHE.invalidate([telegram_user_id])
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_entitlements(session: Session) -> None:
+    changed: dict[str, AccessState] | None = session.info.pop(CHANGED_USERS_KEY, None)
+    if not changed:
+        return
+    _mark_changed(changed)
+    ACCESS_STATUS_CACHE.invalidate(changed)
+    # On Postgres the NOTIFY issued in the transaction reaches every process through LISTEN.
+    if session.get_bind().dialect.name != "postgresql":
+        ENTITLEMENT_FEED.publish_threadsafe([change_event(user_id, state) for user_id, state in changed.items()])
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_entitlements(session: Session) -> None:
+    session.info.pop(CHANGED_USERS_KEY, None)
+
+
+def refresh_entitlements(db: Session, telegram_user_ids: Iterable[str]) -> None:
+    """Recompute entitlement rows inside the caller's transaction.
+
+    Cached access state of these users is dropped once the transaction commits, and the new
+    state is published to the entitlement feed (pg_notify is transactional, so only on commit).
+    """
+    user_ids = sorted({user_id for user_id in telegram_user_ids if user_id})
+    if not user_ids:
+        return
+    changed: dict[str, AccessState] = db.info.setdefault(CHANGED_USERS_KEY, {})
+    notify = db.get_bind().dialect.name == "postgresql" and get_settings().entitlement_feed_enabled
+    # Pending order/binding changes must be visible to the derive query.
+    db.flush()
+    for user_id in user_ids:
+        state = derive_access_state(db, user_id)
+        changed[user_id] = state or NO_ACCESS.copy()
+        if notify:
+            db.execute(
+                NOTIFY_QUERY,
+                {
+                    "channel": get_settings().entitlement_feed_channel,
+                    "payload": json.dumps(change_event(user_id, changed[user_id])),
+                },
+            )
+        entitlement = db.get(Entitlement, user_id)
+        if state is None:
+            if entitlement is not None:
+                db.delete(entitlement)
+            continue
+        if entitlement is None:
+            entitlement = Entitlement(telegram_user_id=user_id)
+            db.add(entitlement)
+        entitlement.order_id = state["order_id"]
+        entitlement.plan = state["plan"]
+        entitlement.access_status = state["access_status"]
+        entitlement.is_paid = state["is_paid"]
+        entitlement.valid_until = state["valid_until"]
+    db.flush()
+
+
+def refresh_order_entitlements(db: Session, order: Order) -> None:
+    """Recompute entitlements of every Telegram user attached to `order`."""
+    db.flush()
+    user_ids = set(db.scalars(select(AccessBinding.telegram_user_id).where(AccessBinding.order_id == order.id)))
+    if order.telegram_chat_id:
+        user_ids.add(order.telegram_chat_id)
+    refresh_entitlements(db, user_ids)
+
+
+def rebuild_entitlements(db: Session, *, batch_size: int = REBUILD_BATCH_SIZE) -> int:
+    """Recompute the whole table from orders and bindings; returns the number of users written."""
+    chat_ids = db.scalars(select(Order.telegram_chat_id).where(Order.telegram_chat_id.is_not(None)).distinct())
+    user_ids = sorted(
+        set(db.scalars(select(AccessBinding.telegram_user_id).distinct())) | {chat_id for chat_id in chat_ids if chat_id}
+    )
+    for start in range(0, len(user_ids), batch_size):
+        refresh_entitlements(db, user_ids[start:start + batch_size])
+        db.commit()
+
+    known = set(user_ids)
+    stale = [user_id for user_id in db.scalars(select(Entitlement.telegram_user_id)) if user_id not in known]
+    for start in range(0, len(stale), batch_size):
+        batch = stale[start:start + batch_size]
+        db.execute(delete(Entitlement).where(Entitlement.telegram_user_id.in_(batch)))
+        db.info.setdefault(CHANGED_USERS_KEY, {}).update({user_id: NO_ACCESS.copy() for user_id in batch})
+    db.commit()
+    logger.info("entitlements_rebuilt users=%d stale_removed=%d", len(user_ids), len(stale))
+    return len(user_ids)
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+import logging
+import time
+from typing import Any, Literal
+
+import httpx
+
+from app.core.cache import RecentKeys
+from app.core.config import Settings, get_settings
+from app.core.container import AppContainer, container_for
+
+logger = logging.getLogger("quiz.meta_capi")
+
+# Graph API accepts at most 1000 events in one `data` array.
+MAX_BATCH_SIZE = 1000
+# event_ids remembered for deduplication; browsers resend the same event on reloads and retries.
+EVENT_ID_DEDUP_SIZE = 100_000
+# Flush durations kept for the percentiles reported by `stats()`.
+FLUSH_SAMPLE_SIZE = 512
+
+EnqueueResult = Literal["queued", "duplicate", "full"]
+
+
+def build_meta_event(
+    *,
+    status: str,
+    fbclid: str,
+    client_ip: str,
+    client_user_agent: str,
+    event_id: str = "",
+) -> dict[str, Any]:
+    event: dict[str, Any] = {
+        "event_name": status,
+        "event_time": int(time.time()),
+        "action_source": "website",
+        "user_data": {
+            "fbc": fbclid,
+            "client_ip_address": client_ip,
+            "client_user_agent": client_user_agent,
+        },
+    }
+    if event_id:
+        # Meta also deduplicates on (event_name, event_id) against the browser pixel.
+        event["event_id"] = event_id
+    return event
+
+
+def send_meta_events(container: AppContainer, events: list[dict[str, Any]]) -> httpx.Response:
+    settings = container.settings
+    url = f"https://graph.facebook.com/{settings.meta_graph_api_version}/{settings.meta_pixel_id}/events"
+    return container.http.client("meta").post(
+        url,
+        params={"access_token": settings.meta_access_token},
+        json={"data": events},
+    )
+
+
+@dataclass
+class _QueuedEvent:
+    payload: dict[str, Any]
+    enqueued_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+
+
+class MetaEventRelay:
+    """Buffers browser events for Meta CAPI and submits them in batches off the request path.
+
+    The tracking endpoint only enqueues (on the event loop); `run()` flushes when a batch is full
+    or the oldest event has waited `meta_capi_flush_interval_seconds`, and once more on shutdown.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        self._settings = settings
+        self._queue: deque[_QueuedEvent] = deque()
+        self._seen = RecentKeys(EVENT_ID_DEDUP_SIZE)
+        self._wakeup: asyncio.Event | None = None
+        self._flush_ms: deque[float] = deque(maxlen=FLUSH_SAMPLE_SIZE)
+        self.enqueued = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.sent = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_flush_ms = 0.0
+
+    @property
+    def batch_size(self) -> int:
+        return max(1, min(self._settings.meta_capi_batch_size, MAX_BATCH_SIZE))
+
+    def enqueue(self, event: dict[str, Any]) -> EnqueueResult:
+        event_id = event.get("event_id")
+        if event_id:
+            key = f"{event['event_name']}:{event_id}"
+            if key in self._seen:
+                self.duplicates += 1
+                return "duplicate"
+        if len(self._queue) >= self._settings.meta_capi_queue_size:
+            self.dropped += 1
+            return "full"
+        if event_id:
+            self._seen.add(key)
+        self._queue.append(_QueuedEvent(event))
+        self.enqueued += 1
+        if len(self._queue) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+        return "queued"
+
+    async def flush_once(self) -> int:
+        """Submit up to one batch; returns the number of events Meta accepted."""
+        batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+        if not batch:
+            return 0
+        started = time.perf_counter()
+        error: str | None = None
+        retryable = True
+        try:
+            response = await asyncio.to_thread(
+                send_meta_events, container_for(self._settings), [item.payload for item in batch]
+            )
+            if response.status_code < 400:
+                self.sent += len(batch)
+            else:
+                error = f"HTTP {response.status_code} {response.text[:180]}".replace("\n", " ")
+                retryable = response.status_code == 429 or response.status_code >= 500
+        except httpx.HTTPError as exc:
+            error = exc.__class__.__name__
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.batches += 1
+        self.last_flush_ms = elapsed_ms
+        self._flush_ms.append(elapsed_ms)
+        if error is None:
+            logger.info("meta_capi_batch_sent events=%d flush_ms=%.1f", len(batch), elapsed_ms)
+            return len(batch)
+
+        requeued = 0
+        for item in reversed(batch):
+            item.attempts += 1
+            if retryable and item.attempts < self._settings.meta_capi_max_attempts:
+                self._queue.appendleft(item)
+                requeued += 1
+        self.failed += len(batch) - requeued
+        logger.warning(
+            "meta_capi_batch_failed events=%d requeued=%d flush_ms=%.1f error=%s", len(batch), requeued, elapsed_ms, error
+        )
+        return 0
+
+    def _seconds_until_due(self) -> float:
+        interval = self._settings.meta_capi_flush_interval_seconds
+        if not self._queue:
+            return interval
+        return max(0.0, interval - (time.monotonic() - self._queue[0].enqueued_at))
+
+    async def run(self, stop_event: asyncio.Event | None = None) -> None:
+        stop = stop_event or asyncio.Event()
+        self._wakeup = asyncio.Event()
+        try:
+            while not stop.is_set():
+                waiters = {asyncio.ensure_future(stop.wait()), asyncio.ensure_future(self._wakeup.wait())}
+                _, pending = await asyncio.wait(
+                    waiters, timeout=self._seconds_until_due(), return_when=asyncio.FIRST_COMPLETED
+                )
+                for waiter in pending:
+                    waiter.cancel()
+                self._wakeup.clear()
+                if stop.is_set():
+                    break
+                while len(self._queue) >= self.batch_size or (self._queue and self._seconds_until_due() == 0):
+                    try:
+                        flushed = await self.flush_once()
+                    except Exception as exc:  # noqa: BLE001
+                        logger.error("meta_capi_flush_failed error=%s", str(exc))
+                        break
+                    if not flushed:
+                        # Failed batches are retried on the next window rather than in a tight loop.
+                        break
+        finally:
+            self._wakeup = None
+            # One final pass so a deploy does not silently drop what is buffered.
+            for _ in range(-(-len(self._queue) // self.batch_size)):
+                try:
+                    await self.flush_once()
+                except Exception as exc:  # noqa: BLE001
+                    logger.error("meta_capi_final_flush_failed error=%s", str(exc))
+                    break
+            if self._queue:
+                logger.warning("meta_capi_events_unsent_on_shutdown events=%d", len(self._queue))
+
+    def stats(self) -> dict[str, int | float]:
+        flushes = sorted(self._flush_ms)
+        oldest = self._queue[0].enqueued_at if self._queue else None
+        return {
+            "depth": len(self._queue),
+            "oldest_age_seconds": round(time.monotonic() - oldest, 3) if oldest is not None else 0.0,
+            "enqueued": self.enqueued,
+            "duplicates": self.duplicates,
+            "dropped": self.dropped,
+            "sent": self.sent,
+            "failed": self.failed,
+            "batches": self.batches,
+            "flush_ms_last": round(self.last_flush_ms, 3),
+            "flush_ms_p50": round(flushes[len(flushes) // 2], 3) if flushes else 0.0,
+            "flush_ms_p95": round(flushes[min(len(flushes) - 1, int(len(flushes) * 0.95))], 3) if flushes else 0.0,
+        }
+
+
+META_EVENT_RELAY = MetaEventRelay(get_settings())
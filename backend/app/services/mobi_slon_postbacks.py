@@ -0,0 +1,541 @@
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass
+from datetime import timedelta
+import logging
+import threading
+import time
+from typing import Any, Literal
+import uuid
+
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
+
+from app.core.cache import RecentKeys
+from app.core.config import Settings, get_settings
+from app.core.container import AppContainer, container_for
+from app.core.models.payment import MobiSlonPostback
+from app.core.security import utcnow
+
+logger = logging.getLogger("quiz.mobi_slon")
+
+# (clickid, status) pairs remembered by the relay intake; repeats are answered without touching the queue.
+INTAKE_DEDUP_SIZE = 100_000
+# Matches mobi_slon_postbacks.clickid; longer values are rejected before they reach the intake.
+CLICKID_MAX_LENGTH = 256
+# Errors that reject the rows themselves rather than signal an unavailable database.
+ROW_REJECTION_ERRORS = (DataError, IntegrityError)
+IntakeResult = Literal["queued", "duplicate", "full"]
+
+
+@dataclass(frozen=True)
+class PostbackResult:
+    delivered: bool
+    error: str | None = None
+    # Transport errors, 5xx and 429 mean the tracker itself is unhealthy and feed the circuit breaker.
+    tracker_failure: bool = False
+    # Other 4xx answers will not change on retry.
+    retryable: bool = True
+
+
+def send_postback(
+    container: AppContainer,
+    *,
+    status: str,
+    clickid: str,
+    params: Mapping[str, str] | None,
+    source: str,
+    attempt: int,
+) -> PostbackResult:
+    """One delivery attempt; retries and backoff belong to the queue."""
+    postback_base_url = container.settings.mobi_slon_postback_url.strip()
+    if not postback_base_url:
+        logger.warning("mobi_slon_postback_skipped_missing_url status=%s source=%s", status, source)
+        return PostbackResult(delivered=False, error="postback url is not configured")
+
+    request_params: dict[str, str] = {"cnv_id": clickid, "payout": "0", "cnv_status": status}
+    if params:
+        request_params.update(params)
+    logger.info(
+        "mobi_slon_postback_attempt status=%s clickid=%s attempt=%d source=%s params=%d",
+        status,
+        clickid,
+        attempt,
+        source,
+        len(request_params),
+    )
+    try:
+        response = container.http.client("mobi_slon").post(postback_base_url, params=request_params)
+    except Exception as exc:  # noqa: BLE001
+        logger.warning(
+            "mobi_slon_postback_exception status=%s clickid=%s attempt=%d source=%s error=%s",
+            status,
+            clickid,
+            attempt,
+            source,
+            str(exc),
+        )
+        return PostbackResult(delivered=False, error=f"{exc.__class__.__name__}: {exc}", tracker_failure=True)
+
+    body = response.text[:180].replace("\n", " ")
+    if response.status_code < 400:
+        logger.info(
+            "mobi_slon_postback_sent status=%s clickid=%s attempt=%d source=%s code=%d body=%s",
+            status,
+            clickid,
+            attempt,
+            source,
+            response.status_code,
+            body,
+        )
+        return PostbackResult(delivered=True)
+    logger.warning(
+        "mobi_slon_postback_bad_response status=%s clickid=%s attempt=%d source=%s code=%d body=%s",
+        status,
+        clickid,
+        attempt,
+        source,
+        response.status_code,
+        body,
+    )
+    tracker_failure = response.status_code == 429 or response.status_code >= 500
+    return PostbackResult(
+        delivered=False,
+        error=f"HTTP {response.status_code}",
+        tracker_failure=tracker_failure,
+        retryable=tracker_failure,
+    )
+
+
+def _postback_row(*, clickid: str, status: str, params: Mapping[str, str] | None, source: str) -> dict[str, Any]:
+    now = utcnow()
+    return {
+        "id": str(uuid.uuid4()),
+        "clickid": clickid,
+        "cnv_status": status,
+        "params_json": dict(params or {}),
+        "source": source[:32],
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "created_at": now,
+    }
+
+
+def _insert_postbacks(dialect_name: str, rows: list[dict[str, Any]]) -> Any:
+    upsert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    return (
+        upsert(MobiSlonPostback)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=[MobiSlonPostback.clickid, MobiSlonPostback.cnv_status])
+        .returning(MobiSlonPostback.id)
+    )
+
+
+def enqueue_postback(
+    db: Session,
+    *,
+    clickid: str,
+    status: str,
+    params: Mapping[str, str] | None,
+    source: str,
+) -> bool:
+    """Adds the postback to the caller's transaction; False when (clickid, status) is already queued or sent."""
+    row = _postback_row(clickid=clickid, status=status, params=params, source=source)
+    return db.scalar(_insert_postbacks(db.get_bind().dialect.name, [row])) is not None
+
+
+class PostbackIntake:
+    """Relay-side buffer in front of the queue table, so relay requests never hold a DB connection.
+
+    Submitted postbacks are written by `run()` as one multi-row insert per batch, when a batch fills
+    or after `mobi_slon_intake_flush_interval_seconds`, and once more on shutdown.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        self._settings = settings
+        self._pending: deque[dict[str, Any]] = deque()
+        self._seen = RecentKeys(INTAKE_DEDUP_SIZE)
+        self._session_factory: async_sessionmaker[AsyncSession] | None = None
+        self._wakeup: asyncio.Event | None = None
+        self.accepted = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.written = 0
+        self.write_failures = 0
+        self.rejected = 0
+        self.last_write_ms = 0.0
+
+    def bind(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        self._session_factory = session_factory
+
+    @property
+    def batch_size(self) -> int:
+        return max(1, self._settings.mobi_slon_intake_batch_size)
+
+    def submit(self, *, clickid: str, status: str, params: Mapping[str, str] | None, source: str) -> IntakeResult:
+        key = f"{clickid}:{status}"
+        if key in self._seen:
+            self.duplicates += 1
+            return "duplicate"
+        if len(self._pending) >= self._settings.mobi_slon_intake_queue_size:
+            self.dropped += 1
+            return "full"
+        self._seen.add(key)
+        self._pending.append(_postback_row(clickid=clickid, status=status, params=params, source=source))
+        self.accepted += 1
+        if len(self._pending) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+        return "queued"
+
+    @staticmethod
+    async def _write(session_factory: async_sessionmaker[AsyncSession], rows: list[dict[str, Any]]) -> int:
+        async with session_factory() as db:
+            result = await db.execute(_insert_postbacks(db.get_bind().dialect.name, rows))
+            inserted = len(result.all())
+            await db.commit()
+        return inserted
+
+    async def _write_rows(self, session_factory: async_sessionmaker[AsyncSession], rows: list[dict[str, Any]]) -> int:
+        inserted = 0
+        for index, row in enumerate(rows):
+            try:
+                inserted += await self._write(session_factory, [row])
+            except ROW_REJECTION_ERRORS as exc:
+                self.rejected += 1
+                logger.error(
+                    "mobi_slon_intake_row_rejected clickid=%s status=%s error=%s",
+                    str(row["clickid"])[:64],
+                    row["cnv_status"],
+                    str(exc.orig),
+                )
+            except Exception as exc:  # noqa: BLE001
+                self._pending.extendleft(reversed(rows[index:]))
+                self.write_failures += 1
+                logger.error("mobi_slon_intake_write_failed rows=%d error=%s", len(rows) - index, str(exc))
+                break
+        return inserted
+
+    async def flush_once(self) -> int:
+        """Write up to one batch; returns the number of rows that were new to the queue.
+
+        A batch the database rejects is retried row by row, and the rejected rows are dropped so they
+        cannot block the buffer; on any other error the batch stays buffered for the next attempt.
+        """
+        session_factory = self._session_factory
+        if session_factory is None or not self._pending:
+            return 0
+        batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+        started = time.perf_counter()
+        try:
+            inserted = await self._write(session_factory, batch)
+        except ROW_REJECTION_ERRORS as exc:
+            logger.warning("mobi_slon_intake_batch_rejected rows=%d error=%s", len(batch), str(exc.orig))
+            inserted = await self._write_rows(session_factory, batch)
+        except Exception as exc:  # noqa: BLE001
+            self._pending.extendleft(reversed(batch))
+            self.write_failures += 1
+            logger.error("mobi_slon_intake_write_failed rows=%d error=%s", len(batch), str(exc))
+            return 0
+        self.last_write_ms = (time.perf_counter() - started) * 1000
+        self.written += inserted
+        return inserted
+
+    async def run(self, stop_event: asyncio.Event | None = None) -> None:
+        stop = stop_event or asyncio.Event()
+        self._wakeup = asyncio.Event()
+        try:
+            while not stop.is_set():
+                waiters = {asyncio.ensure_future(stop.wait()), asyncio.ensure_future(self._wakeup.wait())}
+                _, pending = await asyncio.wait(
+                    waiters,
+                    timeout=self._settings.mobi_slon_intake_flush_interval_seconds,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for waiter in pending:
+                    waiter.cancel()
+                self._wakeup.clear()
+                while self._pending and not stop.is_set():
+                    failures = self.write_failures
+                    await self.flush_once()
+                    if self.write_failures != failures:
+                        # The database is unavailable; the batch stays buffered for the next window.
+                        break
+        finally:
+            self._wakeup = None
+            # One final pass so a deploy does not drop accepted postbacks.
+            for _ in range(-(-len(self._pending) // self.batch_size)):
+                await self.flush_once()
+            if self._pending:
+                logger.error("mobi_slon_intake_unwritten_on_shutdown rows=%d", len(self._pending))
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            "depth": len(self._pending),
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+            "dropped": self.dropped,
+            "written": self.written,
+            "write_failures": self.write_failures,
+            "rejected": self.rejected,
+            "write_ms_last": round(self.last_write_ms, 3),
+        }
+
+
+class CircuitBreaker:
+    """Stops deliveries after `failure_threshold` consecutive tracker failures.
+
+    After `cooldown_seconds` one probe is let through (half-open); its outcome closes or reopens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int, cooldown_seconds: float) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown_seconds = cooldown_seconds
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._probing or time.monotonic() - self._opened_at >= self.cooldown_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.cooldown_seconds:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("mobi_slon_circuit_closed")
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._probing or (self._opened_at is None and self._consecutive_failures >= self.failure_threshold):
+                if self._opened_at is None:
+                    self.opened += 1
+                logger.warning(
+                    "mobi_slon_circuit_open consecutive_failures=%d cooldown_seconds=%.1f",
+                    self._consecutive_failures,
+                    self.cooldown_seconds,
+                )
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def stats(self) -> dict[str, str | int]:
+        return {"state": self.state, "consecutive_failures": self._consecutive_failures, "opened": self.opened}
+
+
+MOBI_SLON_BREAKER = CircuitBreaker(
+    get_settings().mobi_slon_breaker_failure_threshold,
+    get_settings().mobi_slon_breaker_cooldown_seconds,
+)
+
+
+POSTBACK_INTAKE = PostbackIntake(get_settings())
+
+
+def postback_stats(db: Session) -> dict[str, Any]:
+    rows = db.execute(
+        select(MobiSlonPostback.status, func.count(MobiSlonPostback.id)).group_by(MobiSlonPostback.status)
+    ).all()
+    counts = {status: int(count) for status, count in rows}
+    oldest_pending = db.scalar(select(func.min(MobiSlonPostback.created_at)).where(MobiSlonPostback.status == "pending"))
+    lag_seconds: float | None = None
+    if oldest_pending is not None:
+        if oldest_pending.tzinfo is None:
+            oldest_pending = oldest_pending.replace(tzinfo=utcnow().tzinfo)
+        lag_seconds = round((utcnow() - oldest_pending).total_seconds(), 3)
+    return {
+        "pending": counts.get("pending", 0),
+        "sent": counts.get("sent", 0),
+        "dead": counts.get("dead", 0),
+        "lag_seconds": lag_seconds,
+        "intake": POSTBACK_INTAKE.stats(),
+        "circuit": MOBI_SLON_BREAKER.stats(),
+    }
+
+
+def requeue_dead_postbacks(db: Session, *, clickid: str | None = None) -> int:
+    statement = (
+        update(MobiSlonPostback)
+        .where(MobiSlonPostback.status == "dead")
+        .values(status="pending", attempts=0, next_attempt_at=utcnow())
+    )
+    if clickid:
+        statement = statement.where(MobiSlonPostback.clickid == clickid)
+    result = db.execute(statement)
+    db.commit()
+    return int(getattr(result, "rowcount", 0) or 0)
+
+
+class MobiSlonPostbackWorker:
+    """Delivers queued postbacks with exponential backoff; pauses while the tracker's circuit is open."""
+
+    def __init__(
+        self,
+        settings: Settings,
+        session_factory: Callable[[], Session],
+        *,
+        breaker: CircuitBreaker = MOBI_SLON_BREAKER,
+    ) -> None:
+        self._settings = settings
+        self._session_factory = session_factory
+        self._breaker = breaker
+        self._semaphore = asyncio.Semaphore(max(1, settings.mobi_slon_concurrency))
+
+    def _due_ids(self, limit: int) -> list[str]:
+        with self._session_factory() as db:
+            return list(
+                db.scalars(
+                    select(MobiSlonPostback.id)
+                    .where(MobiSlonPostback.status == "pending", MobiSlonPostback.next_attempt_at <= utcnow())
+                    .order_by(MobiSlonPostback.next_attempt_at)
+                    .limit(limit)
+                ).all()
+            )
+
+    def _backoff_seconds(self, attempts: int) -> float:
+        delay = self._settings.mobi_slon_backoff_base_seconds * (2 ** max(0, attempts - 1))
+        return min(delay, self._settings.mobi_slon_backoff_max_seconds)
+
+    def _claim(self, postback_id: str) -> dict[str, Any] | None:
+        # The lease pushes next_attempt_at forward and commits, so no other worker picks the row up
+        # while the request is in flight; if this worker dies, the row is due again once it expires.
+        with self._session_factory() as db:
+            now = utcnow()
+            postback = db.scalar(
+                select(MobiSlonPostback)
+                .where(
+                    MobiSlonPostback.id == postback_id,
+                    MobiSlonPostback.status == "pending",
+                    MobiSlonPostback.next_attempt_at <= now,
+                )
+                .with_for_update(skip_locked=True)
+            )
+            if postback is None or not self._breaker.allow():
+                db.rollback()
+                return None
+            postback.next_attempt_at = now + timedelta(seconds=self._settings.mobi_slon_claim_lease_seconds)
+            claimed = {
+                "status": postback.cnv_status,
+                "clickid": postback.clickid,
+                "params": dict(postback.params_json or {}),
+                "source": postback.source,
+                "attempt": postback.attempts + 1,
+            }
+            db.commit()
+            return claimed
+
+    def deliver(self, postback_id: str) -> str | None:
+        claimed = self._claim(postback_id)
+        if claimed is None:
+            return None
+
+        # No transaction is open during the request: a slow tracker must not pin pool connections or row locks.
+        result = send_postback(container_for(self._settings), **claimed)
+        # Any answer other than an outage (including a rejected postback) proves the tracker is reachable.
+        if result.tracker_failure:
+            self._breaker.record_failure()
+        else:
+            self._breaker.record_success()
+
+        with self._session_factory() as db:
+            postback = db.scalar(
+                select(MobiSlonPostback)
+                .where(MobiSlonPostback.id == postback_id, MobiSlonPostback.status == "pending")
+                .with_for_update()
+            )
+            if postback is None:
+                db.rollback()
+                return None
+            postback.attempts += 1
+            if result.delivered:
+                postback.status = "sent"
+                postback.sent_at = utcnow()
+                postback.last_error = None
+            else:
+                postback.last_error = (result.error or "unknown")[:512]
+                if not result.retryable or postback.attempts >= self._settings.mobi_slon_max_attempts:
+                    postback.status = "dead"
+                    logger.error(
+                        "mobi_slon_postback_failed status=%s clickid=%s source=%s attempts=%d error=%s",
+                        postback.cnv_status,
+                        postback.clickid,
+                        postback.source,
+                        postback.attempts,
+                        postback.last_error,
+                    )
+                else:
+                    postback.next_attempt_at = utcnow() + timedelta(seconds=self._backoff_seconds(postback.attempts))
+            db.commit()
+            return postback.status
+
+    async def _deliver_bounded(self, postback_id: str) -> str | None:
+        async with self._semaphore:
+            return await asyncio.to_thread(self.deliver, postback_id)
+
+    async def drain_once(self) -> int:
+        state = self._breaker.state
+        if state == "open":
+            return 0
+        # A half-open circuit gets a single probe, not a whole batch against a tracker that may still be down.
+        limit = 1 if state == "half_open" else self._settings.mobi_slon_batch_size
+        due_ids = await asyncio.to_thread(self._due_ids, limit)
+        if not due_ids:
+            return 0
+        results = await asyncio.gather(*(self._deliver_bounded(postback_id) for postback_id in due_ids), return_exceptions=True)
+        sent = 0
+        for postback_id, result in zip(due_ids, results):
+            if isinstance(result, BaseException):
+                logger.error("mobi_slon_worker_error postback_id=%s error=%s", postback_id, str(result))
+            elif result == "sent":
+                sent += 1
+        return sent
+
+    async def run(self, stop_event: asyncio.Event | None = None) -> None:
+        stop = stop_event or asyncio.Event()
+        logger.info(
+            "mobi_slon_worker_started concurrency=%d batch_size=%d",
+            self._settings.mobi_slon_concurrency,
+            self._settings.mobi_slon_batch_size,
+        )
+        while not stop.is_set():
+            try:
+                sent = await self.drain_once()
+            except Exception as exc:  # noqa: BLE001
+                logger.error("mobi_slon_worker_drain_failed error=%s", str(exc))
+                sent = 0
+            if sent:
+                continue
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self._settings.mobi_slon_poll_interval_seconds)
+            except TimeoutError:
+                pass
+        logger.info("mobi_slon_worker_stopped")
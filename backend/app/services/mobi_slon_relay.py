@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import logging
+from typing import Literal, Mapping
+
+from fastapi import HTTPException
+
+from app.core.config import Settings
+from app.services.mobi_slon_postbacks import CLICKID_MAX_LENGTH, POSTBACK_INTAKE, PostbackIntake
+from app.services.payment_service import PaymentService
+
+logger = logging.getLogger("quiz.payments")
+
+
+def relay_mobi_slon_event(
+    settings: Settings,
+    *,
+    status: str,
+    clickid: str,
+    tracking_params: Mapping[str, str] | None,
+    session_id: str | None,
+    page_path: str | None,
+    intake: PostbackIntake = POSTBACK_INTAKE,
+) -> Literal["queued", "duplicate", "skipped"]:
+    """Validates a browser funnel event and hands it to the postback intake; never opens a DB connection."""
+    normalized_status = PaymentService.normalize_postback_status(status)
+    sanitized_clickid = PaymentService.sanitize_clickid(clickid.strip())
+    if not sanitized_clickid or len(sanitized_clickid) > CLICKID_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail="Invalid clickid")
+
+    if normalized_status == "pay_success":
+        logger.warning("mobi_slon_relay_skipped status=%s source=frontend_relay reason=reserved_server_side", normalized_status)
+        return "skipped"
+
+    safe_params = PaymentService.sanitize_tracking_params(tracking_params)
+    logger.info(
+        "mobi_slon_relay_request status=%s clickid=%s session_id=%s page_path=%s params=%d",
+        normalized_status,
+        sanitized_clickid,
+        (session_id or "").strip()[:128],
+        (page_path or "").strip()[:180],
+        len(safe_params),
+    )
+    if not settings.mobi_slon_postback_url.strip():
+        logger.warning("mobi_slon_postback_skipped_missing_url status=%s source=frontend_relay", normalized_status)
+        return "skipped"
+    result = intake.submit(clickid=sanitized_clickid, status=normalized_status, params=safe_params, source="frontend_relay")
+    if result == "full":
+        logger.error("mobi_slon_intake_full status=%s clickid=%s", normalized_status, sanitized_clickid)
+        raise HTTPException(status_code=503, detail="Tracking queue is full")
+    return result
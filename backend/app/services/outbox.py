@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable
+import logging
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import Settings
+from app.core.models.payment import OutboxMessage
+from app.core.security import utcnow
+from app.services.payment_service import PaymentService
+
+logger = logging.getLogger("quiz.outbox")
+
+
+def outbox_stats(db: Session) -> dict[str, int]:
+    rows = db.execute(select(OutboxMessage.status, func.count(OutboxMessage.id)).group_by(OutboxMessage.status)).all()
+    counts = {status: int(count) for status, count in rows}
+    return {"pending": counts.get("pending", 0), "sent": counts.get("sent", 0), "dead": counts.get("dead", 0)}
+
+
+def requeue_dead_messages(db: Session, *, order_id: str | None = None) -> int:
+    statement = (
+        update(OutboxMessage)
+        .where(OutboxMessage.status == "dead")
+        .values(status="pending", attempts=0, next_attempt_at=utcnow())
+    )
+    if order_id:
+        statement = statement.where(OutboxMessage.order_id == order_id)
+    result = db.execute(statement)
+    db.commit()
+    return int(getattr(result, "rowcount", 0) or 0)
+
+
+class OutboxDispatcher:
+    """Delivers fulfillment side effects recorded by PaymentService with retry/backoff."""
+
+    def __init__(self, settings: Settings, session_factory: Callable[[], Session]) -> None:
+        self._settings = settings
+        self._session_factory = session_factory
+        self._semaphore = asyncio.Semaphore(max(1, settings.outbox_concurrency))
+
+    def _due_ids(self) -> list[str]:
+        with self._session_factory() as db:
+            return list(
+                db.scalars(
+                    select(OutboxMessage.id)
+                    .where(OutboxMessage.status == "pending", OutboxMessage.next_attempt_at <= utcnow())
+                    .order_by(OutboxMessage.next_attempt_at)
+                    .limit(self._settings.outbox_batch_size)
+                ).all()
+            )
+
+    def _deliver(self, message_id: str) -> str | None:
+        with self._session_factory() as db:
+            return PaymentService(self._settings, db).deliver_outbox_message(message_id)
+
+    async def _deliver_bounded(self, message_id: str) -> str | None:
+        async with self._semaphore:
+            return await asyncio.to_thread(self._deliver, message_id)
+
+    async def drain_once(self) -> int:
+        due_ids = await asyncio.to_thread(self._due_ids)
+        if not due_ids:
+            return 0
+        results = await asyncio.gather(*(self._deliver_bounded(message_id) for message_id in due_ids), return_exceptions=True)
+        sent = 0
+        for message_id, result in zip(due_ids, results):
+            if isinstance(result, BaseException):
+                logger.error("outbox_worker_error message_id=%s error=%s", message_id, str(result))
+            elif result == "sent":
+                sent += 1
+        return sent
+
+    async def run(self, stop_event: asyncio.Event | None = None) -> None:
+        stop = stop_event or asyncio.Event()
+        logger.info(
+            "outbox_worker_started concurrency=%d batch_size=%d",
+            self._settings.outbox_concurrency,
+            self._settings.outbox_batch_size,
+        )
+        while not stop.is_set():
+            try:
+                sent = await self.drain_once()
+            except Exception as exc:  # noqa: BLE001
+                logger.error("outbox_worker_drain_failed error=%s", str(exc))
+                sent = 0
+            if sent:
+                continue
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self._settings.outbox_poll_interval_seconds)
+            except TimeoutError:
+                pass
+        logger.info("outbox_worker_stopped")
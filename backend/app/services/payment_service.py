@@ -3,34 +3,58 @@ from __future__ import annotations
 from datetime import datetime, timedelta, timezone
 import logging
 import re
+import uuid
 from typing import Any, Literal, Mapping, cast
 
-import httpx
 import stripe
 from fastapi import HTTPException
-from sqlalchemy import desc, select
+from sqlalchemy import desc, insert, select, text
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 
-from app.core.config import Settings, get_plan_map
+from app.core.cache import RecentKeys
+from app.core.config import Settings, get_settings
+from app.core.container import AppContainer, container_for
+from app.core.event_storage import HANDLED_EVENT_TYPES, compress_raw_body, project_event
 from app.core.mobi_slon_events import MOBI_SLON_EVENT_SET
-from app.core.models.payment import AccessBinding, AccessToken, Order, PaymentEvent, RestoreOTP
-from app.core.notifications import TelegramSender, build_email_sender
+from app.core.models.payment import (
+    ORDER_STATUSES,
+    AccessBinding,
+    AccessToken,
+    Order,
+    OutboxMessage,
+    PaymentEvent,
+    PaymentEventKey,
+    RestoreOTP,
+    is_uuid,
+)
 from app.core.security import generate_otp, hash_value, make_access_token, mask_email, parse_access_token, utcnow
+from app.services.entitlements import (
+    AccessState,
+    cached_access_state,
+    cached_access_states,
+    refresh_order_entitlements,
+)
+from app.services.mobi_slon_postbacks import enqueue_postback
 
 logger = logging.getLogger("quiz.payments")
 SAFE_CLICK_ID_RE = re.compile(r"[^a-zA-Z0-9_.-]")
 SAFE_STATUS_RE = re.compile(r"^[a-z0-9_]{1,64}$")
 SAFE_PARAM_KEY_RE = re.compile(r"^[a-zA-Z0-9_.-]{1,64}$")
+FULFILLMENT_OUTBOX_KINDS = frozenset({"access_email", "telegram_activation"})
+# Stripe replays bursts of the same event ids; answer those from memory before touching the database.
+RECENT_WEBHOOK_EVENT_IDS = RecentKeys(get_settings().webhook_dedup_cache_size)
 
 
 class PaymentService:
-    def __init__(self, settings: Settings, db: Session) -> None:
-        self.settings = settings
+    def __init__(self, settings: Settings, db: Session, *, container: AppContainer | None = None) -> None:
+        container = container or container_for(settings)
+        self.settings = container.settings
         self.db = db
-        self.plan_map = get_plan_map(settings)
-        self.email_sender = build_email_sender(settings)
-        self.telegram_sender = TelegramSender(settings)
-        stripe.api_key = settings.stripe_secret_key
+        self.plan_map = container.plan_map
+        self.email_sender = container.email_sender
+        self.telegram_sender = container.telegram_sender
+        self.http = container.http
 
     @staticmethod
     def sanitize_clickid(raw_clickid: str) -> str:
@@ -166,6 +190,7 @@ class PaymentService:
 
         try:
             session = stripe.checkout.Session.create(
+                api_key=self.settings.stripe_secret_key,
                 mode=stripe_mode,
                 line_items=cast(list[Any], [line_item]),
                 success_url=self._build_success_url(),
@@ -184,6 +209,7 @@ class PaymentService:
 
         order.stripe_session_id = session.id
         order.status = "session_created"
+        refresh_order_entitlements(self.db, order)
         self.db.commit()
         return checkout_url, session.id, order.id
 
@@ -220,6 +246,7 @@ class PaymentService:
 
         try:
             session = stripe.billing_portal.Session.create(
+                api_key=self.settings.stripe_secret_key,
                 customer=order.stripe_customer_id,
                 return_url=self.settings.resolved_pay_portal_return_url,
             )
@@ -227,7 +254,7 @@ class PaymentService:
             raise HTTPException(status_code=502, detail=f"Stripe error: {exc}") from exc
         return session.url
 
-    def handle_webhook(self, payload: bytes, signature: str | None) -> dict[str, bool]:
+    def verify_webhook_event(self, payload: bytes, signature: str | None) -> dict[str, Any]:
         if not signature:
             raise HTTPException(status_code=400, detail="Missing stripe-signature")
 
@@ -235,28 +262,204 @@ class PaymentService:
             event = stripe.Webhook.construct_event(payload, signature, self.settings.stripe_webhook_secret)
         except Exception as exc:
             raise HTTPException(status_code=400, detail=f"Invalid webhook: {exc}") from exc
+        return cast(dict[str, Any], event)
 
+    def handle_webhook(self, payload: bytes, signature: str | None) -> dict[str, bool]:
+        event = self.verify_webhook_event(payload, signature)
         event_id = event["id"]
         event_type = event["type"]
-        logger.info("stripe_webhook_received event_id=%s event_type=%s", event_id, event_type)
-        existing = self.db.scalar(select(PaymentEvent).where(PaymentEvent.stripe_event_id == event_id))
-        if existing is not None:
-            logger.info("stripe_webhook_duplicate event_id=%s event_type=%s", event_id, event_type)
-            return {"ok": True, "duplicate": True}
+        if event_type not in HANDLED_EVENT_TYPES:
+            return self._acknowledge_ignored_event(event_id, event_type)
+        if self.settings.normalized_stripe_webhook_mode == "inbox":
+            return self.enqueue_webhook_event(event, raw_body=payload)
 
-        payment_event = PaymentEvent(
+        partition_key = self.webhook_partition_key(event)
+        logger.info("stripe_webhook_received event_id=%s event_type=%s", event_id, event_type)
+        if event_id in RECENT_WEBHOOK_EVENT_IDS or not self._insert_payment_event(
             stripe_event_id=event_id,
             event_type=event_type,
-            payload_json=event,
+            partition_key=partition_key,
             process_result="processed",
+            processed_at=utcnow(),
+            **self._stored_event_payload(event, payload),
+        ):
+            return self._webhook_duplicate(event_id, event_type)
+
+        self._lock_partition(partition_key)
+        self._apply_webhook_event(event)
+
+        self.db.commit()
+        RECENT_WEBHOOK_EVENT_IDS.add(event_id)
+        logger.info("stripe_webhook_processed event_id=%s event_type=%s", event_id, event_type)
+        return {"ok": True, "duplicate": False}
+
+    def enqueue_webhook_event(self, event: Mapping[str, Any], *, raw_body: bytes | None = None) -> dict[str, bool]:
+        event_id = event["id"]
+        event_type = event["type"]
+        if event_id in RECENT_WEBHOOK_EVENT_IDS or not self._insert_payment_event(
+            stripe_event_id=event_id,
+            event_type=event_type,
+            partition_key=self.webhook_partition_key(event),
+            process_result="pending",
+            processed_at=None,
+            **self._stored_event_payload(event, raw_body),
+        ):
+            return self._webhook_duplicate(event_id, event_type)
+
+        self.db.commit()
+        RECENT_WEBHOOK_EVENT_IDS.add(event_id)
+        logger.info("stripe_webhook_enqueued event_id=%s event_type=%s", event_id, event_type)
+        return {"ok": True, "duplicate": False}
+
+    def _acknowledge_ignored_event(self, event_id: str, event_type: str) -> dict[str, bool]:
+        # Unhandled types never reach the handlers: store at most a bare id row and skip payload work.
+        logger.info("stripe_event_ignored event_id=%s event_type=%s", event_id, event_type)
+        if event_id in RECENT_WEBHOOK_EVENT_IDS:
+            return self._webhook_duplicate(event_id, event_type)
+        if not self.settings.payment_event_record_ignored:
+            return {"ok": True, "duplicate": False}
+        inserted = self._insert_payment_event(
+            stripe_event_id=event_id,
+            event_type=event_type,
+            payload_json={},
+            process_result="ignored",
+            processed_at=utcnow(),
         )
-        self.db.add(payment_event)
+        self.db.commit()
+        if not inserted:
+            return self._webhook_duplicate(event_id, event_type)
+        RECENT_WEBHOOK_EVENT_IDS.add(event_id)
+        return {"ok": True, "duplicate": False}
+
+    def _stored_event_payload(self, event: Mapping[str, Any], raw_body: bytes | None) -> dict[str, Any]:
+        if self.settings.normalized_payment_event_storage_policy == "full":
+            payload_json: dict[str, Any] = dict(event)
+        else:
+            payload_json = project_event(event)
+        raw_body_compressed: bytes | None = None
+        if self.settings.payment_event_keep_raw_body and raw_body:
+            raw_body_compressed = compress_raw_body(raw_body)
+        return {"payload_json": payload_json, "raw_body_compressed": raw_body_compressed}
+
+    def _webhook_duplicate(self, event_id: str, event_type: str) -> dict[str, bool]:
+        RECENT_WEBHOOK_EVENT_IDS.add(event_id)
+        logger.info("stripe_webhook_duplicate event_id=%s event_type=%s", event_id, event_type)
+        return {"ok": True, "duplicate": True}
+
+    def _insert_payment_event(self, **values: Any) -> bool:
+        # Single atomic insert-or-detect on the unpartitioned key table: concurrent redeliveries
+        # resolve to "duplicate" instead of surfacing a unique-constraint error.
+        received_at = utcnow()
+        dialect_name = self.db.get_bind().dialect.name
+        upsert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+        claim = (
+            upsert(PaymentEventKey)
+            .values(stripe_event_id=values["stripe_event_id"], received_at=received_at)
+            .on_conflict_do_nothing(index_elements=[PaymentEventKey.stripe_event_id])
+            .returning(PaymentEventKey.stripe_event_id)
+        )
+        if self.db.scalar(claim) is None:
+            return False
+        self.db.execute(insert(PaymentEvent).values(id=str(uuid.uuid4()), received_at=received_at, attempts=0, **values))
+        return True
 
+    @staticmethod
+    def webhook_partition_key(event: Mapping[str, Any]) -> str:
+        # Events touching the same order must apply in order. Customer id is the one key present on
+        # checkout sessions, invoices and subscriptions alike, so it is preferred over narrower ids.
+        obj = (event.get("data") or {}).get("object") or {}
+        event_type = str(event.get("type") or "")
+        candidates: list[Any] = [obj.get("customer")]
+        if event_type.startswith("customer.subscription."):
+            candidates.append(obj.get("id"))
+        candidates.append(obj.get("subscription"))
+        candidates.append((obj.get("metadata") or {}).get("order_id"))
+        candidates.append(obj.get("id"))
+        for candidate in candidates:
+            if candidate:
+                return str(candidate)[:128]
+        return str(event.get("id"))[:128]
+
+    def _lock_partition(self, partition_key: str) -> None:
+        # Transaction-scoped advisory lock serializes same-order events across backend processes.
+        if self.db.get_bind().dialect.name != "postgresql":
+            return
+        self.db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": f"stripe:{partition_key}"})
+
+    def process_inbox_event(self, payment_event_id: str) -> str | None:
+        # SKIP LOCKED lets several inbox workers drain the same table without double-processing a row.
+        payment_event = self.db.scalar(
+            select(PaymentEvent)
+            .where(PaymentEvent.id == payment_event_id, PaymentEvent.process_result == "pending")
+            .with_for_update(skip_locked=True)
+        )
+        if payment_event is None:
+            self.db.rollback()
+            return None
+
+        if payment_event.partition_key:
+            self._lock_partition(payment_event.partition_key)
+            earlier_pending = self.db.scalar(
+                select(PaymentEvent.id)
+                .where(
+                    PaymentEvent.partition_key == payment_event.partition_key,
+                    PaymentEvent.process_result == "pending",
+                    PaymentEvent.received_at < payment_event.received_at,
+                )
+                .limit(1)
+            )
+            if earlier_pending is not None:
+                self.db.rollback()
+                return "deferred"
+
+        event = payment_event.payload_json
+        event_id = payment_event.stripe_event_id
+        event_type = payment_event.event_type
+        try:
+            self._apply_webhook_event(event)
+            payment_event.process_result = "processed"
+            payment_event.attempts += 1
+            payment_event.last_error = None
+            payment_event.processed_at = utcnow()
+            self.db.commit()
+        except Exception as exc:  # noqa: BLE001
+            self.db.rollback()
+            payment_event = self.db.scalar(select(PaymentEvent).where(PaymentEvent.id == payment_event_id))
+            if payment_event is None:
+                return None
+            payment_event.attempts += 1
+            payment_event.last_error = str(exc)[:512]
+            if payment_event.attempts >= self.settings.webhook_inbox_max_attempts:
+                payment_event.process_result = "failed"
+                payment_event.processed_at = utcnow()
+            else:
+                payment_event.next_attempt_at = utcnow() + timedelta(
+                    seconds=self._inbox_backoff_seconds(payment_event.attempts)
+                )
+            self.db.commit()
+            logger.warning(
+                "stripe_inbox_event_failed event_id=%s event_type=%s attempts=%d result=%s error=%s",
+                event_id,
+                event_type,
+                payment_event.attempts,
+                payment_event.process_result,
+                str(exc),
+            )
+            return payment_event.process_result
+
+        logger.info("stripe_webhook_processed event_id=%s event_type=%s source=inbox", event_id, event_type)
+        return "processed"
+
+    def _inbox_backoff_seconds(self, attempts: int) -> float:
+        delay = self.settings.webhook_inbox_backoff_base_seconds * (2 ** max(0, attempts - 1))
+        return min(delay, self.settings.webhook_inbox_backoff_max_seconds)
+
+    def _apply_webhook_event(self, event: Mapping[str, Any]) -> None:
+        event_type = event["type"]
         obj = event["data"]["object"]
-        postback_clickid: str | None = None
 
         if event_type == "checkout.session.completed":
-            postback_clickid = self._on_checkout_session_completed(obj)
+            self._on_checkout_session_completed(obj)
         elif event_type == "checkout.session.expired":
             self._update_order_status_by_session(obj.get("id"), status="expired")
         elif event_type == "payment_intent.payment_failed":
@@ -303,50 +506,121 @@ class PaymentService:
         else:
             logger.info("stripe_event_ignored event_type=%s", event_type)
 
+    def deliver_outbox_message(self, message_id: str) -> str | None:
+        message = self.db.scalar(
+            select(OutboxMessage)
+            .where(OutboxMessage.id == message_id, OutboxMessage.status == "pending")
+            .with_for_update(skip_locked=True)
+        )
+        if message is None:
+            self.db.rollback()
+            return None
+
+        error: str | None = None
+        try:
+            delivered = self._deliver_outbox_payload(message)
+            if not delivered:
+                error = "delivery rejected"
+        except Exception as exc:  # noqa: BLE001
+            delivered = False
+            error = str(exc)
+
+        message.attempts += 1
+        if delivered:
+            message.status = "sent"
+            message.sent_at = utcnow()
+            message.last_error = None
+        else:
+            message.last_error = (error or "unknown")[:512]
+            if message.attempts >= self.settings.outbox_max_attempts:
+                message.status = "dead"
+                logger.error(
+                    "outbox_message_dead message_id=%s kind=%s order_id=%s attempts=%d error=%s",
+                    message.id,
+                    message.kind,
+                    message.order_id,
+                    message.attempts,
+                    message.last_error,
+                )
+            else:
+                message.next_attempt_at = utcnow() + timedelta(seconds=self._outbox_backoff_seconds(message.attempts))
+                logger.warning(
+                    "outbox_delivery_failed message_id=%s kind=%s order_id=%s attempt=%d error=%s",
+                    message.id,
+                    message.kind,
+                    message.order_id,
+                    message.attempts,
+                    message.last_error,
+                )
+
+        if message.kind in FULFILLMENT_OUTBOX_KINDS:
+            self._refresh_fulfillment_status(message.order_id)
         self.db.commit()
-        logger.info("stripe_webhook_processed event_id=%s event_type=%s", event_id, event_type)
-        if event_type == "checkout.session.completed" and postback_clickid:
-            self._send_mobi_slon_postback(
-                status="pay_success",
-                clickid=postback_clickid,
-                extra_params={"payout": self._subscription_payout()},
-                source="stripe_webhook",
+        return message.status
+
+    def _outbox_backoff_seconds(self, attempts: int) -> float:
+        delay = self.settings.outbox_backoff_base_seconds * (2 ** max(0, attempts - 1))
+        return min(delay, self.settings.outbox_backoff_max_seconds)
+
+    def _enqueue_outbox(self, *, kind: str, order_id: str, payload: dict[str, Any]) -> None:
+        self.db.add(
+            OutboxMessage(
+                kind=kind,
+                order_id=order_id,
+                payload_json=payload,
+                status="pending",
+                next_attempt_at=utcnow(),
             )
-        return {"ok": True, "duplicate": False}
+        )
 
-    def relay_mobi_slon_event(
-        self,
-        *,
-        status: str,
-        clickid: str,
-        tracking_params: Mapping[str, str] | None,
-        session_id: str | None,
-        page_path: str | None,
-    ) -> bool:
-        normalized_status = self.normalize_postback_status(status)
-        sanitized_clickid = self.sanitize_clickid(clickid.strip())
-        if not sanitized_clickid:
-            raise HTTPException(status_code=400, detail="Invalid clickid")
+    def _deliver_outbox_payload(self, message: OutboxMessage) -> bool:
+        payload = message.payload_json
+        if message.kind == "mobi_slon_postback":
+            # Recorded before the postback queue existed; hand it over so it gets the queue's dedupe and backoff.
+            enqueue_postback(
+                self.db,
+                clickid=payload["clickid"],
+                status=payload["status"],
+                params=payload.get("extra_params"),
+                source=payload.get("source", "outbox"),
+            )
+            return True
 
-        if normalized_status == "pay_success":
-            logger.warning("mobi_slon_relay_skipped status=%s source=frontend_relay reason=reserved_server_side", normalized_status)
-            return False
+        order = self.db.scalar(select(Order).where(Order.id == message.order_id))
+        if order is None:
+            raise RuntimeError("Order not found")
+        # Only the token id is persisted in the outbox; the signed value is rebuilt at delivery time.
+        token_value = make_access_token(payload["token_id"], self.settings.access_token_secret)
 
-        safe_params = self.sanitize_tracking_params(tracking_params)
-        logger.info(
-            "mobi_slon_relay_request status=%s clickid=%s session_id=%s page_path=%s params=%d",
-            normalized_status,
-            sanitized_clickid,
-            (session_id or "").strip()[:128],
-            (page_path or "").strip()[:180],
-            len(safe_params),
-        )
-        return self._send_mobi_slon_postback(
-            status=normalized_status,
-            clickid=sanitized_clickid,
-            extra_params=safe_params,
-            source="frontend_relay",
-        )
+        if message.kind == "access_email":
+            self.email_sender.send_access_email(
+                email=order.email,
+                order_id=order.id,
+                activation_link=self.telegram_sender.build_deep_link(token_value),
+                locale=order.locale,
+            )
+            return True
+        if message.kind == "telegram_activation":
+            if not order.telegram_chat_id:
+                return True
+            return self.telegram_sender.send_activation_message(chat_id=order.telegram_chat_id, token=token_value)
+        raise RuntimeError(f"Unknown outbox kind: {message.kind}")
+
+    def _refresh_fulfillment_status(self, order_id: str) -> None:
+        self.db.flush()
+        statuses = self.db.execute(
+            select(OutboxMessage.status, OutboxMessage.attempts).where(
+                OutboxMessage.order_id == order_id,
+                OutboxMessage.kind.in_(FULFILLMENT_OUTBOX_KINDS),
+            )
+        ).all()
+        order = self.db.scalar(select(Order).where(Order.id == order_id))
+        if order is None or not statuses:
+            return
+        if all(status == "sent" for status, _ in statuses):
+            order.fulfillment_status = "done"
+        elif any(status == "dead" or (status == "pending" and attempts > 0) for status, attempts in statuses):
+            order.fulfillment_status = "partial"
 
     def activate_access(self, *, activation_token: str, telegram_user_id: str) -> dict[str, str | bool]:
         token_id = parse_access_token(activation_token, self.settings.access_token_secret)
@@ -359,7 +633,10 @@ class PaymentService:
             )
             raise HTTPException(status_code=400, detail="Invalid activation token")
 
-        token = self.db.scalar(select(AccessToken).where(AccessToken.id == token_id))
+        row = self.db.execute(
+            select(AccessToken, Order).outerjoin(Order, Order.id == AccessToken.order_id).where(AccessToken.id == token_id)
+        ).first()
+        token, order = (row[0], row[1]) if row is not None else (None, None)
         if token is None or token.status != "issued":
             logger.warning(
                 "activate_access_token_not_issued user=%s token_id=%s token_exists=%s token_status=%s",
@@ -370,11 +647,16 @@ class PaymentService:
             )
             raise HTTPException(status_code=400, detail="Activation token is not active")
 
-        order = self.db.scalar(select(Order).where(Order.id == token.order_id))
         if order is None:
             logger.warning("activate_access_order_not_found user=%s token_id=%s order_id=%s", telegram_user_id, token_id, token.order_id)
             raise HTTPException(status_code=404, detail="Order not found")
 
+        self._grant_access(token, order, telegram_user_id)
+        self.db.commit()
+        logger.info("activate_access_success user=%s order_id=%s plan=%s", telegram_user_id, order.id, order.plan)
+        return {"access_granted": True, "order_id": order.id, "plan": order.plan, "status": order.status}
+
+    def _grant_access(self, token: AccessToken, order: Order, telegram_user_id: str) -> None:
         token.status = "activated"
         token.activated_at = utcnow()
         order.access_status = "active"
@@ -389,9 +671,7 @@ class PaymentService:
             binding.status = "active"
             logger.info("activate_access_binding_reactivated user=%s order_id=%s", telegram_user_id, order.id)
 
-        self.db.commit()
-        logger.info("activate_access_success user=%s order_id=%s plan=%s", telegram_user_id, order.id, order.plan)
-        return {"access_granted": True, "order_id": order.id, "plan": order.plan, "status": order.status}
+        refresh_order_entitlements(self.db, order)
 
     def restore_request(self, *, email: str) -> dict[str, str]:
         one_hour_ago = utcnow() - timedelta(hours=1)
@@ -474,7 +754,8 @@ class PaymentService:
         token_value = make_access_token(new_token.id, self.settings.access_token_secret)
         activation_link = self.telegram_sender.build_deep_link(token_value)
         if telegram_user_id:
-            self.activate_access(activation_token=token_value, telegram_user_id=telegram_user_id)
+            # The token was issued a line above: grant directly instead of re-parsing and re-loading it.
+            self._grant_access(new_token, order, telegram_user_id)
 
         self.db.commit()
         return {
@@ -483,65 +764,39 @@ class PaymentService:
             "access_granted": bool(telegram_user_id),
         }
 
-    def get_access_status_by_telegram_user(self, telegram_user_id: str) -> dict[str, str | bool | None]:
-        active_binding = self.db.scalar(
-            select(AccessBinding)
-            .where(AccessBinding.telegram_user_id == telegram_user_id, AccessBinding.status == "active")
-            .order_by(desc(AccessBinding.bound_at))
-        )
-        if active_binding is not None:
-            order = self.db.scalar(select(Order).where(Order.id == active_binding.order_id))
-            if order is not None:
-                return {
-                    "is_paid": order.access_status == "active" or order.status in {"paid", "active"},
-                    "order_id": order.id,
-                    "plan": order.plan,
-                    "access_status": order.access_status,
-                }
-
-        latest_binding = self.db.scalar(
-            select(AccessBinding).where(AccessBinding.telegram_user_id == telegram_user_id).order_by(desc(AccessBinding.bound_at))
-        )
-        if latest_binding is not None:
-            order = self.db.scalar(select(Order).where(Order.id == latest_binding.order_id))
-            if order is not None:
-                return {
-                    "is_paid": False,
-                    "order_id": order.id,
-                    "plan": order.plan,
-                    "access_status": order.access_status,
-                }
-
-        fallback_order = self.db.scalar(
-            select(Order)
-            .where(Order.telegram_chat_id == telegram_user_id)
-            .order_by(desc(Order.updated_at))
-        )
-        if fallback_order is None:
-            return {"is_paid": False, "order_id": None, "plan": None, "access_status": None}
-
+    @staticmethod
+    def access_status_payload(state: AccessState) -> dict[str, str | bool | None]:
         return {
-            "is_paid": fallback_order.access_status == "active" or fallback_order.status in {"paid", "active"},
-            "order_id": fallback_order.id,
-            "plan": fallback_order.plan,
-            "access_status": fallback_order.access_status,
+            "is_paid": state["is_paid"],
+            "order_id": state["order_id"],
+            "plan": state["plan"],
+            "access_status": state["access_status"],
         }
 
+    def get_access_status_by_telegram_user(self, telegram_user_id: str) -> dict[str, str | bool | None]:
+        return self.access_status_payload(cached_access_state(self.db, telegram_user_id))
+
+    def get_access_statuses_by_telegram_users(self, telegram_user_ids: list[str]) -> dict[str, dict[str, str | bool | None]]:
+        states = cached_access_states(self.db, telegram_user_ids)
+        return {user_id: self.access_status_payload(state) for user_id, state in states.items()}
+
     def _update_order_status_by_session(self, session_id: str | None, *, status: str) -> None:
         if not session_id:
             return
-        order = self.db.scalar(select(Order).where(Order.stripe_session_id == session_id))
+        order = self.db.scalar(select(Order).where(Order.stripe_session_id == session_id).with_for_update())
         if order is None:
             return
         order.status = status
+        refresh_order_entitlements(self.db, order)
 
     def _update_order_status_by_payment_intent(self, payment_intent_id: str | None, *, status: str) -> None:
         if not payment_intent_id:
             return
-        order = self.db.scalar(select(Order).where(Order.stripe_payment_intent_id == payment_intent_id))
+        order = self.db.scalar(select(Order).where(Order.stripe_payment_intent_id == payment_intent_id).with_for_update())
         if order is None:
             return
         order.status = status
+        refresh_order_entitlements(self.db, order)
 
     @staticmethod
     def _as_utc_datetime(unix_ts: int | float | None) -> datetime | None:
@@ -551,7 +806,7 @@ class PaymentService:
 
     def _find_order_by_subscription(self, subscription_id: str | None, customer_id: str | None = None) -> Order | None:
         if subscription_id:
-            by_subscription = self.db.scalar(select(Order).where(Order.stripe_subscription_id == subscription_id))
+            by_subscription = self.db.scalar(select(Order).where(Order.stripe_subscription_id == subscription_id).with_for_update())
             if by_subscription is not None:
                 return by_subscription
         if customer_id:
@@ -559,6 +814,8 @@ class PaymentService:
                 select(Order)
                 .where(Order.stripe_customer_id == customer_id)
                 .order_by(desc(Order.updated_at))
+                .limit(1)
+                .with_for_update()
             )
         return None
 
@@ -593,6 +850,7 @@ class PaymentService:
         order.access_status = access_status
         if binding_status is not None:
             self._set_bindings_status(order.id, status=binding_status)
+        refresh_order_entitlements(self.db, order)
 
     def _update_order_status_by_subscription(
         self,
@@ -602,25 +860,30 @@ class PaymentService:
     ) -> None:
         if not subscription_id:
             return
-        order = self.db.scalar(select(Order).where(Order.stripe_subscription_id == subscription_id))
+        order = self.db.scalar(select(Order).where(Order.stripe_subscription_id == subscription_id).with_for_update())
         if order is None:
             return
-        order.status = status
+        if status in ORDER_STATUSES:
+            order.status = status
+        else:
+            # orders.status is an enum: keep the previous status rather than fail the whole event.
+            logger.warning("stripe_subscription_status_unknown order_id=%s status=%s", order.id, status)
         period_end = self._as_utc_datetime(current_period_end_ts)
         if period_end is not None:
             order.stripe_current_period_end = period_end
+        refresh_order_entitlements(self.db, order)
 
-    def _on_checkout_session_completed(self, session_obj: dict) -> str | None:
+    def _on_checkout_session_completed(self, session_obj: dict) -> None:
         order_id = (session_obj.get("metadata") or {}).get("order_id")
         order: Order | None = None
-        if order_id:
-            order = self.db.scalar(select(Order).where(Order.id == order_id))
+        if order_id and is_uuid(order_id):
+            order = self.db.scalar(select(Order).where(Order.id == order_id).with_for_update())
         if order is None:
             session_id = session_obj.get("id")
             if session_id:
-                order = self.db.scalar(select(Order).where(Order.stripe_session_id == session_id))
+                order = self.db.scalar(select(Order).where(Order.stripe_session_id == session_id).with_for_update())
         if order is None:
-            return None
+            return
 
         order.status = "paid"
         order.stripe_session_id = session_obj.get("id") or order.stripe_session_id
@@ -641,27 +904,22 @@ class PaymentService:
             self.db.add(token)
             self.db.flush()
 
-        token_value = make_access_token(token.id, self.settings.access_token_secret)
-        activation_link = self.telegram_sender.build_deep_link(token_value)
-
-        email_ok = True
-        try:
-            self.email_sender.send_access_email(
-                email=order.email,
-                order_id=order.id,
-                activation_link=activation_link,
-                locale=order.locale,
-            )
-        except Exception as exc:  # noqa: BLE001
-            email_ok = False
-            logger.warning("email_delivery_failed order_id=%s email=%s error=%s", order.id, mask_email(order.email), str(exc))
-
-        telegram_ok = True
+        # Side effects are recorded in the same transaction and delivered by the outbox and postback workers.
+        self._enqueue_outbox(kind="access_email", order_id=order.id, payload={"token_id": token.id})
         if order.telegram_chat_id:
-            telegram_ok = self.telegram_sender.send_activation_message(chat_id=order.telegram_chat_id, token=token_value)
+            self._enqueue_outbox(kind="telegram_activation", order_id=order.id, payload={"token_id": token.id})
+        if order.clickid and self.settings.mobi_slon_postback_url.strip():
+            enqueue_postback(
+                self.db,
+                clickid=order.clickid,
+                status="pay_success",
+                params={"payout": self._subscription_payout()},
+                source="stripe_webhook",
+            )
 
-        order.fulfillment_status = "done" if telegram_ok and email_ok else "partial"
+        order.fulfillment_status = "pending"
         order.access_status = "token_issued"
+        refresh_order_entitlements(self.db, order)
         logger.info(
             "checkout_session_completed order_id=%s session_id=%s clickid=%s fulfillment_status=%s access_status=%s",
             order.id,
@@ -670,78 +928,3 @@ class PaymentService:
             order.fulfillment_status,
             order.access_status,
         )
-        return order.clickid
-
-    def _send_mobi_slon_postback(
-        self,
-        *,
-        status: str,
-        clickid: str,
-        extra_params: Mapping[str, str] | None = None,
-        source: str = "unknown",
-    ) -> bool:
-        postback_base_url = self.settings.mobi_slon_postback_url.strip()
-        if not postback_base_url:
-            logger.warning("mobi_slon_postback_skipped_missing_url status=%s source=%s", status, source)
-            return False
-
-        request_params: dict[str, str] = {"cnv_id": clickid, "payout": "0", "cnv_status": status}
-        if extra_params:
-            request_params.update(extra_params)
-
-        last_error: Exception | None = None
-        for attempt in range(1, 4):
-            try:
-                logger.info(
-                    "mobi_slon_postback_attempt status=%s clickid=%s attempt=%d source=%s params=%d",
-                    status,
-                    clickid,
-                    attempt,
-                    source,
-                    len(request_params),
-                )
-                response = httpx.post(
-                    postback_base_url,
-                    params=request_params,
-                    timeout=10.0,
-                )
-                if response.status_code < 400:
-                    logger.info(
-                        "mobi_slon_postback_sent status=%s clickid=%s attempt=%d source=%s code=%d body=%s",
-                        status,
-                        clickid,
-                        attempt,
-                        source,
-                        response.status_code,
-                        response.text[:180].replace("\n", " "),
-                    )
-                    return True
-                last_error = RuntimeError(f"HTTP {response.status_code}")
-                logger.warning(
-                    "mobi_slon_postback_bad_response status=%s clickid=%s attempt=%d source=%s code=%d body=%s",
-                    status,
-                    clickid,
-                    attempt,
-                    source,
-                    response.status_code,
-                    response.text[:180].replace("\n", " "),
-                )
-            except Exception as exc:  # noqa: BLE001
-                last_error = exc
-                logger.warning(
-                    "mobi_slon_postback_exception status=%s clickid=%s attempt=%d source=%s error=%s",
-                    status,
-                    clickid,
-                    attempt,
-                    source,
-                    str(exc),
-                )
-
-        logger.error(
-            "mobi_slon_postback_failed status=%s clickid=%s source=%s error=%s",
-            status,
-            clickid,
-            source,
-            str(last_error) if last_error else "unknown",
-        )
-        return False
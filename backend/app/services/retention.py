@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+import logging
+from pathlib import Path
+from typing import Any, cast
+
+from sqlalchemy import ColumnElement, String, Table, TableClause, Text, and_, column, delete, func, or_, select, table
+from sqlalchemy import cast as sql_cast
+from sqlalchemy.engine import Engine
+
+from app.core.archive import ArchiveWriter
+from app.core.db.partitions import add_months, drop_partition, ensure_monthly_partitions, list_monthly_partitions, month_start
+from app.core.models.payment import DB_SCHEMA, AccessToken, MobiSlonPostback, PaymentEvent, PaymentEventKey, RestoreOTP
+from app.core.security import utcnow
+
+logger = logging.getLogger("quiz.retention")
+
+DELETE_BATCH_SIZE = 500
+DEFAULT_PARTITION_SUFFIX = "_default"
+
+
+@dataclass
+class RetentionReport:
+    cutoff: datetime
+    dry_run: bool
+    partitions_created: list[str] = field(default_factory=list)
+    partitions_dropped: list[str] = field(default_factory=list)
+    rows_archived: dict[str, int] = field(default_factory=dict)
+    archives: list[Path] = field(default_factory=list)
+    keys_pruned: int = 0
+
+
+def _archive_key(table: TableClause, key_column: str, dialect: str) -> ColumnElement[Any]:
+    key: ColumnElement[Any] = table.c[key_column]
+    if dialect != "postgresql":
+        return key
+    # Archive index bisects with Python string ordering; "C" collation matches it byte-for-byte.
+    # uuid columns take no collation, so they are ordered by their text form.
+    if not isinstance(key.type, String):
+        key = sql_cast(key, Text)
+    return key.collate("C")
+
+
+def _archive_rows(
+    engine: Engine,
+    table: TableClause,
+    *,
+    condition: ColumnElement[bool] | None,
+    key_column: str,
+    archive_path: Path,
+    dry_run: bool,
+) -> tuple[list[Any], Path | None]:
+    query = select(table)
+    if condition is not None:
+        query = query.where(condition)
+    query = query.order_by(_archive_key(table, key_column, engine.dialect.name), table.c.id)
+
+    if dry_run:
+        with engine.connect() as connection:
+            count = connection.scalar(select(func.count()).select_from(query.subquery())) or 0
+        return [None] * int(count), None
+
+    ids: list[Any] = []
+    writer: ArchiveWriter | None = None
+    try:
+        with engine.connect() as connection:
+            for row in connection.execution_options(stream_results=True).execute(query).mappings():
+                if writer is None:
+                    writer = ArchiveWriter(archive_path, key_field=key_column)
+                writer.write(dict(row))
+                ids.append(row["id"])
+    except Exception:
+        if writer is not None:
+            writer.abort()
+        raise
+    if writer is None:
+        return [], None
+    writer.close()
+    return ids, archive_path
+
+
+def _delete_ids(engine: Engine, table: TableClause, ids: list[Any]) -> None:
+    for start in range(0, len(ids), DELETE_BATCH_SIZE):
+        with engine.begin() as connection:
+            connection.execute(delete(table).where(table.c.id.in_(ids[start:start + DELETE_BATCH_SIZE])))
+
+
+def _archive_and_delete(
+    engine: Engine,
+    report: RetentionReport,
+    table: TableClause,
+    *,
+    condition: ColumnElement[bool],
+    key_column: str,
+    archive_dir: Path,
+    label: str,
+) -> None:
+    stamp = utcnow().strftime("%Y%m%dT%H%M%S")
+    archive_path = archive_dir / table.name / f"{label}-{stamp}.ndjson.gz"
+    ids, archived = _archive_rows(
+        engine,
+        table,
+        condition=condition,
+        key_column=key_column,
+        archive_path=archive_path,
+        dry_run=report.dry_run,
+    )
+    report.rows_archived[table.name] = report.rows_archived.get(table.name, 0) + len(ids)
+    if archived is None:
+        return
+    report.archives.append(archived)
+    # Rows are removed only after the archive and its index are fsynced and published.
+    _delete_ids(engine, table, ids)
+
+
+def _partition_clause(name: str, schema: str) -> TableClause:
+    return table(name, *(column(col.name, col.type) for col in PaymentEvent.__table__.c), schema=schema)
+
+
+def _retain_partitioned_events(
+    engine: Engine,
+    report: RetentionReport,
+    *,
+    archive_dir: Path,
+    months_ahead: int,
+) -> None:
+    schema = DB_SCHEMA or "public"
+    table_name = PaymentEvent.__tablename__
+    now = utcnow()
+    with engine.begin() as connection:
+        existing = list_monthly_partitions(connection, schema=schema, table=table_name)
+        if not report.dry_run:
+            report.partitions_created = ensure_monthly_partitions(
+                connection,
+                schema=schema,
+                table=table_name,
+                first_month=month_start(now),
+                last_month=add_months(month_start(now), months_ahead),
+                default_partition=table_name + DEFAULT_PARTITION_SUFFIX,
+            )
+
+    for partition in existing:
+        if partition.upper > report.cutoff:
+            continue
+        ids, archived = _archive_rows(
+            engine,
+            _partition_clause(partition.name, schema),
+            condition=None,
+            key_column="stripe_event_id",
+            archive_path=archive_dir / table_name / f"{partition.name}.ndjson.gz",
+            dry_run=report.dry_run,
+        )
+        report.rows_archived[table_name] = report.rows_archived.get(table_name, 0) + len(ids)
+        if report.dry_run:
+            report.partitions_dropped.append(partition.name)
+            continue
+        if archived is not None:
+            report.archives.append(archived)
+        with engine.begin() as connection:
+            drop_partition(connection, schema=schema, table=table_name, name=partition.name)
+        report.partitions_dropped.append(partition.name)
+
+    # Rows that landed in the DEFAULT partition are aged out row by row.
+    default_name = table_name + DEFAULT_PARTITION_SUFFIX
+    default_table = _partition_clause(default_name, schema)
+    _archive_and_delete(
+        engine,
+        report,
+        default_table,
+        condition=default_table.c.received_at < report.cutoff,
+        key_column="stripe_event_id",
+        archive_dir=archive_dir,
+        label=default_name,
+    )
+
+
+def run_retention(
+    engine: Engine,
+    *,
+    days: int,
+    archive_dir: Path,
+    months_ahead: int = 2,
+    dry_run: bool = False,
+) -> RetentionReport:
+    """Archive and remove payment events, used OTPs, revoked tokens and sent postbacks older than `days`.
+
+    On PostgreSQL payment_events is range-partitioned by month: upcoming partitions are created
+    and whole expired partitions are archived and dropped. Other dialects fall back to row deletes.
+    """
+    report = RetentionReport(cutoff=utcnow() - timedelta(days=days), dry_run=dry_run)
+    cutoff = report.cutoff
+
+    if engine.dialect.name == "postgresql":
+        _retain_partitioned_events(engine, report, archive_dir=archive_dir, months_ahead=months_ahead)
+    else:
+        events = cast(Table, PaymentEvent.__table__)
+        _archive_and_delete(
+            engine,
+            report,
+            events,
+            condition=events.c.received_at < cutoff,
+            key_column="stripe_event_id",
+            archive_dir=archive_dir,
+            label=f"before-{cutoff:%Y%m%d}",
+        )
+
+    otps = cast(Table, RestoreOTP.__table__)
+    _archive_and_delete(
+        engine,
+        report,
+        otps,
+        condition=or_(otps.c.used_at < cutoff, and_(otps.c.used_at.is_(None), otps.c.expires_at < cutoff)),
+        key_column="id",
+        archive_dir=archive_dir,
+        label=f"before-{cutoff:%Y%m%d}",
+    )
+
+    tokens = cast(Table, AccessToken.__table__)
+    _archive_and_delete(
+        engine,
+        report,
+        tokens,
+        condition=and_(tokens.c.status == "revoked", tokens.c.revoked_at < cutoff),
+        key_column="id",
+        archive_dir=archive_dir,
+        label=f"before-{cutoff:%Y%m%d}",
+    )
+
+    # Dead postbacks stay for replay; once a sent row is gone its (clickid, status) can be queued again.
+    postbacks = cast(Table, MobiSlonPostback.__table__)
+    _archive_and_delete(
+        engine,
+        report,
+        postbacks,
+        condition=and_(postbacks.c.status == "sent", postbacks.c.sent_at < cutoff),
+        key_column="id",
+        archive_dir=archive_dir,
+        label=f"before-{cutoff:%Y%m%d}",
+    )
+
+    keys = cast(Table, PaymentEventKey.__table__)
+    if dry_run:
+        with engine.connect() as connection:
+            report.keys_pruned = int(
+                connection.scalar(select(func.count()).select_from(keys).where(keys.c.received_at < cutoff)) or 0
+            )
+    else:
+        with engine.begin() as connection:
+            result = connection.execute(delete(keys).where(keys.c.received_at < cutoff))
+            report.keys_pruned = int(getattr(result, "rowcount", 0) or 0)
+
+    logger.info(
+        "retention_completed dry_run=%s cutoff=%s partitions_created=%s partitions_dropped=%s rows_archived=%s keys_pruned=%d",
+        dry_run,
+        cutoff.isoformat(),
+        ",".join(report.partitions_created) or "-",
+        ",".join(report.partitions_dropped) or "-",
+        report.rows_archived,
+        report.keys_pruned,
+    )
+    return report
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable
+from datetime import timezone
+import logging
+import zlib
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import Settings
+from app.core.models.payment import PaymentEvent
+from app.core.security import utcnow
+from app.services.payment_service import PaymentService
+
+logger = logging.getLogger("quiz.webhook_inbox")
+
+
+def inbox_stats(db: Session) -> dict[str, int | float | None]:
+    depth, oldest_received_at = db.execute(
+        select(func.count(PaymentEvent.id), func.min(PaymentEvent.received_at)).where(
+            PaymentEvent.process_result == "pending"
+        )
+    ).one()
+    failed = db.scalar(select(func.count(PaymentEvent.id)).where(PaymentEvent.process_result == "failed")) or 0
+
+    lag_seconds: float | None = None
+    if oldest_received_at is not None:
+        if oldest_received_at.tzinfo is None:
+            oldest_received_at = oldest_received_at.replace(tzinfo=timezone.utc)
+        lag_seconds = max(0.0, (utcnow() - oldest_received_at).total_seconds())
+    return {"depth": int(depth or 0), "failed": int(failed), "lag_seconds": lag_seconds}
+
+
+def requeue_failed_events(db: Session, *, stripe_event_id: str | None = None) -> int:
+    statement = (
+        update(PaymentEvent)
+        .where(PaymentEvent.process_result == "failed")
+        .values(process_result="pending", attempts=0, next_attempt_at=utcnow(), processed_at=None)
+    )
+    if stripe_event_id:
+        statement = statement.where(PaymentEvent.stripe_event_id == stripe_event_id)
+    result = db.execute(statement)
+    db.commit()
+    return int(getattr(result, "rowcount", 0) or 0)
+
+
+def partition_index(partition_key: str, partitions: int) -> int:
+    return zlib.crc32(partition_key.encode("utf-8")) % max(1, partitions)
+
+
+class WebhookInboxWorker:
+    """Drains pending Stripe events written by the fast-ack webhook endpoint.
+
+    Events are hash-partitioned by order/subscription/customer key: partitions run in parallel,
+    events inside one partition are applied strictly in arrival order.
+    """
+
+    def __init__(self, settings: Settings, session_factory: Callable[[], Session]) -> None:
+        self._settings = settings
+        self._session_factory = session_factory
+        self._partitions = max(1, settings.webhook_inbox_concurrency)
+
+    def _pending(self) -> list[tuple[str, str | None]]:
+        with self._session_factory() as db:
+            rows = db.execute(
+                select(PaymentEvent.id, PaymentEvent.partition_key)
+                .where(
+                    PaymentEvent.process_result == "pending",
+                    or_(PaymentEvent.next_attempt_at.is_(None), PaymentEvent.next_attempt_at <= utcnow()),
+                )
+                .order_by(PaymentEvent.received_at)
+                .limit(self._settings.webhook_inbox_batch_size)
+            ).all()
+            return [(row.id, row.partition_key) for row in rows]
+
+    def _process(self, payment_event_id: str) -> str | None:
+        with self._session_factory() as db:
+            return PaymentService(self._settings, db).process_inbox_event(payment_event_id)
+
+    def _process_partition(self, payment_event_ids: list[str]) -> int:
+        processed = 0
+        for payment_event_id in payment_event_ids:
+            result = self._process(payment_event_id)
+            if result != "processed":
+                # Later events of this partition wait for the next drain to keep per-order ordering.
+                break
+            processed += 1
+        return processed
+
+    async def drain_once(self) -> int:
+        pending = await asyncio.to_thread(self._pending)
+        if not pending:
+            return 0
+        partitions: dict[int, list[str]] = {}
+        for payment_event_id, partition_key in pending:
+            index = partition_index(partition_key or payment_event_id, self._partitions)
+            partitions.setdefault(index, []).append(payment_event_id)
+
+        results = await asyncio.gather(
+            *(asyncio.to_thread(self._process_partition, event_ids) for event_ids in partitions.values()),
+            return_exceptions=True,
+        )
+        processed = 0
+        for index, result in zip(partitions, results):
+            if isinstance(result, BaseException):
+                logger.error("stripe_inbox_worker_error partition=%d error=%s", index, str(result))
+            else:
+                processed += result
+        return processed
+
+    async def run(self, stop_event: asyncio.Event | None = None) -> None:
+        stop = stop_event or asyncio.Event()
+        logger.info(
+            "stripe_inbox_worker_started partitions=%d batch_size=%d",
+            self._partitions,
+            self._settings.webhook_inbox_batch_size,
+        )
+        while not stop.is_set():
+            try:
+                drained = await self.drain_once()
+            except Exception as exc:  # noqa: BLE001
+                logger.error("stripe_inbox_worker_drain_failed error=%s", str(exc))
+                drained = 0
+            if drained:
+                continue
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self._settings.webhook_inbox_poll_interval_seconds)
+            except TimeoutError:
+                pass
+        logger.info("stripe_inbox_worker_stopped")
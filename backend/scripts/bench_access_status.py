@@ -0,0 +1,134 @@
+"""Benchmark PaymentService.get_access_status_by_telegram_user.
+
+Compares the previous five-query lookup, the single ranked query that recomputes
+entitlements, and the entitlements primary-key lookup used by the service:
+per-call latency (p50/p95) and SQL statements per call.
+
+    python scripts/bench_access_status.py --users 2000 --calls 5000
+    DATABASE_URL=postgresql+psycopg://... python scripts/bench_access_status.py --no-seed
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+from pathlib import Path
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{Path(tempfile.mkdtemp()) / 'bench_access_status.db'}"
+
+from sqlalchemy import desc, event, select  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.core.config import get_settings  # noqa: E402
+from app.core.db.session import SessionLocal, engine, init_db  # noqa: E402
+from app.core.models.payment import AccessBinding, Order  # noqa: E402
+from app.services.entitlements import derive_access_state, rebuild_entitlements  # noqa: E402
+from app.services.payment_service import PaymentService  # noqa: E402
+
+
+def legacy_access_status(db: Session, telegram_user_id: str) -> dict[str, str | bool | None]:
+    """Lookup as implemented before the ranked query, kept for comparison."""
+    active_binding = db.scalar(
+        select(AccessBinding)
+        .where(AccessBinding.telegram_user_id == telegram_user_id, AccessBinding.status == "active")
+        .order_by(desc(AccessBinding.bound_at))
+    )
+    if active_binding is not None:
+        order = db.scalar(select(Order).where(Order.id == active_binding.order_id))
+        if order is not None:
+            return {"is_paid": order.access_status == "active" or order.status in {"paid", "active"}, "order_id": order.id}
+    latest_binding = db.scalar(
+        select(AccessBinding).where(AccessBinding.telegram_user_id == telegram_user_id).order_by(desc(AccessBinding.bound_at))
+    )
+    if latest_binding is not None:
+        order = db.scalar(select(Order).where(Order.id == latest_binding.order_id))
+        if order is not None:
+            return {"is_paid": False, "order_id": order.id}
+    fallback_order = db.scalar(
+        select(Order).where(Order.telegram_chat_id == telegram_user_id).order_by(desc(Order.updated_at))
+    )
+    if fallback_order is None:
+        return {"is_paid": False, "order_id": None}
+    return {"is_paid": fallback_order.access_status == "active", "order_id": fallback_order.id}
+
+
+def seed(users: int) -> None:
+    # A quarter active, a quarter revoked, a quarter chat-id only, a quarter unknown (worst case for legacy).
+    with SessionLocal() as db:
+        for index in range(users):
+            kind = index % 4
+            if kind == 3:
+                continue
+            order = Order(
+                email=f"bench{index}@example.com",
+                mode="one_time",
+                plan="one_time_basic",
+                amount_minor=999,
+                currency="usd",
+                status="paid",
+                access_status="revoked" if kind == 1 else "active",
+                telegram_chat_id=f"bench-{index}" if kind == 2 else None,
+            )
+            db.add(order)
+            db.flush()
+            if kind != 2:
+                db.add(AccessBinding(order_id=order.id, telegram_user_id=f"bench-{index}", status="active" if kind == 0 else "revoked"))
+        db.commit()
+        rebuild_entitlements(db)
+
+
+def measure(name: str, lookup: Callable[[Session, str], object], user_ids: list[str]) -> None:
+    statements = 0
+
+    def count(*_: object) -> None:
+        nonlocal statements
+        statements += 1
+
+    timings: list[float] = []
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        with SessionLocal() as db:
+            for user_id in user_ids:
+                started = time.perf_counter()
+                lookup(db, user_id)
+                timings.append((time.perf_counter() - started) * 1000)
+                db.expunge_all()
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    timings.sort()
+    print(
+        f"{name:<8} calls={len(user_ids)} p50={statistics.median(timings):.3f}ms "
+        f"p95={timings[int(len(timings) * 0.95) - 1]:.3f}ms queries_per_call={statements / len(user_ids):.2f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--calls", type=int, default=5000)
+    parser.add_argument("--no-seed", action="store_true", help="Use existing rows instead of seeding bench-* users")
+    args = parser.parse_args()
+
+    init_db()
+    if not args.no_seed:
+        seed(args.users)
+    rng = random.Random(42)
+    user_ids = [f"bench-{rng.randrange(args.users)}" for _ in range(args.calls)]
+
+    settings = get_settings()
+    measure("legacy", legacy_access_status, user_ids)
+    measure("ranked", derive_access_state, user_ids)
+    measure("entitled", lambda db, user_id: PaymentService(settings, db).get_access_status_by_telegram_user(user_id), user_ids)
+
+
+if __name__ == "__main__":
+    main()
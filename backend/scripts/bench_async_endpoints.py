@@ -0,0 +1,118 @@
+"""Benchmark sync (threadpool) vs async (async engine) access-status endpoints.
+
+Drives both variants in-process through httpx.ASGITransport with N concurrent
+clients and reports throughput and latency. The per-process access status cache
+is disabled so every request reaches the database.
+
+    python scripts/bench_async_endpoints.py --clients 200 --requests 5000
+    DATABASE_URL=postgresql+psycopg://... python scripts/bench_async_endpoints.py --no-seed
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+from pathlib import Path
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{Path(tempfile.mkdtemp()) / 'bench_async_endpoints.db'}"
+os.environ["ACCESS_STATUS_CACHE_TTL_SECONDS"] = "0"
+
+import httpx  # noqa: E402
+from fastapi import Depends, FastAPI  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession  # noqa: E402
+
+from app.core.config import get_settings  # noqa: E402
+from app.core.db.session import SessionLocal, async_engine, get_async_db, init_db  # noqa: E402
+from app.core.models.payment import Entitlement  # noqa: E402
+from app.schemas.bot import BotAccessStatusRequest, BotAccessStatusResponse  # noqa: E402
+from app.services.async_payment_service import AsyncPaymentService  # noqa: E402
+from app.services.payment_service import PaymentService  # noqa: E402
+
+bench_app = FastAPI()
+
+
+@bench_app.post("/sync", response_model=BotAccessStatusResponse)
+def sync_access_status(payload: BotAccessStatusRequest) -> BotAccessStatusResponse:
+    # The session is closed inside the endpoint: with Depends(get_db) the connection is only
+    # returned by the dependency teardown, which needs another threadpool slot, and at 200 clients
+    # the threadpool and the connection pool wait on each other until the pool times out.
+    with SessionLocal() as db:
+        status = PaymentService(get_settings(), db).get_access_status_by_telegram_user(payload.telegram_user_id)
+    return BotAccessStatusResponse(**status)
+
+
+@bench_app.post("/async", response_model=BotAccessStatusResponse)
+async def async_access_status(
+    payload: BotAccessStatusRequest, db: AsyncSession = Depends(get_async_db)
+) -> BotAccessStatusResponse:
+    status = await AsyncPaymentService(get_settings(), db).get_access_status_by_telegram_user(payload.telegram_user_id)
+    return BotAccessStatusResponse(**status)
+
+
+def seed(users: int) -> None:
+    with SessionLocal() as db:
+        for index in range(users):
+            db.merge(Entitlement(telegram_user_id=f"bench-{index}", access_status="active", is_paid=index % 2 == 0))
+        db.commit()
+
+
+async def run(path: str, clients: int, user_ids: list[str]) -> None:
+    timings: list[float] = []
+    queue: asyncio.Queue[str] = asyncio.Queue()
+    for user_id in user_ids:
+        queue.put_nowait(user_id)
+
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=bench_app), base_url="http://bench", limits=limits) as client:
+
+        async def worker() -> None:
+            while not queue.empty():
+                user_id = queue.get_nowait()
+                started = time.perf_counter()
+                response = await client.post(path, json={"telegram_user_id": user_id})
+                response.raise_for_status()
+                timings.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    timings.sort()
+    print(
+        f"{path:<6} clients={clients} requests={len(timings)} rps={len(timings) / elapsed:.0f} "
+        f"p50={statistics.median(timings):.1f}ms p95={timings[int(len(timings) * 0.95) - 1]:.1f}ms"
+    )
+
+
+async def main_async(args: argparse.Namespace, user_ids: list[str]) -> None:
+    await run("/sync", args.clients, user_ids)
+    await run("/async", args.clients, user_ids)
+    await async_engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--no-seed", action="store_true", help="Use existing rows instead of seeding bench-* users")
+    args = parser.parse_args()
+
+    init_db()
+    if not args.no_seed:
+        seed(args.users)
+    rng = random.Random(42)
+    user_ids = [f"bench-{rng.randrange(args.users)}" for _ in range(args.requests)]
+    asyncio.run(main_async(args, user_ids))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Benchmark the Mobi-Slon relay endpoint: per-request DB write vs the DB-free intake path.
+
+Replays quiz funnel traffic (every user walks start_quiz .. transition_to_payment, with a
+share of browser retries) in-process through httpx.ASGITransport with N concurrent clients.
+`/db` is the previous shape of the endpoint (a threadpool request that inserts and commits its
+queue row); `/api/events/mobi-slon` is the real router, which only buffers the event for
+POSTBACK_INTAKE. Reports throughput, latency and the rows that reached the queue table.
+
+    python scripts/bench_relay_endpoints.py --users 1000 --clients 200
+    DATABASE_URL=postgresql+psycopg://... python scripts/bench_relay_endpoints.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+from pathlib import Path
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{Path(tempfile.mkdtemp()) / 'bench_relay_endpoints.db'}"
+os.environ.setdefault("VITE_MOBI_SLON_URL", "https://mobi-slon.invalid/index.php")
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+from app.api.v1.payment import router as payment_router  # noqa: E402
+from app.core.db.session import AsyncSessionLocal, SessionLocal, async_engine, init_db  # noqa: E402
+from app.core.mobi_slon_events import MobiSlonEvent  # noqa: E402
+from app.core.models.payment import MobiSlonPostback  # noqa: E402
+from app.schemas.payment import MobiSlonEventRequest, MobiSlonEventResponse  # noqa: E402
+from app.services.mobi_slon_postbacks import POSTBACK_INTAKE, enqueue_postback  # noqa: E402
+from app.services.payment_service import PaymentService  # noqa: E402
+
+FUNNEL = [event.value for event in MobiSlonEvent if event is not MobiSlonEvent.PAY_SUCCESS]
+
+bench_app = FastAPI()
+bench_app.include_router(payment_router)
+
+
+@bench_app.post("/db", response_model=MobiSlonEventResponse)
+def relay_with_db_write(payload: MobiSlonEventRequest) -> MobiSlonEventResponse:
+    with SessionLocal() as db:
+        queued = enqueue_postback(
+            db,
+            clickid=PaymentService.sanitize_clickid(payload.clickid),
+            status=PaymentService.normalize_postback_status(payload.status),
+            params=PaymentService.sanitize_tracking_params(payload.tracking_params),
+            source="frontend_relay",
+        )
+        db.commit()
+    return MobiSlonEventResponse(accepted=True, forwarded=True, duplicate=not queued)
+
+
+def quiz_traffic(users: int, retry_share: float, seed: int) -> list[tuple[str, str]]:
+    """(user, status) pairs in arrival order: users interleave, each walks the funnel in order."""
+    rng = random.Random(seed)
+    walks = [[(f"user-{index}", status) for status in FUNNEL] for index in range(users)]
+    events: list[tuple[str, str]] = []
+    while walks:
+        walk = walks[rng.randrange(len(walks))]
+        event = walk.pop(0)
+        events.append(event)
+        if rng.random() < retry_share:
+            events.append(event)
+        if not walk:
+            walks.remove(walk)
+    return events
+
+
+def queued_rows(prefix: str) -> int:
+    with SessionLocal() as db:
+        return db.scalar(select(func.count()).where(MobiSlonPostback.clickid.startswith(prefix))) or 0
+
+
+async def run(path: str, clients: int, events: list[tuple[str, str]]) -> None:
+    # A fresh clickid namespace per run, so both variants insert the same number of new rows.
+    prefix = f"bench-{uuid.uuid4().hex[:8]}-"
+    timings: list[float] = []
+    queue: asyncio.Queue[tuple[str, str]] = asyncio.Queue()
+    for event in events:
+        queue.put_nowait(event)
+
+    stop = asyncio.Event()
+    intake = asyncio.create_task(POSTBACK_INTAKE.run(stop))
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=bench_app), base_url="http://bench", limits=limits) as client:
+
+        async def worker() -> None:
+            while not queue.empty():
+                user, status = queue.get_nowait()
+                started = time.perf_counter()
+                response = await client.post(
+                    path,
+                    json={"status": status, "clickid": prefix + user, "tracking_params": {"utm_source": "bench"}},
+                )
+                response.raise_for_status()
+                timings.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+    stop.set()
+    await intake
+
+    timings.sort()
+    print(
+        f"{path:<22} clients={clients} requests={len(timings)} rps={len(timings) / elapsed:.0f} "
+        f"p50={statistics.median(timings):.1f}ms p95={timings[int(len(timings) * 0.95) - 1]:.1f}ms "
+        f"rows={queued_rows(prefix)}"
+    )
+
+
+async def main_async(args: argparse.Namespace, events: list[tuple[str, str]]) -> None:
+    POSTBACK_INTAKE.bind(AsyncSessionLocal)
+    await run("/db", args.clients, events)
+    await run("/api/events/mobi-slon", args.clients, events)
+    print(f"intake {POSTBACK_INTAKE.stats()}")
+    await async_engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--retry-share", type=float, default=0.1, help="Share of events the browser sends twice")
+    args = parser.parse_args()
+
+    init_db()
+    events = quiz_traffic(args.users, args.retry_share, seed=42)
+    asyncio.run(main_async(args, events))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from app.core.cache import RecentKeys, TTLCache
+
+
+def test_recent_keys_evicts_least_recently_used() -> None:
+    keys = RecentKeys(maxsize=2)
+    keys.add("evt_1")
+    keys.add("evt_2")
+    assert "evt_1" in keys
+
+    keys.add("evt_3")
+
+    assert "evt_1" in keys
+    assert "evt_2" not in keys
+    assert "evt_3" in keys
+    assert len(keys) == 2
+
+
+def test_recent_keys_disabled_when_size_is_zero() -> None:
+    keys = RecentKeys(maxsize=0)
+    keys.add("evt_1")
+
+    assert "evt_1" not in keys
+
+
+def test_ttl_cache_expires_entries_and_counts_hits() -> None:
+    now = [100.0]
+    cache: TTLCache[str] = TTLCache(maxsize=10, ttl_seconds=5.0, clock=lambda: now[0])
+    cache.set("u1", "paid")
+
+    assert cache.get("u1") == "paid"
+    now[0] += 6.0
+    assert cache.get("u1") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert len(cache) == 0
+
+
+def test_ttl_cache_is_bounded_and_skips_sets_after_invalidation() -> None:
+    cache: TTLCache[int] = TTLCache(maxsize=2, ttl_seconds=60.0)
+    for key in ("a", "b", "c"):
+        cache.set(key, 1)
+    assert cache.get("a") is None
+    assert cache.stats()["evictions"] == 1
+
+    version = cache.version
+    cache.invalidate(["b"])
+    cache.set("b", 2, version=version)
+
+    assert cache.get("b") is None
+    assert cache.get("c") == 1
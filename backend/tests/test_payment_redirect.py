@@ -4,7 +4,11 @@ import os
 from pathlib import Path
 import sys
 
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
 from fastapi.testclient import TestClient
+import httpx
 
 TEST_DB_PATH = Path(__file__).resolve().parent / "test_app.db"
 if TEST_DB_PATH.exists():
@@ -21,11 +25,54 @@ os.environ["BOT_INTERNAL_TOKEN"] = "test-internal-token"
 os.environ["META_PIXEL_ID"] = "1052620673116886"
 os.environ["META_ACCESS_TOKEN"] = "test-meta-token"
 os.environ["META_GRAPH_API_VERSION"] = "v18.0"
+os.environ["OUTBOX_WORKER_ENABLED"] = "false"
+os.environ["MOBI_SLON_WORKER_ENABLED"] = "false"
 
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
 from app.main import app
 from app.core.config import get_settings
+from app.core.container import get_container
+from app.core.db.session import SessionLocal
+from app.services.mobi_slon_postbacks import MobiSlonPostbackWorker
+from app.services.outbox import OutboxDispatcher
+
+
+def _drain_outbox() -> int:
+    import asyncio
+
+    return asyncio.run(OutboxDispatcher(get_settings(), SessionLocal).drain_once())
+
+
+def _drain_postbacks() -> int:
+    import asyncio
+
+    return asyncio.run(MobiSlonPostbackWorker(get_settings(), SessionLocal).drain_once())
+
+
+@contextmanager
+def _outbound_requests(
+    respond: Callable[[httpx.Request], httpx.Response] | None = None,
+) -> Iterator[list[httpx.Request]]:
+    """Routes the shared outbound clients to `respond` (200 "OK" by default) and records every request."""
+    http = get_container().http
+    sent: list[httpx.Request] = []
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        sent.append(request)
+        return respond(request) if respond is not None else httpx.Response(200, text="OK")
+
+    http.close()
+    http.transport = httpx.MockTransport(handle)
+    try:
+        yield sent
+    finally:
+        http.close()
+        http.transport = None
+
+
+def _postback_calls(sent: list[httpx.Request]) -> list[dict[str, object]]:
+    return [{"url": str(request.url.copy_with(query=None)), "params": dict(request.url.params)} for request in sent]
 
 
 def test_legacy_redirect_endpoint_gone() -> None:
@@ -136,115 +183,195 @@ def test_webhook_idempotency_and_paid_status(monkeypatch) -> None:
         assert payload["access_status"] == "token_issued"
 
 
-def test_webhook_sends_server_side_mobi_slon_pay_success_once(monkeypatch) -> None:
-    class DummySession:
-        id = "cs_test_paid_postback"
-        url = "https://checkout.test/postback"
+@contextmanager
+def _webhook_blocked_in(monkeypatch, method: str) -> Iterator[Callable[[], bool]]:
+    """Holds PaymentService.`method` until the block exits; yields a check that /health still answers meanwhile."""
+    import threading
 
-    class DummyPostbackResponse:
-        status_code = 200
-        text = "OK"
+    from app.services.payment_service import PaymentService
 
-    captured_calls: list[dict[str, object]] = []
+    entered, release = threading.Event(), threading.Event()
+    original = getattr(PaymentService, method)
 
-    def fake_httpx_post(
-        url: str,
-        *,
-        params: dict[str, str],
-        timeout: float,
-    ) -> DummyPostbackResponse:
-        captured_calls.append({"url": url, "params": params, "timeout": timeout})
-        return DummyPostbackResponse()
+    def blocked(self, *args, **kwargs):
+        entered.set()
+        release.wait(timeout=10)
+        return original(self, *args, **kwargs)
 
-    monkeypatch.setattr("stripe.checkout.Session.create", lambda **_: DummySession())
-    monkeypatch.setattr("httpx.post", fake_httpx_post)
+    monkeypatch.setattr(PaymentService, method, blocked)
+    responses: list[httpx.Response] = []
+    with TestClient(app) as client:
+        webhook = threading.Thread(
+            target=lambda: responses.append(client.post("/api/stripe/webhook", headers={"stripe-signature": "t"}, content=b"{}"))
+        )
+        webhook.start()
+        try:
+            assert entered.wait(timeout=5)
+
+            def loop_responsive() -> bool:
+                health = threading.Thread(target=lambda: responses.append(client.get("/health")))
+                health.start()
+                health.join(timeout=2)
+                return not health.is_alive()
+
+            yield loop_responsive
+        finally:
+            release.set()
+            webhook.join(timeout=10)
+    assert [response.status_code for response in responses] == [200, 200]
+
+
+def test_inline_webhook_waiting_on_partition_lock_does_not_block_the_event_loop(monkeypatch) -> None:
+    event = {
+        "id": "evt_lock_wait_1",
+        "type": "checkout.session.expired",
+        "data": {"object": {"id": "cs_lock_wait_unknown", "customer": "cus_lock_wait"}},
+    }
+    monkeypatch.setattr("stripe.Webhook.construct_event", lambda payload, sig, secret: event)
+
+    # Stands in for pg_advisory_xact_lock held by another process handling the same customer.
+    with _webhook_blocked_in(monkeypatch, "_lock_partition") as loop_responsive:
+        assert loop_responsive()
+
+
+def test_inbox_webhook_ack_does_not_block_the_event_loop(monkeypatch) -> None:
+    from app.core.models.payment import PaymentEvent
+
+    event = {
+        "id": "evt_inbox_slow_primary_1",
+        "type": "checkout.session.expired",
+        "data": {"object": {"id": "cs_inbox_slow_primary", "customer": "cus_inbox_slow_primary"}},
+    }
+    monkeypatch.setattr("stripe.Webhook.construct_event", lambda payload, sig, secret: event)
     settings = get_settings()
-    settings.mobi_slon_postback_url = "https://mobi-slon.example/index.php"
+    monkeypatch.setattr(settings, "stripe_webhook_mode", "inbox")
+    monkeypatch.setattr(settings, "webhook_inbox_worker_enabled", False)
 
-    try:
-        with TestClient(app) as client:
-            create_response = client.post(
-                "/api/payment/checkout-session",
-                json={
-                    "mode": "one_time",
-                    "plan": "one_time_basic",
-                    "email": "postback@example.com",
-                    "clickid": "pb-001",
-                    "locale": "en",
-                },
-            )
-            assert create_response.status_code == 200
-            order_id = create_response.json()["order_id"]
+    # A slow primary round trip on the inbox insert must not stall other requests.
+    with _webhook_blocked_in(monkeypatch, "_insert_payment_event") as loop_responsive:
+        assert loop_responsive()
 
-            event = {
-                "id": "evt_postback_1",
-                "type": "checkout.session.completed",
-                "data": {
-                    "object": {
-                        "id": "cs_test_paid_postback",
-                        "payment_intent": "pi_pb_1",
-                        "customer": "cus_pb_1",
-                        "metadata": {"order_id": order_id},
-                    }
-                },
-            }
-            monkeypatch.setattr("stripe.Webhook.construct_event", lambda payload, sig, secret: event)
+    with SessionLocal() as db:
+        stored = db.query(PaymentEvent).filter(PaymentEvent.stripe_event_id == "evt_inbox_slow_primary_1").one()
+        assert stored.process_result == "pending"
 
-            response = client.post("/api/stripe/webhook", headers={"stripe-signature": "sig-1"}, content=b"{}")
-            assert response.status_code == 200
-            assert response.json() == {"ok": True, "duplicate": False}
 
-            duplicate = client.post("/api/stripe/webhook", headers={"stripe-signature": "sig-1"}, content=b"{}")
-            assert duplicate.status_code == 200
-            assert duplicate.json() == {"ok": True, "duplicate": True}
-    finally:
-        settings.mobi_slon_postback_url = ""
+def test_webhook_redelivery_after_restart_is_deduplicated_by_the_database(monkeypatch) -> None:
+    from app.core.models.payment import PaymentEvent, PaymentEventKey
+    from app.services.payment_service import RECENT_WEBHOOK_EVENT_IDS
 
-    assert len(captured_calls) == 1
-    call = captured_calls[0]
-    assert call["url"] == "https://mobi-slon.example/index.php"
-    assert call["params"] == {"cnv_id": "pb-001", "payout": "9.99", "cnv_status": "pay_success"}
+    event = {
+        "id": "evt_db_dedupe_1",
+        "type": "checkout.session.expired",
+        "data": {"object": {"id": "cs_db_dedupe_unknown"}},
+    }
+    monkeypatch.setattr("stripe.Webhook.construct_event", lambda payload, sig, secret: event)
 
+    with TestClient(app) as client:
+        first = client.post("/api/stripe/webhook", headers={"stripe-signature": "t"}, content=b"{}")
+        assert first.json() == {"ok": True, "duplicate": False}
 
-def test_frontend_relay_mobi_slon_event_post(monkeypatch) -> None:
-    class DummyPostbackResponse:
-        status_code = 200
-        text = "OK"
+        # Another worker or a restarted process: the in-memory LRU has not seen the event.
+        RECENT_WEBHOOK_EVENT_IDS.clear()
+        redelivered = client.post("/api/stripe/webhook", headers={"stripe-signature": "t"}, content=b"{}")
 
-    captured_calls: list[dict[str, object]] = []
+    assert redelivered.status_code == 200
+    assert redelivered.json() == {"ok": True, "duplicate": True}
+    assert "evt_db_dedupe_1" in RECENT_WEBHOOK_EVENT_IDS
+    with SessionLocal() as db:
+        assert db.query(PaymentEvent).filter(PaymentEvent.stripe_event_id == "evt_db_dedupe_1").count() == 1
+        assert db.query(PaymentEventKey).filter(PaymentEventKey.stripe_event_id == "evt_db_dedupe_1").count() == 1
 
-    def fake_httpx_post(
-        url: str,
-        *,
-        params: dict[str, str],
-        timeout: float,
-    ) -> DummyPostbackResponse:
-        captured_calls.append({"url": url, "params": params, "timeout": timeout})
-        return DummyPostbackResponse()
 
-    monkeypatch.setattr("httpx.post", fake_httpx_post)
-    settings = get_settings()
-    settings.mobi_slon_postback_url = "https://mobi-slon.example/index.php"
+def test_webhook_sends_server_side_mobi_slon_pay_success_once(monkeypatch) -> None:
+    class DummySession:
+        id = "cs_test_paid_postback"
+        url = "https://checkout.test/postback"
 
-    try:
-        with TestClient(app) as client:
-            response = client.post(
-                "/api/tracking/mobi-slon-event",
-                json={
-                    "status": "block6_completed",
-                    "clickid": "relay-001",
-                    "session_id": "sess_123",
-                    "page_path": "/block-6?clickid=relay-001",
-                    "tracking_params": {"utm_source": "meta", "utm_campaign": "q1"},
-                },
-            )
-    finally:
-        settings.mobi_slon_postback_url = ""
+    monkeypatch.setattr("stripe.checkout.Session.create", lambda **_: DummySession())
+    with _outbound_requests() as sent:
+        settings = get_settings()
+        settings.mobi_slon_postback_url = "https://mobi-slon.example/index.php"
+
+        try:
+            with TestClient(app) as client:
+                create_response = client.post(
+                    "/api/payment/checkout-session",
+                    json={
+                        "mode": "one_time",
+                        "plan": "one_time_basic",
+                        "email": "postback@example.com",
+                        "clickid": "pb-001",
+                        "locale": "en",
+                    },
+                )
+                assert create_response.status_code == 200
+                order_id = create_response.json()["order_id"]
+
+                event = {
+                    "id": "evt_postback_1",
+                    "type": "checkout.session.completed",
+                    "data": {
+                        "object": {
+                            "id": "cs_test_paid_postback",
+                            "payment_intent": "pi_pb_1",
+                            "customer": "cus_pb_1",
+                            "metadata": {"order_id": order_id},
+                        }
+                    },
+                }
+                monkeypatch.setattr("stripe.Webhook.construct_event", lambda payload, sig, secret: event)
+
+                response = client.post("/api/stripe/webhook", headers={"stripe-signature": "sig-1"}, content=b"{}")
+                assert response.status_code == 200
+                assert response.json() == {"ok": True, "duplicate": False}
+
+                duplicate = client.post("/api/stripe/webhook", headers={"stripe-signature": "sig-1"}, content=b"{}")
+                assert duplicate.status_code == 200
+                assert duplicate.json() == {"ok": True, "duplicate": True}
+
+                assert sent == []
+                _drain_outbox()
+                _drain_postbacks()
+                _drain_postbacks()
+        finally:
+            settings.mobi_slon_postback_url = ""
+    calls = _postback_calls(sent)
+
+    assert len(calls) == 1
+    call = calls[0]
+    assert call["url"] == "https://mobi-slon.example/index.php"
+    assert call["params"] == {"cnv_id": "pb-001", "payout": "9.99", "cnv_status": "pay_success"}
+
+
+def test_frontend_relay_mobi_slon_event_post() -> None:
+    with _outbound_requests() as sent:
+        settings = get_settings()
+        settings.mobi_slon_postback_url = "https://mobi-slon.example/index.php"
+
+        try:
+            with TestClient(app) as client:
+                response = client.post(
+                    "/api/tracking/mobi-slon-event",
+                    json={
+                        "status": "block6_completed",
+                        "clickid": "relay-001",
+                        "session_id": "sess_123",
+                        "page_path": "/block-6?clickid=relay-001",
+                        "tracking_params": {"utm_source": "meta", "utm_campaign": "q1"},
+                    },
+                )
+                assert sent == []
+            # The relay only buffers; the intake writes the queue row when the app shuts down.
+            _drain_postbacks()
+        finally:
+            settings.mobi_slon_postback_url = ""
+    calls = _postback_calls(sent)
 
     assert response.status_code == 200
-    assert response.json() == {"accepted": True, "forwarded": True}
-    assert len(captured_calls) == 1
-    call = captured_calls[0]
+    assert response.json() == {"accepted": True, "forwarded": True, "duplicate": False}
+    assert len(calls) == 1
+    call = calls[0]
     assert call["url"] == "https://mobi-slon.example/index.php"
     assert call["params"] == {
         "cnv_id": "relay-001",
@@ -255,44 +382,31 @@ def test_frontend_relay_mobi_slon_event_post(monkeypatch) -> None:
     }
 
 
-def test_frontend_relay_mobi_slon_event_get_fallback(monkeypatch) -> None:
-    class DummyPostbackResponse:
-        status_code = 200
-        text = "OK"
-
-    captured_calls: list[dict[str, object]] = []
-
-    def fake_httpx_post(
-        url: str,
-        *,
-        params: dict[str, str],
-        timeout: float,
-    ) -> DummyPostbackResponse:
-        captured_calls.append({"url": url, "params": params, "timeout": timeout})
-        return DummyPostbackResponse()
-
-    monkeypatch.setattr("httpx.post", fake_httpx_post)
-    settings = get_settings()
-    settings.mobi_slon_postback_url = "https://mobi-slon.example/index.php"
-
-    try:
-        with TestClient(app) as client:
-            response = client.get(
-                "/api/tracking/mobi-slon-event",
-                params={
-                    "status": "block7_completed",
-                    "clickid": "relay-002",
-                    "utm_medium": "cpc",
-                    "utm_campaign": "launch",
-                },
-            )
-    finally:
-        settings.mobi_slon_postback_url = ""
+def test_frontend_relay_mobi_slon_event_get_fallback() -> None:
+    with _outbound_requests() as sent:
+        settings = get_settings()
+        settings.mobi_slon_postback_url = "https://mobi-slon.example/index.php"
+
+        try:
+            with TestClient(app) as client:
+                response = client.get(
+                    "/api/tracking/mobi-slon-event",
+                    params={
+                        "status": "block7_completed",
+                        "clickid": "relay-002",
+                        "utm_medium": "cpc",
+                        "utm_campaign": "launch",
+                    },
+                )
+            _drain_postbacks()
+        finally:
+            settings.mobi_slon_postback_url = ""
+    calls = _postback_calls(sent)
 
     assert response.status_code == 200
-    assert response.json() == {"accepted": True, "forwarded": True}
-    assert len(captured_calls) == 1
-    call = captured_calls[0]
+    assert response.json() == {"accepted": True, "forwarded": True, "duplicate": False}
+    assert len(calls) == 1
+    call = calls[0]
     assert call["params"] == {
         "cnv_id": "relay-002",
         "payout": "0",
@@ -317,6 +431,63 @@ def test_frontend_relay_mobi_slon_event_rejects_invalid_clickid() -> None:
     assert response.json()["detail"] == "Invalid clickid"
 
 
+def test_frontend_relay_mobi_slon_event_rejects_overlong_clickid() -> None:
+    from fastapi import HTTPException
+    import pytest
+
+    from app.services.mobi_slon_postbacks import PostbackIntake
+    from app.services.mobi_slon_relay import relay_mobi_slon_event
+
+    with TestClient(app) as client:
+        response = client.get("/api/tracking/mobi-slon-event", params={"status": "transition_to_payment", "clickid": "c" * 257})
+    assert response.status_code == 422
+
+    settings = get_settings()
+    intake = PostbackIntake(settings)
+    with pytest.raises(HTTPException) as rejected:
+        relay_mobi_slon_event(
+            settings,
+            status="transition_to_payment",
+            clickid="c" * 257,
+            tracking_params={},
+            session_id=None,
+            page_path=None,
+            intake=intake,
+        )
+    assert rejected.value.status_code == 400
+    assert intake.stats()["accepted"] == 0
+
+
+def test_postback_intake_drops_rejected_rows_instead_of_blocking_the_batch() -> None:
+    import asyncio
+
+    from app.core.db.session import AsyncSessionLocal, async_engine
+    from app.core.models.payment import MobiSlonPostback
+    from app.services.mobi_slon_postbacks import PostbackIntake
+
+    intake = PostbackIntake(get_settings())
+    intake.bind(AsyncSessionLocal)
+    for index in range(3):
+        intake.submit(clickid=f"intake-reject-{index}", status="lead", params={}, source="frontend_relay")
+    # A row the database refuses (here NOT NULL) fails the whole multi-row insert.
+    intake._pending[1]["cnv_status"] = None
+
+    async def flush() -> int:
+        try:
+            return await intake.flush_once()
+        finally:
+            await async_engine.dispose()
+
+    assert asyncio.run(flush()) == 2
+    stats = intake.stats()
+    assert (stats["depth"], stats["written"], stats["rejected"], stats["write_failures"]) == (0, 2, 1, 0)
+    with SessionLocal() as db:
+        written = db.query(MobiSlonPostback).filter(MobiSlonPostback.clickid.like("intake-reject-%"))
+        assert {row.clickid for row in written} == {"intake-reject-0", "intake-reject-2"}
+        written.delete(synchronize_session=False)
+        db.commit()
+
+
 def test_frontend_relay_mobi_slon_event_rejects_removed_pay_status() -> None:
     with TestClient(app) as client:
         response = client.post(
@@ -592,39 +763,1290 @@ def test_meta_event_status_required() -> None:
         assert response.json() == {"error": "status is required"}
 
 
-def test_meta_event_forwarding(monkeypatch) -> None:
-    captured: dict[str, object] = {}
+def test_meta_event_forwarding() -> None:
+    import json
+
+    settings = get_settings()
+    settings.meta_capi_mode = "sync"
+    try:
+        with _outbound_requests(lambda _: httpx.Response(200, json={"events_received": 1})) as sent:
+            with TestClient(app) as client:
+                response = client.get(
+                    "/api/tracking/meta-event",
+                    params={"status": "pay_success", "fbclid": "fb.1.123", "ip": "1.2.3.4", "ua": "Mozilla/Test"},
+                )
+
+                assert response.status_code == 200
+                assert response.json() == {"events_received": 1}
+                stats = client.get("/api/internal/http-clients", headers={"X-Internal-Token": "test-internal-token"}).json()
+    finally:
+        settings.meta_capi_mode = "batched"
+
+    assert len(sent) == 1
+    request = sent[0]
+    assert str(request.url.copy_with(query=None)) == "https://graph.facebook.com/v18.0/1052620673116886/events"
+    assert dict(request.url.params) == {"access_token": "test-meta-token"}
+    payload = json.loads(request.content)
+    assert payload["data"][0]["event_name"] == "pay_success"
+    assert payload["data"][0]["user_data"]["fbc"] == "fb.1.123"
+    assert payload["data"][0]["user_data"]["client_ip_address"] == "1.2.3.4"
+    assert payload["data"][0]["user_data"]["client_user_agent"] == "Mozilla/Test"
+    assert stats["meta"]["requests"] >= 1
+    assert stats["meta"]["statuses"]["2xx"] >= 1
+
+
+def test_meta_event_batched_relay_accepts_dedupes_and_flushes_on_shutdown() -> None:
+    import asyncio
+    import json
+
+    from app.services.meta_capi import META_EVENT_RELAY, MetaEventRelay, build_meta_event
+
+    with _outbound_requests(lambda request: httpx.Response(200, json={"events_received": 2})) as sent:
+        with TestClient(app) as client:
+            responses = [
+                client.get("/api/tracking/meta-event", params={"status": "block6_completed", "event_id": "evt-b6-1"}),
+                client.get("/api/tracking/meta-event", params={"status": "block6_completed", "event_id": "evt-b6-1"}),
+                client.get("/api/tracking/meta-event", params={"status": "pay_success", "fbclid": "fb.1.9"}),
+            ]
+            assert [response.status_code for response in responses] == [202, 202, 202]
+            assert [response.json()["duplicate"] for response in responses] == [False, True, False]
+            assert sent == []
+            stats = client.get("/api/internal/meta-capi", headers={"X-Internal-Token": "test-internal-token"}).json()
+            assert stats["depth"] == 2
+            assert stats["duplicates"] == 1
+
+    assert len(sent) == 1
+    events = json.loads(sent[0].content)["data"]
+    assert [event["event_name"] for event in events] == ["block6_completed", "pay_success"]
+    assert events[0]["event_id"] == "evt-b6-1"
+    assert "event_id" not in events[1]
+    assert META_EVENT_RELAY.stats()["depth"] == 0
+    assert META_EVENT_RELAY.stats()["batches"] >= 1
+
+    settings = get_settings()
+    relay = MetaEventRelay(settings)
+    settings.meta_capi_batch_size, settings.meta_capi_max_attempts = 2, 2
+    statuses = iter([503, 503, 200])
+    try:
+        for index in range(3):
+            event = build_meta_event(status="lead", fbclid="", client_ip="", client_user_agent="", event_id=f"e{index}")
+            relay.enqueue(event)
+        with _outbound_requests(lambda _: httpx.Response(next(statuses))) as sent:
+            assert asyncio.run(relay.flush_once()) == 0
+            assert relay.stats()["depth"] == 3
+            # Second failure exhausts the attempts of the first batch.
+            assert asyncio.run(relay.flush_once()) == 0
+            assert asyncio.run(relay.flush_once()) == 1
+    finally:
+        settings.meta_capi_batch_size, settings.meta_capi_max_attempts = 200, 3
+    assert [len(json.loads(request.content)["data"]) for request in sent] == [2, 2, 1]
+    assert relay.stats() | {"flush_ms_last": 0, "flush_ms_p50": 0, "flush_ms_p95": 0, "oldest_age_seconds": 0} == {
+        "depth": 0,
+        "oldest_age_seconds": 0,
+        "enqueued": 3,
+        "duplicates": 0,
+        "dropped": 0,
+        "sent": 1,
+        "failed": 2,
+        "batches": 3,
+        "flush_ms_last": 0,
+        "flush_ms_p50": 0,
+        "flush_ms_p95": 0,
+    }
+
+
+def test_meta_event_relay_survives_unexpected_flush_errors(monkeypatch) -> None:
+    import asyncio
+
+    from app.services import meta_capi
+    from app.services.meta_capi import MetaEventRelay, build_meta_event
+
+    settings = get_settings()
+    relay = MetaEventRelay(settings)
+    monkeypatch.setattr(settings, "meta_capi_batch_size", 1)
+    calls: list[int] = []
+
+    def send(_container, events):
+        calls.append(len(events))
+        if len(calls) == 1:
+            raise RuntimeError("container not ready")
+        return httpx.Response(200)
+
+    monkeypatch.setattr(meta_capi, "send_meta_events", send)
+
+    async def scenario() -> None:
+        stop = asyncio.Event()
+        task = asyncio.create_task(relay.run(stop))
+        await asyncio.sleep(0)
+        for index in range(2):
+            relay.enqueue(build_meta_event(status="lead", fbclid="", client_ip="", client_user_agent="", event_id=f"x{index}"))
+            await asyncio.sleep(0.05)
+        assert not task.done()
+        stop.set()
+        await asyncio.wait_for(task, timeout=2)
+
+    asyncio.run(scenario())
+    assert calls == [1, 1]
+    assert relay.stats()["sent"] == 1
+
+
+def test_webhook_inbox_mode_acks_fast_and_worker_applies_event(monkeypatch) -> None:
+    import asyncio
+
+    from app.services.webhook_inbox import WebhookInboxWorker
+
+    class DummySession:
+        id = "cs_inbox_1"
+        url = "https://checkout.test/inbox"
+
+    monkeypatch.setattr("stripe.checkout.Session.create", lambda **_: DummySession())
+    settings = get_settings()
+    settings.stripe_webhook_mode = "inbox"
+    settings.webhook_inbox_worker_enabled = False
+
+    try:
+        with TestClient(app) as client:
+            create_response = client.post(
+                "/api/payment/checkout-session",
+                json={
+                    "mode": "one_time",
+                    "plan": "one_time_basic",
+                    "email": "inbox@example.com",
+                    "clickid": "inbox-001",
+                    "locale": "en",
+                },
+            )
+            order_id = create_response.json()["order_id"]
+
+            event = {
+                "id": "evt_inbox_1",
+                "type": "checkout.session.completed",
+                "data": {"object": {"id": "cs_inbox_1", "metadata": {"order_id": order_id}}},
+            }
+            monkeypatch.setattr("stripe.Webhook.construct_event", lambda payload, sig, secret: event)
+
+            response = client.post("/api/stripe/webhook", headers={"stripe-signature": "x"}, content=b"{}")
+            assert response.json() == {"ok": True, "duplicate": False}
+            duplicate = client.post("/api/stripe/webhook", headers={"stripe-signature": "x"}, content=b"{}")
+            assert duplicate.json() == {"ok": True, "duplicate": True}
+
+            pending_status = client.get("/api/payment/session-status", params={"session_id": "cs_inbox_1"})
+            assert pending_status.json()["payment_status"] == "session_created"
+
+            stats = client.get("/api/internal/webhook-inbox", headers={"X-Internal-Token": "test-internal-token"})
+            assert stats.status_code == 200
+            assert stats.json()["depth"] >= 1
+
+            processed = asyncio.run(WebhookInboxWorker(settings, SessionLocal).drain_once())
+            assert processed >= 1
+
+            status = client.get("/api/payment/session-status", params={"session_id": "cs_inbox_1"})
+            assert status.json()["payment_status"] == "paid"
+            assert status.json()["access_status"] == "token_issued"
+
+            stats_after = client.get("/api/internal/webhook-inbox", headers={"X-Internal-Token": "test-internal-token"})
+            assert stats_after.json()["depth"] == 0
+    finally:
+        settings.stripe_webhook_mode = "inline"
+        settings.webhook_inbox_worker_enabled = True
+
+
+def test_webhook_inbox_backs_off_failed_events_and_replays_failed(monkeypatch) -> None:
+    import asyncio
+
+    from sqlalchemy import update
+
+    from app.core.models.payment import PaymentEvent
+    from app.core.security import utcnow
+    from app.services.payment_service import PaymentService
+    from app.services.webhook_inbox import WebhookInboxWorker, requeue_failed_events
+
+    settings = get_settings()
+    settings.webhook_inbox_max_attempts = 2
+    calls: list[str] = []
+
+    def flaky_apply(self, event) -> None:
+        calls.append(event["id"])
+        if len(calls) <= 2:
+            raise RuntimeError("smtp unavailable")
+
+    monkeypatch.setattr(PaymentService, "_apply_webhook_event", flaky_apply)
+
+    def drain() -> int:
+        return asyncio.run(WebhookInboxWorker(settings, SessionLocal).drain_once())
+
+    def state() -> tuple[str, int, bool]:
+        with SessionLocal() as db:
+            event = db.query(PaymentEvent).filter(PaymentEvent.stripe_event_id == "evt_inbox_backoff").one()
+            due = event.next_attempt_at is None or event.next_attempt_at.replace(tzinfo=None) <= utcnow().replace(tzinfo=None)
+            return event.process_result, event.attempts, due
+
+    def make_due() -> None:
+        with SessionLocal() as db:
+            db.execute(
+                update(PaymentEvent)
+                .where(PaymentEvent.stripe_event_id == "evt_inbox_backoff")
+                .values(next_attempt_at=utcnow())
+            )
+            db.commit()
+
+    with SessionLocal() as db:
+        db.add(
+            PaymentEvent(
+                stripe_event_id="evt_inbox_backoff",
+                event_type="checkout.session.expired",
+                payload_json={"id": "evt_inbox_backoff", "type": "checkout.session.expired", "data": {"object": {}}},
+                process_result="pending",
+            )
+        )
+        db.commit()
+
+    try:
+        # A transient failure is retried later, not on the next poll.
+        assert drain() == 0
+        assert state() == ("pending", 1, False)
+        assert drain() == 0
+        assert len(calls) == 1
+
+        make_due()
+        assert drain() == 0
+        assert state()[:2] == ("failed", 2)
+
+        with SessionLocal() as db:
+            assert requeue_failed_events(db, stripe_event_id="evt_inbox_backoff") == 1
+        assert state() == ("pending", 0, True)
+        assert drain() == 1
+        assert state()[:2] == ("processed", 1)
+    finally:
+        settings.webhook_inbox_max_attempts = 5
+
+
+def test_outbox_retries_failed_fulfillment_and_marks_order_done(monkeypatch) -> None:
+    from app.core.models.payment import Order, OutboxMessage
+
+    class DummySession:
+        id = "cs_outbox_retry"
+        url = "https://checkout.test/outbox"
+
+    email_calls: list[str] = []
+
+    def flaky_send_access_email(self, *, email: str, order_id: str, activation_link: str, locale: str) -> None:
+        if email != "outbox@example.com":
+            return
+        email_calls.append(order_id)
+        if len(email_calls) == 1:
+            raise RuntimeError("smtp down")
+
+    monkeypatch.setattr("stripe.checkout.Session.create", lambda **_: DummySession())
+    monkeypatch.setattr("app.core.notifications.LogOnlyEmailSender.send_access_email", flaky_send_access_email)
+
+    with TestClient(app) as client:
+        create_response = client.post(
+            "/api/payment/checkout-session",
+            json={
+                "mode": "one_time",
+                "plan": "one_time_basic",
+                "email": "outbox@example.com",
+                "clickid": "outbox-001",
+                "locale": "en",
+            },
+        )
+        order_id = create_response.json()["order_id"]
+
+        event = {
+            "id": "evt_outbox_retry",
+            "type": "checkout.session.completed",
+            "data": {"object": {"id": "cs_outbox_retry", "metadata": {"order_id": order_id}}},
+        }
+        monkeypatch.setattr("stripe.Webhook.construct_event", lambda payload, sig, secret: event)
+        response = client.post("/api/stripe/webhook", headers={"stripe-signature": "x"}, content=b"{}")
+        assert response.status_code == 200
+        assert email_calls == []
+
+        _drain_outbox()
+        status = client.get("/api/payment/session-status", params={"session_id": "cs_outbox_retry"})
+        assert status.json()["fulfillment_status"] == "partial"
+
+        with SessionLocal() as db:
+            message = db.query(OutboxMessage).filter(OutboxMessage.order_id == order_id).one()
+            assert message.status == "pending"
+            assert message.attempts == 1
+            message.next_attempt_at = message.created_at
+            db.commit()
 
-    class DummyResponse:
-        status_code = 200
-        text = ""
+        _drain_outbox()
+        assert email_calls == [order_id, order_id]
+        with SessionLocal() as db:
+            assert db.get(Order, order_id).fulfillment_status == "done"
 
-        @staticmethod
-        def json() -> dict[str, int]:
-            return {"events_received": 1}
 
-    def fake_post(url: str, *, params: dict[str, str], json: dict[str, object], timeout: float) -> DummyResponse:
-        captured["url"] = url
-        captured["params"] = params
-        captured["json"] = json
-        captured["timeout"] = timeout
-        return DummyResponse()
+def test_webhook_partition_key_groups_events_of_one_subscription() -> None:
+    from app.services.payment_service import PaymentService
+    from app.services.webhook_inbox import partition_index
 
-    monkeypatch.setattr("httpx.post", fake_post)
+    completed = {"id": "evt_a", "type": "checkout.session.completed", "data": {"object": {"id": "cs_1", "customer": "cus_9", "subscription": "sub_9", "metadata": {"order_id": "o1"}}}}
+    invoice = {"id": "evt_b", "type": "invoice.paid", "data": {"object": {"customer": "cus_9", "subscription": "sub_9"}}}
+    deleted = {"id": "evt_c", "type": "customer.subscription.deleted", "data": {"object": {"id": "sub_9", "customer": "cus_9"}}}
+    other = {"id": "evt_d", "type": "checkout.session.completed", "data": {"object": {"id": "cs_2", "metadata": {"order_id": "o2"}}}}
+
+    keys = {PaymentService.webhook_partition_key(event) for event in (completed, invoice, deleted)}
+    assert keys == {"cus_9"}
+    assert PaymentService.webhook_partition_key(other) == "o2"
+    assert partition_index("cus_9", 8) == partition_index("cus_9", 8)
+
+
+def test_webhook_inbox_worker_defers_later_events_and_keeps_partition_order(monkeypatch) -> None:
+    import asyncio
+    from datetime import timedelta
+
+    from sqlalchemy import select, update
+
+    from app.core.models.payment import PaymentEvent
+    from app.core.security import utcnow
+    from app.services.payment_service import PaymentService
+    from app.services.webhook_inbox import WebhookInboxWorker
+
+    settings = get_settings()
+    applied: list[str] = []
+    failing = {"evt_order_1"}
+
+    def record_apply(self, event) -> None:
+        if event["id"] in failing:
+            failing.discard(event["id"])
+            raise RuntimeError("database hiccup")
+        applied.append(event["id"])
+
+    monkeypatch.setattr(PaymentService, "_apply_webhook_event", record_apply)
+
+    started = utcnow() - timedelta(minutes=5)
+    ids: dict[str, str] = {}
+    with SessionLocal() as db:
+        for offset, event_id in enumerate(("evt_order_1", "evt_order_2", "evt_order_3")):
+            row = PaymentEvent(
+                stripe_event_id=event_id,
+                event_type="invoice.paid",
+                partition_key="cus_ordered",
+                payload_json={"id": event_id, "type": "invoice.paid", "data": {"object": {"customer": "cus_ordered"}}},
+                process_result="pending",
+                received_at=started + timedelta(seconds=offset),
+            )
+            db.add(row)
+            db.flush()
+            ids[event_id] = row.id
+        db.commit()
+
+    def result_of(event_id: str) -> str:
+        with SessionLocal() as db:
+            return db.scalars(select(PaymentEvent.process_result).where(PaymentEvent.stripe_event_id == event_id)).one()
+
+    def drain() -> int:
+        return asyncio.run(WebhookInboxWorker(settings, SessionLocal).drain_once())
+
+    # A later event of the partition is not applied while an earlier one is pending.
+    with SessionLocal() as db:
+        assert PaymentService(settings, db).process_inbox_event(ids["evt_order_2"]) == "deferred"
+
+    # The first event fails and backs off; its siblings keep waiting behind it.
+    assert drain() == 0
+    assert applied == []
+    assert [result_of(event_id) for event_id in ids] == ["pending", "pending", "pending"]
+
+    with SessionLocal() as db:
+        db.execute(update(PaymentEvent).where(PaymentEvent.partition_key == "cus_ordered").values(next_attempt_at=utcnow()))
+        db.commit()
+    assert drain() == 3
+    assert applied == ["evt_order_1", "evt_order_2", "evt_order_3"]
+    assert [result_of(event_id) for event_id in ids] == ["processed", "processed", "processed"]
+
+
+def test_webhook_stores_projected_payload_and_acks_ignored_types(monkeypatch) -> None:
+    from app.core.db.session import engine
+    from app.core.event_storage import compact_payment_events
+    from app.core.models.payment import PaymentEvent
+
+    handled_event = {
+        "id": "evt_projected",
+        "type": "checkout.session.expired",
+        "created": 1711111111,
+        "data": {"object": {"id": "cs_missing", "customer_details": {"address": "x" * 200}, "metadata": {"order_id": "o"}}},
+    }
+    ignored_event = {"id": "evt_ignored", "type": "customer.created", "data": {"object": {"id": "cus_new", "name": "n" * 200}}}
 
     with TestClient(app) as client:
-        response = client.get(
-            "/api/tracking/meta-event",
-            params={"status": "pay_success", "fbclid": "fb.1.123", "ip": "1.2.3.4", "ua": "Mozilla/Test"},
+        for event in (handled_event, ignored_event):
+            monkeypatch.setattr("stripe.Webhook.construct_event", lambda payload, sig, secret, event=event: event)
+            response = client.post("/api/stripe/webhook", headers={"stripe-signature": "x"}, content=b"{}")
+            assert response.json() == {"ok": True, "duplicate": False}
+
+    with SessionLocal() as db:
+        projected = db.query(PaymentEvent).filter(PaymentEvent.stripe_event_id == "evt_projected").one()
+        assert projected.payload_json == {
+            "id": "evt_projected",
+            "type": "checkout.session.expired",
+            "created": 1711111111,
+            "data": {"object": {"id": "cs_missing", "metadata": {"order_id": "o"}}},
+        }
+        ignored = db.query(PaymentEvent).filter(PaymentEvent.stripe_event_id == "evt_ignored").one()
+        assert ignored.payload_json == {}
+        assert ignored.process_result == "ignored"
+
+        db.add(
+            PaymentEvent(
+                stripe_event_id="evt_legacy_full",
+                event_type="invoice.paid",
+                payload_json={"id": "evt_legacy_full", "type": "invoice.paid", "data": {"object": {"customer": "c", "hosted_invoice_url": "u" * 500}}},
+            )
+        )
+        db.commit()
+
+    with engine.begin() as connection:
+        report = compact_payment_events(connection)
+    assert report.rows_rewritten >= 1
+    assert report.bytes_saved > 500
+
+
+def test_retention_archives_and_removes_expired_rows(tmp_path) -> None:
+    from datetime import datetime, timedelta, timezone
+    import uuid
+
+    from app.core.archive import lookup_archive
+    from app.core.db.session import engine
+    from app.core.models.payment import AccessToken, MobiSlonPostback, PaymentEvent, PaymentEventKey, RestoreOTP
+    from app.services.retention import run_retention
+
+    old = datetime.now(timezone.utc) - timedelta(days=400)
+    with SessionLocal() as db:
+        for index in range(3):
+            event_id = f"evt_retention_old_{index}"
+            db.add(PaymentEvent(stripe_event_id=event_id, event_type="invoice.paid", payload_json={"id": event_id}, received_at=old))
+            db.add(PaymentEventKey(stripe_event_id=event_id, received_at=old))
+        db.add(PaymentEvent(stripe_event_id="evt_retention_fresh", event_type="invoice.paid", payload_json={}))
+        db.add(RestoreOTP(email="old@example.com", otp_hash="h", expires_at=old, used_at=old))
+        token = AccessToken(order_id=str(uuid.uuid4()), status="revoked", revoked_at=old)
+        db.add(token)
+        sent = MobiSlonPostback(clickid="retention-click", cnv_status="lead", source="server", status="sent", sent_at=old)
+        dead = MobiSlonPostback(clickid="retention-click", cnv_status="sale", source="server", status="dead", created_at=old)
+        db.add_all([sent, dead])
+        db.commit()
+        token_id, token_order_id = token.id, token.order_id
+        sent_id, dead_id = sent.id, dead.id
+
+    dry = run_retention(engine, days=180, archive_dir=tmp_path, dry_run=True)
+    assert dry.rows_archived["payment_events"] >= 3
+    assert dry.archives == []
+
+    report = run_retention(engine, days=180, archive_dir=tmp_path)
+    assert report.rows_archived["payment_events"] >= 3
+    assert report.rows_archived["restore_otps"] >= 1
+    assert report.rows_archived["access_tokens"] >= 1
+    assert report.rows_archived["mobi_slon_postbacks"] >= 1
+    assert report.keys_pruned >= 3
+
+    events_archive = next(path for path in report.archives if path.parent.name == "payment_events")
+    record = lookup_archive(events_archive, "evt_retention_old_1")
+    assert record is not None and record["payload_json"] == {"id": "evt_retention_old_1"}
+    assert lookup_archive(events_archive, "evt_retention_missing") is None
+    tokens_archive = next(path for path in report.archives if path.parent.name == "access_tokens")
+    token_record = lookup_archive(tokens_archive, token_id)
+    assert token_record is not None and token_record["order_id"] == token_order_id
+    postbacks_archive = next(path for path in report.archives if path.parent.name == "mobi_slon_postbacks")
+    postback_record = lookup_archive(postbacks_archive, sent_id)
+    assert postback_record is not None and postback_record["clickid"] == "retention-click"
+    assert lookup_archive(postbacks_archive, dead_id) is None
+
+    with SessionLocal() as db:
+        remaining = {row.stripe_event_id for row in db.query(PaymentEvent).filter(PaymentEvent.stripe_event_id.like("evt_retention_%"))}
+        assert remaining == {"evt_retention_fresh"}
+        assert db.query(AccessToken).filter(AccessToken.order_id == token_order_id).count() == 0
+        # Dead postbacks are kept for replay.
+        assert {row.id for row in db.query(MobiSlonPostback).filter(MobiSlonPostback.clickid == "retention-click")} == {dead_id}
+
+
+def test_monthly_partition_creation_moves_matching_default_rows() -> None:
+    # Needs a real PostgreSQL (e.g. the isolated test stack); everything runs in a scratch schema.
+    from datetime import datetime, timezone
+    import uuid
+
+    import pytest
+    from sqlalchemy import create_engine, text
+
+    from app.core.db.partitions import add_months, ensure_monthly_partitions, month_start
+
+    url = os.environ.get("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    schema = f"partition_probe_{uuid.uuid4().hex[:12]}"
+    pg = create_engine(url)
+    this_month = month_start(datetime.now(timezone.utc))
+    next_month, far_month = add_months(this_month, 1), add_months(this_month, 12)
+    try:
+        with pg.begin() as connection:
+            connection.execute(text(f'CREATE SCHEMA "{schema}"'))
+            connection.execute(
+                text(
+                    f'CREATE TABLE "{schema}".events (id INTEGER NOT NULL, received_at TIMESTAMPTZ NOT NULL, '
+                    "PRIMARY KEY (id, received_at)) PARTITION BY RANGE (received_at)"
+                )
+            )
+            connection.execute(text(f'CREATE TABLE "{schema}".events_default PARTITION OF "{schema}".events DEFAULT'))
+            connection.execute(
+                text(f'INSERT INTO "{schema}".events VALUES (1, :next_month), (2, :next_month), (3, :far_month)'),
+                {"next_month": next_month, "far_month": far_month},
+            )
+
+        with pg.begin() as connection:
+            created = ensure_monthly_partitions(
+                connection,
+                schema=schema,
+                table="events",
+                first_month=this_month,
+                last_month=next_month,
+                default_partition="events_default",
+            )
+
+        moved_into = f"events_{next_month:%Y_%m}"
+        assert created == [f"events_{this_month:%Y_%m}", moved_into]
+        with pg.connect() as connection:
+            rows = connection.execute(text(f'SELECT tableoid::regclass::text, id FROM "{schema}".events ORDER BY id')).all()
+        assert [(table.split(".")[-1].strip('"'), row_id) for table, row_id in rows] == [
+            (moved_into, 1),
+            (moved_into, 2),
+            ("events_default", 3),
+        ]
+    finally:
+        with pg.begin() as connection:
+            connection.execute(text(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE'))
+        pg.dispose()
+
+
+def test_retention_archive_order_is_valid_for_postgres_uuid_keys() -> None:
+    from typing import cast
+
+    from sqlalchemy import Table, select
+    from sqlalchemy.dialects import postgresql
+
+    from app.core.models.payment import AccessToken, MobiSlonPostback, PaymentEvent
+    from app.services.retention import _archive_key
+
+    def order_by_sql(table: Table, key_column: str) -> str:
+        query = select(table.c.id).order_by(_archive_key(table, key_column, "postgresql"))
+        return str(query.compile(dialect=postgresql.dialect())).split("ORDER BY", 1)[1].strip()
+
+    # PostgreSQL rejects COLLATE on a uuid column, so uuid keys must be cast to text first.
+    tokens = cast(Table, AccessToken.__table__)
+    assert order_by_sql(tokens, "id") == f'CAST({tokens.fullname}.id AS TEXT) COLLATE "C"'
+    postbacks = cast(Table, MobiSlonPostback.__table__)
+    assert order_by_sql(postbacks, "id") == f'CAST({postbacks.fullname}.id AS TEXT) COLLATE "C"'
+    events = cast(Table, PaymentEvent.__table__)
+    assert order_by_sql(events, "stripe_event_id") == f'{events.fullname}.stripe_event_id COLLATE "C"'
+
+
+def test_entitlement_rebuild_keeps_precedence_and_lookup_is_single_query() -> None:
+    from sqlalchemy import event
+
+    from app.core.db.session import engine
+    from app.core.models.payment import AccessBinding, Order
+    from app.services.entitlements import rebuild_entitlements
+    from app.services.payment_service import PaymentService
+
+    def make_order(**values: object) -> Order:
+        return Order(email="rank@example.com", mode="one_time", plan="one_time_basic", amount_minor=999, currency="usd", **values)
+
+    with SessionLocal() as db:
+        paid = make_order(status="paid", access_status="active")
+        revoked = make_order(status="paid", access_status="revoked")
+        chat_only = make_order(status="paid", access_status="active", telegram_chat_id="rank-chat")
+        db.add_all([paid, revoked, chat_only])
+        db.flush()
+        db.add(AccessBinding(order_id=paid.id, telegram_user_id="rank-active", status="active"))
+        db.add(AccessBinding(order_id=revoked.id, telegram_user_id="rank-revoked", status="revoked"))
+        db.commit()
+        # Rows inserted behind the service's back only show up after a rebuild.
+        assert PaymentService(get_settings(), db).get_access_status_by_telegram_user("rank-active")["is_paid"] is False
+        rebuild_entitlements(db)
+
+    with SessionLocal() as db:
+        statements: list[str] = []
+
+        def count(*args: object) -> None:
+            statements.append(str(args[2]))
+
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            service = PaymentService(get_settings(), db)
+            active = service.get_access_status_by_telegram_user("rank-active")
+            inactive = service.get_access_status_by_telegram_user("rank-revoked")
+            fallback = service.get_access_status_by_telegram_user("rank-chat")
+            missing = service.get_access_status_by_telegram_user("rank-nobody")
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+
+    assert len(statements) == 4
+    assert active == {"is_paid": True, "order_id": paid.id, "plan": "one_time_basic", "access_status": "active"}
+    assert inactive["is_paid"] is False and inactive["order_id"] == revoked.id
+    assert fallback["is_paid"] is True and fallback["order_id"] == chat_only.id
+    assert missing == {"is_paid": False, "order_id": None, "plan": None, "access_status": None}
+
+
+def test_access_status_is_cached_and_invalidated_by_activation() -> None:
+    from app.core.models.payment import AccessToken, Order
+    from app.core.security import make_access_token
+
+    headers = {"X-Internal-Token": "test-internal-token"}
+    with SessionLocal() as db:
+        order = Order(email="cache@example.com", mode="one_time", plan="one_time_basic", amount_minor=999, currency="usd", status="paid")
+        db.add(order)
+        db.flush()
+        token = AccessToken(order_id=order.id, status="issued")
+        db.add(token)
+        db.commit()
+        activation_token = make_access_token(token.id, "test-secret")
+
+    with TestClient(app) as client:
+        before = client.get("/api/internal/access-cache", headers=headers).json()
+        for _ in range(2):
+            status = client.post("/api/bot/access/status", json={"telegram_user_id": "cache-user"}, headers=headers)
+            assert status.json()["is_paid"] is False
+        after = client.get("/api/internal/access-cache", headers=headers).json()
+        assert after["misses"] - before["misses"] == 1
+        assert after["hits"] - before["hits"] == 1
+
+        activated = client.post(
+            "/api/bot/access/activate",
+            json={"activation_token": activation_token, "telegram_user_id": "cache-user"},
+            headers=headers,
         )
+        assert activated.status_code == 200
+
+        status = client.post("/api/bot/access/status", json={"telegram_user_id": "cache-user"}, headers=headers)
+        assert status.json()["is_paid"] is True
+
+
+def test_entitlement_changes_are_published_to_feed_after_commit() -> None:
+    import asyncio
 
+    from app.core.models.payment import AccessToken, Order
+    from app.core.security import make_access_token
+    from app.services.entitlements import ENTITLEMENT_FEED
+    from app.services.payment_service import PaymentService
+
+    with SessionLocal() as db:
+        order = Order(email="feed@example.com", mode="one_time", plan="one_time_basic", amount_minor=999, currency="usd", status="paid")
+        db.add(order)
+        db.flush()
+        token = AccessToken(order_id=order.id, status="issued")
+        db.add(token)
+        db.commit()
+        activation_token = make_access_token(token.id, "test-secret")
+
+    def activate() -> None:
+        with SessionLocal() as db:
+            PaymentService(get_settings(), db).activate_access(activation_token=activation_token, telegram_user_id="feed-user")
+
+    async def scenario() -> dict[str, object]:
+        ENTITLEMENT_FEED.bind(asyncio.get_running_loop())
+        async with ENTITLEMENT_FEED.subscribe() as queue:
+            await asyncio.to_thread(activate)
+            return await asyncio.wait_for(queue.get(), timeout=2)
+
+    event = asyncio.run(scenario())
+    assert event["type"] == "entitlement"
+    assert event["telegram_user_id"] == "feed-user"
+    assert event["is_paid"] is True
+    assert event["order_id"] == order.id
+
+
+def test_bot_access_changes_stream_ends_on_app_shutdown() -> None:
+    import threading
+    import time
+
+    from app.services.entitlements import ENTITLEMENT_FEED
+
+    client = TestClient(app)
+    client.__enter__()
+    responses: list[httpx.Response] = []
+
+    def consume() -> None:
+        responses.append(client.get("/api/bot/access/changes", headers={"X-Internal-Token": "test-internal-token"}))
+
+    stream = threading.Thread(target=consume, daemon=True)
+    try:
+        stream.start()
+        deadline = time.monotonic() + 5
+        while ENTITLEMENT_FEED.stats()["subscribers"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert ENTITLEMENT_FEED.stats()["subscribers"] == 1
+    finally:
+        # Lifespan shutdown closes the feed; the open stream must end instead of holding the shutdown up.
+        shutdown = threading.Thread(target=client.__exit__, args=(None, None, None), daemon=True)
+        shutdown.start()
+        shutdown.join(timeout=5)
+    assert not shutdown.is_alive()
+    stream.join(timeout=5)
+    assert not stream.is_alive()
+    assert responses[0].status_code == 200
+    assert responses[0].text.startswith("event: ready")
+    assert ENTITLEMENT_FEED.stats()["subscribers"] == 0
+
+
+def test_entitlement_snapshot_lists_entitled_numeric_users_sorted(tmp_path) -> None:
+    import struct
+
+    from app.core.models.payment import Entitlement
+    from app.services.entitlement_snapshot import SNAPSHOT_HEADER, SNAPSHOT_MAGIC, write_entitlement_snapshot
+
+    with SessionLocal() as db:
+        db.merge(Entitlement(telegram_user_id="900000002", plan="one_time_basic", access_status="active", is_paid=True))
+        db.merge(Entitlement(telegram_user_id="900000001", access_status="grace_period", is_paid=False))
+        db.merge(Entitlement(telegram_user_id="900000003", access_status="revoked", is_paid=False))
+        db.merge(Entitlement(telegram_user_id="snapshot-user", access_status="active", is_paid=True))
+        db.commit()
+
+        path = tmp_path / "entitlements.bin"
+        first = write_entitlement_snapshot(db, path)
+        second = write_entitlement_snapshot(db, path)
+
+    data = path.read_bytes()
+    magic, _, _, version, _, count = SNAPSHOT_HEADER.unpack_from(data)
+    ids = list(struct.unpack_from(f"<{count}q", data, SNAPSHOT_HEADER.size))
+    assert magic == SNAPSHOT_MAGIC
+    assert version == second.version == first.version + 1
+    assert len(data) == second.size_bytes == SNAPSHOT_HEADER.size + 8 * count
+    assert ids == sorted(ids)
+    assert 900000001 in ids and 900000002 in ids
+    assert 900000003 not in ids
+    assert not (tmp_path / "entitlements.bin.tmp").exists()
+
+
+def test_bot_access_status_batch_resolves_many_users_in_one_query() -> None:
+    from sqlalchemy import event
+
+    from app.core.db.session import async_engine
+    from app.core.models.payment import Entitlement
+    from app.services.entitlements import ACCESS_STATUS_CACHE
+
+    with SessionLocal() as db:
+        db.merge(Entitlement(telegram_user_id="batch-paid", order_id=None, plan="one_time_basic", access_status="active", is_paid=True))
+        db.merge(Entitlement(telegram_user_id="batch-revoked", access_status="revoked", is_paid=False))
+        db.commit()
+    ACCESS_STATUS_CACHE.clear()
+
+    headers = {"X-Internal-Token": "test-internal-token"}
+    user_ids = ["batch-paid", "batch-revoked", "batch-unknown", "batch-paid"]
+    statements: list[str] = []
+
+    def count(*args: object) -> None:
+        statements.append(str(args[2]))
+
+    with TestClient(app) as client:
+        event.listen(async_engine.sync_engine, "before_cursor_execute", count)
+        try:
+            response = client.post("/api/bot/access/status/batch", json={"telegram_user_ids": user_ids}, headers=headers)
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", count)
         assert response.status_code == 200
-        assert response.json() == {"events_received": 1}
-        assert captured["url"] == "https://graph.facebook.com/v18.0/1052620673116886/events"
-        assert captured["params"] == {"access_token": "test-meta-token"}
-        payload = captured["json"]
-        assert isinstance(payload, dict)
-        assert payload["data"][0]["event_name"] == "pay_success"
-        assert payload["data"][0]["user_data"]["fbc"] == "fb.1.123"
-        assert payload["data"][0]["user_data"]["client_ip_address"] == "1.2.3.4"
-        assert payload["data"][0]["user_data"]["client_user_agent"] == "Mozilla/Test"
+        statuses = response.json()["statuses"]
+        assert list(statuses) == ["batch-paid", "batch-revoked", "batch-unknown"]
+        assert statuses["batch-paid"]["is_paid"] is True
+        assert statuses["batch-revoked"] == {"is_paid": False, "order_id": None, "plan": None, "access_status": "revoked"}
+        assert statuses["batch-unknown"] == {"is_paid": False, "order_id": None, "plan": None, "access_status": None}
+        assert len([statement for statement in statements if "entitlements" in statement]) == 1
+
+        single = client.post("/api/bot/access/status", json={"telegram_user_id": "batch-paid"}, headers=headers)
+        assert single.json() == statuses["batch-paid"]
+
+        assert client.post("/api/bot/access/status/batch", json={"telegram_user_ids": []}, headers=headers).status_code == 422
+        assert client.post("/api/bot/access/status/batch", json={"telegram_user_ids": ["x"]}).status_code == 401
+
+
+def test_read_only_endpoints_use_replica_except_recent_changes(tmp_path) -> None:
+    from sqlalchemy import create_engine
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import NullPool
+
+    from app.core.db.session import get_async_replica_db, get_replica_db
+    from app.core.models.payment import AccessToken, Base, Entitlement, Order
+    from app.core.security import make_access_token
+    from app.services.entitlements import ACCESS_STATUS_CACHE
+
+    # A second local database stands in for a lagging replica.
+    replica_path = tmp_path / "replica.db"
+    replica_engine = create_engine(f"sqlite:///{replica_path}", poolclass=NullPool)
+    Base.metadata.create_all(replica_engine)
+    ReplicaSession = sessionmaker(bind=replica_engine, expire_on_commit=False)
+    AsyncReplicaSession = async_sessionmaker(
+        bind=create_async_engine(f"sqlite+aiosqlite:///{replica_path}", poolclass=NullPool),
+        expire_on_commit=False,
+        class_=AsyncSession,
+    )
+    with ReplicaSession() as replica:
+        replica.add(Entitlement(telegram_user_id="replica-user", access_status="active", is_paid=True))
+        replica.add(Entitlement(telegram_user_id="replica-rw-user", access_status=None, is_paid=False))
+        replica.add(
+            Order(
+                email="replica@example.com",
+                mode="one_time",
+                plan="one_time_basic",
+                amount_minor=999,
+                currency="usd",
+                status="paid",
+                stripe_session_id="cs_replica_only",
+            )
+        )
+        replica.commit()
+
+    with SessionLocal() as db:
+        order = Order(email="replica-rw@example.com", mode="one_time", plan="one_time_basic", amount_minor=999, currency="usd", status="paid")
+        db.add(order)
+        db.flush()
+        token = AccessToken(order_id=order.id, status="issued")
+        db.add(token)
+        db.commit()
+        activation_token = make_access_token(token.id, "test-secret")
+
+    def replica_db():
+        with ReplicaSession() as db:
+            yield db
+
+    async def async_replica_db():
+        async with AsyncReplicaSession() as db:
+            yield db
+
+    headers = {"X-Internal-Token": "test-internal-token"}
+    ACCESS_STATUS_CACHE.clear()
+    app.dependency_overrides[get_replica_db] = replica_db
+    app.dependency_overrides[get_async_replica_db] = async_replica_db
+    try:
+        with TestClient(app) as client:
+            status = client.post("/api/bot/access/status", json={"telegram_user_id": "replica-user"}, headers=headers)
+            assert status.json()["is_paid"] is True
+            assert client.get("/api/payment/session-status", params={"session_id": "cs_replica_only"}).status_code == 200
+
+            activated = client.post(
+                "/api/bot/access/activate",
+                json={"activation_token": activation_token, "telegram_user_id": "replica-rw-user"},
+                headers=headers,
+            )
+            assert activated.status_code == 200
+            # The replica still says unpaid; a just-changed user is read from the primary.
+            status = client.post("/api/bot/access/status", json={"telegram_user_id": "replica-rw-user"}, headers=headers)
+            assert status.json()["is_paid"] is True
+
+            ACCESS_STATUS_CACHE.clear()
+            batch = client.post(
+                "/api/bot/access/status/batch",
+                json={"telegram_user_ids": ["replica-user", "replica-rw-user"]},
+                headers=headers,
+            )
+            assert {user_id: item["is_paid"] for user_id, item in batch.json()["statuses"].items()} == {
+                "replica-user": True,
+                "replica-rw-user": True,
+            }
+    finally:
+        app.dependency_overrides.pop(get_replica_db, None)
+        app.dependency_overrides.pop(get_async_replica_db, None)
+
+
+def test_db_pool_metrics_report_checkouts_and_sizing() -> None:
+    headers = {"X-Internal-Token": "test-internal-token"}
+    with TestClient(app) as client:
+        client.post("/api/bot/access/status", json={"telegram_user_id": "pool-user"}, headers=headers)
+        client.get("/api/internal/outbox", headers=headers)
+        stats = client.get("/api/internal/db-pool", headers=headers).json()
+
+    settings = get_settings()
+    for name in ("primary", "primary_async"):
+        pool = stats[name]
+        assert pool["checkouts"] >= 1
+        assert pool["connects"] >= 1
+        assert pool["size"] == settings.db_pool_size
+        assert pool["max_overflow"] == settings.db_max_overflow
+        assert pool["wait_ms_p95"] >= pool["wait_ms_p50"] >= 0
+        assert pool["timeouts"] == 0
+
+
+def test_status_columns_reject_unknown_values_and_keep_stripe_status() -> None:
+    import pytest
+    from sqlalchemy.exc import StatementError
+
+    from app.core.models.payment import Order
+    from app.services.payment_service import PaymentService
+
+    with SessionLocal() as db:
+        order = Order(
+            email="enum@example.com",
+            mode="subscription",
+            plan="sub_monthly",
+            amount_minor=1999,
+            currency="usd",
+            status="paid",
+            stripe_subscription_id="sub_enum",
+        )
+        db.add(order)
+        db.commit()
+
+        service = PaymentService(get_settings(), db)
+        service._update_order_status_by_subscription("sub_enum", "trialing", None)
+        db.commit()
+        assert db.get(Order, order.id).status == "trialing"
+        service._update_order_status_by_subscription("sub_enum", "some_future_status", 1_900_000_000)
+        db.commit()
+        db.refresh(order)
+        assert order.status == "trialing"
+        assert order.stripe_current_period_end is not None
+
+        order.fulfillment_status = "shipped"
+        with pytest.raises(StatementError):
+            db.commit()
+
+
+def test_payment_service_hot_paths_stay_within_query_budgets() -> None:
+    from datetime import timedelta
+
+    from app.core.db.query_stats import query_budget
+    from app.core.models.payment import AccessToken, Order, RestoreOTP
+    from app.core.security import hash_value, make_access_token, utcnow
+    from app.services.payment_service import PaymentService
+
+    settings = get_settings()
+    with SessionLocal() as db:
+        order = Order(
+            email="budget@example.com",
+            mode="one_time",
+            plan="one_time_basic",
+            amount_minor=999,
+            currency="usd",
+            status="paid",
+            stripe_session_id="cs_budget",
+        )
+        db.add(order)
+        db.flush()
+        token = AccessToken(order_id=order.id, status="issued")
+        db.add(token)
+        db.add(RestoreOTP(email=order.email, otp_hash=hash_value("654321"), expires_at=utcnow() + timedelta(minutes=5)))
+        db.commit()
+        service = PaymentService(settings, db)
+
+        with query_budget(2):
+            service.get_session_status("cs_budget")
+        with query_budget(9):
+            service.activate_access(activation_token=make_access_token(token.id, settings.access_token_secret), telegram_user_id="budget-1")
+        with query_budget(14):
+            result = service.restore_confirm(email=order.email, otp="654321", telegram_user_id="budget-2")
+        assert result["access_granted"] is True
+
+    import pytest
+
+    with pytest.raises(AssertionError, match="budget is 0"):
+        with SessionLocal() as db, query_budget(0):
+            PaymentService(settings, db).get_session_status("cs_budget")
+
+
+def test_server_timing_reports_request_queries() -> None:
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/bot/access/status", json={"telegram_user_id": "timing-user"}, headers={"X-Internal-Token": "test-internal-token"}
+        )
+        health = client.get("/health")
+
+    assert response.status_code == 200
+    db_timing, app_timing = response.headers["server-timing"].split(", ")
+    assert db_timing.startswith("db;dur=") and db_timing.endswith('queries"')
+    assert int(db_timing.split('desc="')[1].split()[0]) >= 1
+    assert app_timing.startswith("app;dur=")
+    assert 'desc="0 queries"' in health.headers["server-timing"]
+
+
+def test_slow_queries_are_logged_redacted_with_caller_and_plan(monkeypatch, caplog) -> None:
+    import asyncio
+    import logging
+
+    from app.core.db.session import AsyncSessionLocal, async_engine
+    from app.core.db.slow_queries import SLOW_QUERY_LOG
+    from app.services.async_payment_service import AsyncPaymentService
+    from app.services.payment_service import PaymentService
+
+    monkeypatch.setattr(SLOW_QUERY_LOG, "threshold_ms", 0.0001)
+    monkeypatch.setattr(SLOW_QUERY_LOG, "_explained", type(SLOW_QUERY_LOG._explained)(1024, 300))
+    caplog.set_level(logging.WARNING, logger="quiz.db.slow")
+
+    with SessionLocal() as db:
+        PaymentService(get_settings(), db).restore_request(email="slow-query@example.com")
+
+    async def read_status() -> None:
+        async with AsyncSessionLocal() as db:
+            await AsyncPaymentService(get_settings(), db).get_access_status_by_telegram_user("slow-query-user")
+        await async_engine.dispose()
+
+    asyncio.run(read_status())
+    SLOW_QUERY_LOG.wait_idle()
+
+    messages = [record.getMessage() for record in caplog.records]
+    slow = [message for message in messages if message.startswith("slow_query ")]
+    assert any("caller=PaymentService.restore_request" in message for message in slow)
+    assert any("caller=AsyncPaymentService.get_access_status_by_telegram_user" in message for message in slow)
+    assert all("slow-query@example.com" not in message for message in messages)
+    assert any("<str:22>" in message for message in slow)
+    assert any(message.startswith("slow_query_plan ") for message in messages)
+
+
+def test_app_container_shares_clients_and_resolves_bot_username_once(monkeypatch) -> None:
+    from app.core.notifications import TelegramSender
+    from app.services.payment_service import PaymentService
+
+    with TestClient(app) as client:
+        container = client.app.state.container
+        assert container is get_container()
+        with SessionLocal() as db:
+            first = PaymentService(get_settings(), db)
+            second = PaymentService(get_settings(), db)
+        assert first.telegram_sender is second.telegram_sender is container.telegram_sender
+        assert first.plan_map is container.plan_map
+
+    def get_me(request: httpx.Request) -> httpx.Response:
+        if len(sent) == 1:
+            return httpx.Response(502)
+        return httpx.Response(200, json={"result": {"username": "resolved_bot"}})
+
+    settings = get_settings().model_copy(update={"telegram_bot_username": "", "telegram_bot_token": "123:abc"})
+    with _outbound_requests(get_me) as sent:
+        sender = TelegramSender(settings, get_container().http)
+        assert sender.build_deep_link("tok") == ""
+        assert sender.build_deep_link("tok") == ""
+        assert len(sent) == 1
+
+        monkeypatch.setattr("app.core.notifications.BOT_USERNAME_RETRY_SECONDS", 0.0)
+        assert [sender.build_deep_link(f"tok{index}") for index in range(3)] == [
+            "https://t.me/resolved_bot?start=tok0",
+            "https://t.me/resolved_bot?start=tok1",
+            "https://t.me/resolved_bot?start=tok2",
+        ]
+        assert len(sent) == 2
+    assert sent[0].url.path == "/bot123:abc/getMe"
+
+
+def test_ad_hoc_containers_are_cached_per_settings_and_leave_stripe_globals_alone() -> None:
+    import stripe
+
+    from app.core.container import close_ad_hoc_containers, container_for
+    from app.services.payment_service import PaymentService
+
+    process = get_container()
+    api_key, http_client = stripe.api_key, stripe.default_http_client
+    settings = get_settings().model_copy(update={"stripe_secret_key": "sk_test_ad_hoc"})
+    with SessionLocal() as db:
+        first = PaymentService(settings, db)
+        second = PaymentService(settings, db)
+    ad_hoc = container_for(settings)
+    assert first.http is second.http is ad_hoc.http
+    assert ad_hoc is not process and ad_hoc.settings is settings
+    assert container_for(get_settings()) is process
+    assert (stripe.api_key, stripe.default_http_client) == (api_key, http_client)
+
+    close_ad_hoc_containers()
+    assert container_for(settings) is not ad_hoc
+    close_ad_hoc_containers()
+
+
+def test_outbound_clients_retry_connect_errors_and_carry_stripe_calls(monkeypatch) -> None:
+    import pytest
+    import stripe
+
+    from app.core.http_clients import OutboundClients
+
+    monkeypatch.setattr("app.core.http_clients.CONNECT_RETRY_BACKOFF_SECONDS", 0.0)
+    attempts: list[str] = []
+
+    def flaky(request: httpx.Request) -> httpx.Response:
+        attempts.append(request.url.host)
+        if len(attempts) < 3 or request.url.host == "api.telegram.org":
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(204)
+
+    http = OutboundClients(get_settings())
+    http.transport = httpx.MockTransport(flaky)
+    try:
+        assert http.client("mobi_slon") is http.client("mobi_slon")
+        assert http.client("mobi_slon").post("https://mobi-slon.example/index.php").status_code == 204
+        # Out of retries the connect error reaches the caller.
+        attempts.clear()
+        with pytest.raises(httpx.ConnectError):
+            http.client("telegram").get("https://api.telegram.org/bot1:x/getMe")
+        assert len(attempts) == 3
+    finally:
+        http.close()
+    stats = http.stats()
+    assert stats["mobi_slon"]["requests"] == 1
+    assert stats["mobi_slon"]["retries"] == 2
+    assert stats["mobi_slon"]["errors"] == {"ConnectError": 2}
+    assert stats["mobi_slon"]["statuses"] == {"2xx": 1}
+    assert stats["mobi_slon"]["open"] is False
+    assert stats["telegram"]["requests"] == 1
+    assert stats["telegram"]["retries"] == 2
+
+    customer = {"id": "cus_shared", "object": "customer"}
+    with _outbound_requests(lambda _: httpx.Response(200, json=customer)) as sent:
+        assert stripe.Customer.retrieve("cus_shared").id == "cus_shared"
+    assert [request.url.host for request in sent] == ["api.stripe.com"]
+    assert get_container().http.stats()["stripe"]["requests"] >= 1
+
+
+def test_mobi_slon_postback_queue_dedupes_backs_off_and_opens_circuit() -> None:
+    import asyncio
+    import uuid
+
+    from sqlalchemy import update
+
+    from app.core.models.payment import MobiSlonPostback, OutboxMessage
+    from app.core.security import utcnow
+    from app.services.mobi_slon_postbacks import CircuitBreaker, requeue_dead_postbacks
+
+    def rows() -> dict[str, tuple[str, int]]:
+        with SessionLocal() as db:
+            postbacks = db.query(MobiSlonPostback).filter(MobiSlonPostback.clickid == "queue-001").all()
+            return {postback.cnv_status: (postback.status, postback.attempts) for postback in postbacks}
+
+    settings = get_settings()
+    settings.mobi_slon_postback_url = "https://mobi-slon.example/index.php"
+    settings.mobi_slon_concurrency = 1
+    codes = iter([503, 503, 200, 400, 200, 200])
+    breaker = CircuitBreaker(failure_threshold=2, cooldown_seconds=60.0)
+
+    def drain() -> int:
+        return asyncio.run(MobiSlonPostbackWorker(settings, SessionLocal, breaker=breaker).drain_once())
+
+    try:
+        with _outbound_requests(lambda _: httpx.Response(next(codes))) as sent:
+            with TestClient(app) as client:
+                relayed = [
+                    client.post("/api/tracking/mobi-slon-event", json={"status": status, "clickid": "queue-001"}).json()
+                    for status in ("block1_completed", "block1_completed", "block2_completed", "block3_completed")
+                ]
+                stats = client.get("/api/internal/mobi-slon-postbacks", headers={"X-Internal-Token": "test-internal-token"})
+            assert [response["duplicate"] for response in relayed] == [False, True, False, False]
+            assert stats.json()["intake"]["accepted"] >= 3
+            assert sorted(rows().values()) == [("pending", 0)] * 3
+            assert sent == []
+
+            # Two tracker failures open the circuit; the third postback is left untouched.
+            assert drain() == 0
+            assert breaker.state == "open"
+            assert sorted(rows().values()) == [("pending", 0), ("pending", 1), ("pending", 1)]
+            assert drain() == 0
+            assert len(sent) == 2
+
+            # After the cooldown a single probe goes out (the failed ones are still backing off) and closes it.
+            breaker.cooldown_seconds = 0.0
+            assert breaker.state == "half_open"
+            assert drain() == 1
+            assert breaker.state == "closed"
+
+            with SessionLocal() as db:
+                db.execute(update(MobiSlonPostback).where(MobiSlonPostback.clickid == "queue-001").values(next_attempt_at=utcnow()))
+                db.commit()
+            # A 4xx will not change on retry: dead at once, kept for replay.
+            assert drain() == 1
+            assert sorted(status for status, _ in rows().values()) == ["dead", "sent", "sent"]
+            with SessionLocal() as db:
+                assert requeue_dead_postbacks(db, clickid="queue-001") == 1
+            assert drain() == 1
+            assert sorted(status for status, _ in rows().values()) == ["sent", "sent", "sent"]
+
+            # Postbacks recorded in the fulfillment outbox by older releases collapse into the queue.
+            with SessionLocal() as db:
+                legacy = OutboxMessage(
+                    kind="mobi_slon_postback",
+                    order_id=str(uuid.uuid4()),
+                    payload_json={"status": "block1_completed", "clickid": "queue-001", "source": "stripe_webhook"},
+                )
+                db.add(legacy)
+                db.commit()
+                legacy_id = legacy.id
+            _drain_outbox()
+            with SessionLocal() as db:
+                assert db.get(OutboxMessage, legacy_id).status == "sent"
+            assert len(rows()) == 3
+        assert [dict(request.url.params)["cnv_status"] for request in sent][:2] == ["block1_completed", "block2_completed"]
+        assert len(sent) == 6
+    finally:
+        settings.mobi_slon_postback_url = ""
+        settings.mobi_slon_concurrency = 4
+
+
+def test_mobi_slon_postback_delivery_holds_no_transaction_during_the_request(monkeypatch) -> None:
+    from app.core.db.session import engine
+    from app.core.models.payment import MobiSlonPostback
+    from app.core.security import utcnow
+    from app.services import mobi_slon_postbacks
+    from app.services.mobi_slon_postbacks import CircuitBreaker, PostbackResult
+
+    with SessionLocal() as db:
+        postback = MobiSlonPostback(clickid="lease-001", cnv_status="lead", source="frontend_relay", next_attempt_at=utcnow())
+        db.add(postback)
+        db.commit()
+        postback_id = postback.id
+
+    worker = MobiSlonPostbackWorker(get_settings(), SessionLocal, breaker=CircuitBreaker(5, 30.0))
+    during_send: dict[str, object] = {}
+
+    def send(container, **claimed):
+        during_send["checked_out"] = engine.pool.checkedout()
+        with SessionLocal() as db:
+            leased = db.get(MobiSlonPostback, postback_id)
+            during_send["leased"] = leased.next_attempt_at.replace(tzinfo=None) > utcnow().replace(tzinfo=None)
+        # Another worker slot sees the row as claimed.
+        during_send["reclaimed"] = worker.deliver(postback_id)
+        during_send["claimed"] = claimed
+        return PostbackResult(delivered=True)
+
+    monkeypatch.setattr(mobi_slon_postbacks, "send_postback", send)
+    assert worker.deliver(postback_id) == "sent"
+    assert during_send == {
+        "checked_out": 0,
+        "leased": True,
+        "reclaimed": None,
+        "claimed": {"status": "lead", "clickid": "lease-001", "params": {}, "source": "frontend_relay", "attempt": 1},
+    }
+    with SessionLocal() as db:
+        stored = db.get(MobiSlonPostback, postback_id)
+        assert (stored.status, stored.attempts) == ("sent", 1)
+
+
+def test_mobi_slon_relay_holds_no_db_connection_and_intake_writes_batch_on_shutdown() -> None:
+    from app.core.db.pool_metrics import POOL_METRICS
+    from app.core.models.payment import MobiSlonPostback
+
+    def checkouts() -> dict[str, int]:
+        return {name: metrics.checkouts for name, metrics in POOL_METRICS.items()}
+
+    settings = get_settings()
+    settings.mobi_slon_postback_url = "https://mobi-slon.example/index.php"
+    settings.mobi_slon_intake_flush_interval_seconds = 60.0
+    statuses = ("block1_completed", "block2_completed", "block3_completed", "block4_completed")
+    try:
+        with TestClient(app) as client:
+            before = checkouts()
+            responses = [
+                client.post("/api/events/mobi-slon", json={"status": status, "clickid": "intake-001"})
+                for status in statuses
+            ]
+            responses.append(client.get("/api/events/mobi-slon", params={"status": statuses[0], "clickid": "intake-001"}))
+            assert checkouts() == before
+
+            settings.mobi_slon_intake_queue_size = 0
+            full = client.post("/api/events/mobi-slon", json={"status": "block5_completed", "clickid": "intake-001"})
+            settings.mobi_slon_intake_queue_size = 10_000
+            stats = client.get("/api/internal/mobi-slon-postbacks", headers={"X-Internal-Token": "test-internal-token"})
+    finally:
+        settings.mobi_slon_postback_url = ""
+        settings.mobi_slon_intake_flush_interval_seconds = 0.2
+        settings.mobi_slon_intake_queue_size = 10_000
+
+    assert [response.json()["duplicate"] for response in responses] == [False, False, False, False, True]
+    assert full.status_code == 503
+    assert stats.json()["intake"]["depth"] == 4
+    with SessionLocal() as db:
+        rows = db.query(MobiSlonPostback).filter(MobiSlonPostback.clickid == "intake-001").all()
+    assert sorted(row.cnv_status for row in rows) == list(statuses)
+    assert {(row.status, row.source) for row in rows} == {("pending", "frontend_relay")}
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from datetime import timedelta
+import os
+from pathlib import Path
+import re
+import sys
+import tempfile
+from typing import Any
+
+# Standalone runs get their own database; alongside the other test modules the shared test
+# database (configured first) is used and the seed rows below simply add to it.
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{Path(tempfile.mkdtemp()) / 'test_query_plans.db'}")
+os.environ.setdefault("ACCESS_TOKEN_SECRET", "test-secret")
+os.environ.setdefault("TELEGRAM_BOT_USERNAME", "test_bot")
+os.environ.setdefault("OUTBOX_WORKER_ENABLED", "false")
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.engine import Connection  # noqa: E402
+
+from app.core.config import get_settings  # noqa: E402
+from app.core.db.session import SessionLocal, engine, init_db  # noqa: E402
+from app.core.models.payment import AccessBinding, AccessToken, Base, Order, RestoreOTP, utcnow  # noqa: E402
+from app.core.security import hash_value  # noqa: E402
+from app.services.entitlements import derive_access_state, load_access_states  # noqa: E402
+from app.services.payment_service import PaymentService  # noqa: E402
+
+SEED_ORDERS = 300
+# SQLite reports a full table scan as a bare "SCAN <table>"; index scans read "SCAN/SEARCH ... USING ...".
+# Scans of derived tables (UNION branches, subqueries) are named anon_N and are not table scans.
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+TABLES = {table.name for table in Base.metadata.sorted_tables}
+
+
+def _seed() -> None:
+    with SessionLocal() as db:
+        if db.get(Order, "plan-order-0") is not None:
+            return
+        for index in range(SEED_ORDERS):
+            order = Order(
+                id=f"plan-order-{index}",
+                email=f"plan{index}@example.com",
+                mode="subscription" if index % 2 else "one_time",
+                plan="one_time_basic",
+                amount_minor=999,
+                currency="usd",
+                status="paid",
+                access_status="active",
+                telegram_chat_id=f"plan-chat-{index}",
+                stripe_session_id=f"cs_plan_{index}",
+                stripe_payment_intent_id=f"pi_plan_{index}",
+                stripe_customer_id=f"cus_plan_{index}",
+                stripe_subscription_id=f"sub_plan_{index}" if index % 2 else None,
+            )
+            db.add(order)
+            db.add(AccessToken(order_id=order.id, status="issued"))
+            db.add(AccessBinding(order_id=order.id, telegram_user_id=f"plan-user-{index}", status="active"))
+            db.add(
+                RestoreOTP(
+                    email=order.email,
+                    otp_hash=hash_value("123456"),
+                    expires_at=utcnow() + timedelta(hours=1),
+                    used_at=utcnow() if index % 3 == 0 else None,
+                )
+            )
+        db.commit()
+    with engine.begin() as connection:
+        connection.exec_driver_sql("ANALYZE")
+
+
+@contextmanager
+def _captured_selects() -> Iterator[list[tuple[str, Any]]]:
+    captured: list[tuple[str, Any]] = []
+
+    def capture(conn: Connection, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+        if statement.lstrip().upper().startswith("SELECT") and not executemany:
+            captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        yield captured
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+
+def _full_scans(statements: list[tuple[str, Any]]) -> list[str]:
+    scans: list[str] = []
+    with engine.connect() as connection:
+        for statement, parameters in statements:
+            for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters):
+                match = FULL_SCAN.match(row[-1])
+                if match is not None and match.group(1) in TABLES:
+                    scans.append(f"{match.group(1)}: {statement}")
+    return scans
+
+
+def _assert_indexed(action: Callable[[PaymentService], object]) -> None:
+    if engine.dialect.name != "sqlite":
+        return
+    init_db()
+    _seed()
+    with SessionLocal() as db:
+        with _captured_selects() as statements:
+            action(PaymentService(get_settings(), db))
+        db.rollback()
+    assert statements, "action ran no SELECT statements"
+    assert _full_scans(statements) == []
+
+
+def test_subscription_and_customer_lookups_use_indexes() -> None:
+    _assert_indexed(lambda service: service._find_order_by_subscription("sub_plan_7"))
+    _assert_indexed(lambda service: service._find_order_by_subscription(None, "cus_plan_8"))
+
+
+def test_payment_intent_lookup_uses_index() -> None:
+    _assert_indexed(lambda service: service._update_order_status_by_payment_intent("pi_plan_5", status="paid"))
+
+
+def test_session_status_token_lookup_uses_index() -> None:
+    _assert_indexed(lambda service: service.get_session_status("cs_plan_4"))
+
+
+def test_restore_confirm_lookups_use_indexes() -> None:
+    _assert_indexed(
+        lambda service: service.restore_confirm(email="plan10@example.com", otp="123456", telegram_user_id=None)
+    )
+
+
+def test_restore_request_rate_limit_uses_index() -> None:
+    _assert_indexed(lambda service: service.restore_request(email="plan11@example.com"))
+
+
+def test_access_status_lookups_use_indexes() -> None:
+    _assert_indexed(lambda service: derive_access_state(service.db, "plan-user-12"))
+    _assert_indexed(lambda service: derive_access_state(service.db, "plan-chat-13"))
+    _assert_indexed(lambda service: load_access_states(service.db, ["plan-user-14", "plan-user-15"]))
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+import logging
+import time
+
+from app.client.backend_api import AccessStatus, BackendApiClient
+
+logger = logging.getLogger("quiz.bot")
+
+
+def grants_access(status: AccessStatus) -> bool:
+    return status.is_paid or status.access_status == "grace_period"
+
+
+@dataclass
+class _Entry:
+    status: AccessStatus
+    fetched_at: float
+    fresh_until: float
+
+
+class AccessStatusCache:
+    """Per-process access status cache in front of BackendApiClient.access_status.
+
+    Paid users are cached longer than unpaid ones (a payment must show up quickly). Within
+    `stale_seconds` after expiry the old value is served while a background refresh runs; if the
+    backend is down, the last known value is used for up to `last_known_seconds` after it was fetched.
+    While the backend change feed is connected, entries are updated in place and live for
+    `feed_ttl_seconds`.
+    """
+
+    def __init__(
+        self,
+        backend: BackendApiClient,
+        *,
+        paid_ttl_seconds: float,
+        unpaid_ttl_seconds: float,
+        stale_seconds: float,
+        last_known_seconds: float,
+        max_entries: int,
+        feed_ttl_seconds: float | None = None,
+    ) -> None:
+        self._backend = backend
+        self._paid_ttl_seconds = paid_ttl_seconds
+        self._unpaid_ttl_seconds = unpaid_ttl_seconds
+        self._stale_seconds = stale_seconds
+        self._last_known_seconds = last_known_seconds
+        self._max_entries = max(1, max_entries)
+        self._feed_ttl_seconds = feed_ttl_seconds
+        self._feed_connected = False
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._inflight: dict[str, asyncio.Task[AccessStatus]] = {}
+        self._tasks: set[asyncio.Task[AccessStatus]] = set()
+        self._version = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.last_known_hits = 0
+
+    async def get(self, telegram_user_id: str) -> AccessStatus:
+        now = time.monotonic()
+        entry = self._entries.get(telegram_user_id)
+        if entry is not None:
+            self._entries.move_to_end(telegram_user_id)
+            if now < entry.fresh_until:
+                self.hits += 1
+                return entry.status
+            if now < entry.fresh_until + self._stale_seconds:
+                self.stale_hits += 1
+                self._refresh(telegram_user_id)
+                return entry.status
+
+        self.misses += 1
+        try:
+            return await asyncio.shield(self._refresh(telegram_user_id))
+        except Exception as exc:  # noqa: BLE001
+            if entry is not None and now - entry.fetched_at < self._last_known_seconds:
+                self.last_known_hits += 1
+                logger.warning(
+                    "bot_access_cache_last_known user=%s age=%.0f error=%s",
+                    telegram_user_id,
+                    now - entry.fetched_at,
+                    str(exc)[:300],
+                )
+                return entry.status
+            raise
+
+    def peek(self, telegram_user_id: str) -> AccessStatus | None:
+        """Fresh cached status without touching the backend, or None."""
+        entry = self._entries.get(telegram_user_id)
+        if entry is None or time.monotonic() >= entry.fresh_until:
+            return None
+        self.hits += 1
+        return entry.status
+
+    def invalidate(self, telegram_user_id: str) -> None:
+        # A fetch already in flight may have read the state from before the change; drop its result.
+        self._version += 1
+        self._entries.pop(telegram_user_id, None)
+        self._inflight.pop(telegram_user_id, None)
+
+    def set_feed_connected(self, connected: bool) -> None:
+        self._feed_connected = connected
+        if connected:
+            return
+        # Without the feed nothing tells us about changes: fall back to the short TTLs.
+        for entry in self._entries.values():
+            entry.fresh_until = min(entry.fresh_until, entry.fetched_at + self._base_ttl(entry.status))
+
+    def expire_all(self) -> None:
+        """Mark every entry stale (changes may have been missed); it is still served while revalidating."""
+        now = time.monotonic()
+        for entry in self._entries.values():
+            entry.fresh_until = min(entry.fresh_until, now)
+
+    def apply_change(self, event: dict) -> None:
+        telegram_user_id = str(event.get("telegram_user_id") or "")
+        if telegram_user_id not in self._entries:
+            # Users not chatting right now are fetched on their next message.
+            return
+        self._version += 1
+        self._inflight.pop(telegram_user_id, None)
+        self._store(
+            telegram_user_id,
+            AccessStatus(
+                is_paid=bool(event.get("is_paid", False)),
+                order_id=event.get("order_id"),
+                plan=event.get("plan"),
+                access_status=event.get("access_status"),
+            ),
+        )
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "last_known_hits": self.last_known_hits,
+        }
+
+    def _refresh(self, telegram_user_id: str) -> asyncio.Task[AccessStatus]:
+        # Concurrent misses and background refreshes for one user share a single backend call.
+        task = self._inflight.get(telegram_user_id)
+        if task is None:
+            task = asyncio.create_task(self._fetch(telegram_user_id))
+            self._inflight[telegram_user_id] = task
+            self._tasks.add(task)
+            task.add_done_callback(lambda done: self._on_fetch_done(telegram_user_id, done))
+        return task
+
+    def _on_fetch_done(self, telegram_user_id: str, task: asyncio.Task[AccessStatus]) -> None:
+        self._tasks.discard(task)
+        if self._inflight.get(telegram_user_id) is task:
+            del self._inflight[telegram_user_id]
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("bot_access_cache_refresh_failed user=%s error=%s", telegram_user_id, str(task.exception())[:300])
+
+    async def _fetch(self, telegram_user_id: str) -> AccessStatus:
+        version = self._version
+        status = await self._backend.access_status(telegram_user_id)
+        if version != self._version:
+            return status
+        self._store(telegram_user_id, status)
+        return status
+
+    def _base_ttl(self, status: AccessStatus) -> float:
+        return self._paid_ttl_seconds if grants_access(status) else self._unpaid_ttl_seconds
+
+    def _store(self, telegram_user_id: str, status: AccessStatus) -> None:
+        now = time.monotonic()
+        ttl = self._base_ttl(status)
+        if self._feed_connected and self._feed_ttl_seconds is not None:
+            ttl = max(ttl, self._feed_ttl_seconds)
+        self._entries[telegram_user_id] = _Entry(status=status, fetched_at=now, fresh_until=now + ttl)
+        self._entries.move_to_end(telegram_user_id)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
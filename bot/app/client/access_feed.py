@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from app.client.access_cache import AccessStatusCache
+from app.client.backend_api import BackendApiClient
+
+logger = logging.getLogger("quiz.bot")
+
+
+class AccessFeedSubscriber:
+    """Keeps AccessStatusCache in sync with the backend entitlement change stream."""
+
+    def __init__(self, backend: BackendApiClient, cache: AccessStatusCache, *, retry_seconds: float = 5.0) -> None:
+        self._backend = backend
+        self._cache = cache
+        self._retry_seconds = retry_seconds
+
+    async def _consume(self) -> None:
+        async for event in self._backend.access_changes():
+            event_type = event.get("type")
+            if event_type == "entitlement":
+                self._cache.apply_change(event)
+            elif event_type in {"ready", "reset"}:
+                # Anything that changed while we were not subscribed has to be revalidated.
+                self._cache.expire_all()
+                if event_type == "ready":
+                    self._cache.set_feed_connected(True)
+                    logger.info("bot_access_feed_connected")
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self._consume()
+                logger.warning("bot_access_feed_closed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("bot_access_feed_failed error=%s", str(exc)[:300])
+            finally:
+                self._cache.set_feed_connected(False)
+            await asyncio.sleep(self._retry_seconds)
@@ -1,15 +1,20 @@
 from __future__ import annotations
 
 import asyncio
+from collections.abc import AsyncIterator
 from dataclasses import dataclass
 import json
 import logging
+from typing import Any
 import uuid
 
 import httpx
 
 logger = logging.getLogger("quiz.bot")
 
+# Mirrors the backend limit on POST /api/bot/access/status/batch.
+ACCESS_STATUS_BATCH_SIZE = 5000
+
 
 @dataclass
 class AccessStatus:
@@ -28,7 +33,7 @@ class BackendApiClient:
     async def close(self) -> None:
         await self._client.aclose()
 
-    async def _request(self, method: str, path: str, payload: dict[str, str]) -> dict:
+    async def _request(self, method: str, path: str, payload: dict[str, Any]) -> dict:
         headers = {
             "X-Internal-Token": self._internal_token,
             "X-Correlation-Id": str(uuid.uuid4()),
@@ -95,6 +100,50 @@ class BackendApiClient:
             access_status=payload.get("access_status"),
         )
 
+    async def access_status_many(self, telegram_user_ids: list[str]) -> dict[str, AccessStatus]:
+        """Resolve many users with one backend call per ACCESS_STATUS_BATCH_SIZE distinct ids."""
+        user_ids = list(dict.fromkeys(telegram_user_ids))
+        statuses: dict[str, AccessStatus] = {}
+        for start in range(0, len(user_ids), ACCESS_STATUS_BATCH_SIZE):
+            chunk = user_ids[start : start + ACCESS_STATUS_BATCH_SIZE]
+            payload = await self._request("POST", "/api/bot/access/status/batch", {"telegram_user_ids": chunk})
+            for user_id, item in payload.get("statuses", {}).items():
+                statuses[user_id] = AccessStatus(
+                    is_paid=bool(item.get("is_paid", False)),
+                    order_id=item.get("order_id"),
+                    plan=item.get("plan"),
+                    access_status=item.get("access_status"),
+                )
+        return statuses
+
+    async def access_changes(self, *, read_timeout_seconds: float = 60.0) -> AsyncIterator[dict]:
+        """Stream entitlement change events (SSE) until the connection drops."""
+        headers = {"X-Internal-Token": self._internal_token, "Accept": "text/event-stream"}
+        timeout = httpx.Timeout(10.0, read=read_timeout_seconds)
+        async with self._client.stream(
+            "GET", f"{self._base_url}/api/bot/access/changes", headers=headers, timeout=timeout
+        ) as response:
+            response.raise_for_status()
+            event_type = "message"
+            data_lines: list[str] = []
+            async for line in response.aiter_lines():
+                if not line:
+                    if data_lines:
+                        event = json.loads("\n".join(data_lines)) or {}
+                        event.setdefault("type", event_type)
+                        yield event
+                    event_type = "message"
+                    data_lines = []
+                    continue
+                if line.startswith(":"):
+                    continue
+                field, _, value = line.partition(":")
+                value = value.removeprefix(" ")
+                if field == "event":
+                    event_type = value
+                elif field == "data":
+                    data_lines.append(value)
+
     async def activate_access(self, *, activation_token: str, telegram_user_id: str) -> dict:
         return await self._request(
             "POST",
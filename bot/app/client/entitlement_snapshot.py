@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+
+logger = logging.getLogger("quiz.bot")
+
+# Written by backend app/services/entitlement_snapshot.py: 32-byte little-endian header
+# (magic, format, reserved, version, generated_at unix seconds, count) + `count` sorted int64 ids.
+SNAPSHOT_MAGIC = b"ENTS"
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_HEADER = struct.Struct("<4sHHQdQ")
+
+
+class EntitlementSnapshot:
+    """Read-only, memory-mapped view of the backend's entitled-users snapshot.
+
+    Lookups are a binary search over the mapped ids: no parsing, no allocation, no network.
+    The file is re-stat'ed at most every `check_interval_seconds` and remapped when the backend
+    has replaced it. Only positive answers are meaningful: a missing id, a missing file or a
+    snapshot older than `max_age_seconds` all return None and the caller asks the backend.
+    """
+
+    def __init__(self, path: str, *, max_age_seconds: float, check_interval_seconds: float = 1.0) -> None:
+        self._path = path
+        self._max_age_seconds = max_age_seconds
+        self._check_interval_seconds = check_interval_seconds
+        self._checked_at = float("-inf")
+        self._file_key: tuple[int, int, int] | None = None
+        self._mmap: mmap.mmap | None = None
+        self._ids: memoryview | None = None
+        self._generated_at = 0.0
+        self.version = 0
+        self.hits = 0
+        self.reloads = 0
+
+    def contains(self, telegram_user_id: str) -> bool | None:
+        self._maybe_reload()
+        ids = self._ids
+        if ids is None or time.time() - self._generated_at > self._max_age_seconds:
+            return None
+        try:
+            user_id = int(telegram_user_id)
+        except ValueError:
+            return None
+        index = bisect_left(ids, user_id)
+        if index < len(ids) and ids[index] == user_id:
+            self.hits += 1
+            return True
+        return None
+
+    def close(self) -> None:
+        self._release()
+        self._file_key = None
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "version": self.version,
+            "size": len(self._ids) if self._ids is not None else 0,
+            "hits": self.hits,
+            "reloads": self.reloads,
+        }
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < self._check_interval_seconds:
+            return
+        self._checked_at = now
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            self.close()
+            return
+        file_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if file_key == self._file_key:
+            return
+        try:
+            self._load()
+        except (OSError, ValueError) as exc:
+            logger.warning("bot_entitlement_snapshot_invalid path=%s error=%s", self._path, str(exc)[:300])
+            self._release()
+        self._file_key = file_key
+
+    def _load(self) -> None:
+        with open(self._path, "rb") as snapshot:
+            mapped = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, fmt, _, version, generated_at, count = SNAPSHOT_HEADER.unpack_from(mapped)
+            if magic != SNAPSHOT_MAGIC or fmt != SNAPSHOT_FORMAT:
+                raise ValueError("unknown snapshot format")
+            if len(mapped) != SNAPSHOT_HEADER.size + count * 8:
+                raise ValueError("truncated snapshot")
+            if sys.byteorder != "little":
+                raise ValueError("big-endian hosts are not supported")
+            ids = memoryview(mapped)[SNAPSHOT_HEADER.size :].cast("q")
+        except struct.error as exc:
+            mapped.close()
+            raise ValueError("truncated snapshot header") from exc
+        except ValueError:
+            mapped.close()
+            raise
+        self._release()
+        self._mmap = mapped
+        self._ids = ids
+        self._generated_at = generated_at
+        self.version = version
+        self.reloads += 1
+        logger.info("bot_entitlement_snapshot_loaded version=%s count=%s", version, count)
+
+    def _release(self) -> None:
+        # The view must be released before the map can close; the old inode goes away with it.
+        if self._ids is not None:
+            self._ids.release()
+            self._ids = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
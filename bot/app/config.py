@@ -18,6 +18,15 @@ class BotSettings(BaseSettings):
     app_public_base_url: str = ""
     bot_pay_url: str = ""
     bot_allowed_public_commands: str = "/start,/restore,/help"
+    bot_access_cache_paid_ttl_seconds: float = 300.0
+    bot_access_cache_unpaid_ttl_seconds: float = 15.0
+    bot_access_cache_stale_seconds: float = 600.0
+    bot_access_cache_last_known_seconds: float = 3600.0
+    bot_access_cache_max_entries: int = 50_000
+    bot_access_feed_enabled: bool = True
+    bot_access_cache_feed_ttl_seconds: float = 3600.0
+    bot_entitlement_snapshot_path: str = ""
+    bot_entitlement_snapshot_max_age_seconds: float = 300.0
 
     @property
     def normalized_mode(self) -> str:
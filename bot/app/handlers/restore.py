@@ -7,6 +7,7 @@ from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
 
+from app.client.access_cache import AccessStatusCache
 from app.client.backend_api import BackendApiClient
 from app.states.restore import RestoreFlow
 
@@ -38,7 +39,12 @@ async def restore_email(message: Message, state: FSMContext, backend: BackendApi
 
 
 @router.message(RestoreFlow.waiting_otp, F.text)
-async def restore_otp(message: Message, state: FSMContext, backend: BackendApiClient) -> None:
+async def restore_otp(
+    message: Message,
+    state: FSMContext,
+    backend: BackendApiClient,
+    access_cache: AccessStatusCache,
+) -> None:
     otp = message.text.strip()
     if len(otp) != 6 or not otp.isdigit():
         await message.answer("OTP должен содержать 6 цифр.")
@@ -62,6 +68,7 @@ async def restore_otp(message: Message, state: FSMContext, backend: BackendApiCl
         return
 
     await state.clear()
+    access_cache.invalidate(telegram_user_id)
     if payload.get("access_granted"):
         await message.answer("Доступ восстановлен. Команда /premium снова доступна.")
         return
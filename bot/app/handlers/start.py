@@ -8,6 +8,7 @@ from aiogram import Router
 from aiogram.filters import Command, CommandObject, CommandStart
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message
 
+from app.client.access_cache import AccessStatusCache
 from app.client.backend_api import BackendApiClient
 
 logger = logging.getLogger("quiz.bot")
@@ -48,7 +49,13 @@ def _pay_keyboard(pay_url: str) -> InlineKeyboardMarkup | None:
 
 
 @router.message(CommandStart())
-async def start_handler(message: Message, command: CommandObject, backend: BackendApiClient, pay_url: str) -> None:
+async def start_handler(
+    message: Message,
+    command: CommandObject,
+    backend: BackendApiClient,
+    access_cache: AccessStatusCache,
+    pay_url: str,
+) -> None:
     raw_args = command.args if command else ""
     token = _normalize_start_payload(raw_args)
     telegram_user_id = str(message.from_user.id) if message.from_user else ""
@@ -70,6 +77,7 @@ async def start_handler(message: Message, command: CommandObject, backend: Backe
                 f"{token[:8]}...{token[-6:]}" if len(token) > 16 else token,
             )
             payload = await backend.activate_access(activation_token=token, telegram_user_id=telegram_user_id)
+            access_cache.invalidate(telegram_user_id)
             if payload.get("access_granted"):
                 await message.answer("Доступ активирован. Команда /premium теперь доступна.")
                 return
@@ -10,8 +10,11 @@ from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
+from app.client.access_cache import AccessStatusCache
+from app.client.access_feed import AccessFeedSubscriber
 from app.client.backend_api import BackendApiClient
-from app.config import get_settings
+from app.client.entitlement_snapshot import EntitlementSnapshot
+from app.config import BotSettings, get_settings
 from app.handlers.premium import router as premium_router
 from app.handlers.restore import router as restore_router
 from app.handlers.start import router as start_router
@@ -39,10 +42,51 @@ async def _start_health_server(*, port: int, mode: str) -> web.AppRunner:
     return runner
 
 
-async def _build_dispatcher(backend: BackendApiClient, public_commands: set[str], pay_url: str) -> Dispatcher:
+def _build_access_cache(backend: BackendApiClient, settings: BotSettings) -> AccessStatusCache:
+    return AccessStatusCache(
+        backend,
+        paid_ttl_seconds=settings.bot_access_cache_paid_ttl_seconds,
+        unpaid_ttl_seconds=settings.bot_access_cache_unpaid_ttl_seconds,
+        stale_seconds=settings.bot_access_cache_stale_seconds,
+        last_known_seconds=settings.bot_access_cache_last_known_seconds,
+        max_entries=settings.bot_access_cache_max_entries,
+        feed_ttl_seconds=settings.bot_access_cache_feed_ttl_seconds,
+    )
+
+
+def _start_access_feed(dp: Dispatcher, backend: BackendApiClient, settings: BotSettings) -> asyncio.Task[None] | None:
+    if not settings.bot_access_feed_enabled:
+        return None
+    subscriber = AccessFeedSubscriber(backend, dp["access_cache"])
+    return asyncio.create_task(subscriber.run(), name="bot-access-feed")
+
+
+async def _stop_access_feed(task: asyncio.Task[None] | None) -> None:
+    if task is None:
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+async def _build_dispatcher(backend: BackendApiClient, settings: BotSettings) -> Dispatcher:
+    public_commands = settings.allowed_public_commands_set
+    pay_url = settings.pay_url
+    access_cache = _build_access_cache(backend, settings)
     dp = Dispatcher(storage=MemoryStorage())
-    dp.message.middleware(AccessGateMiddleware(backend=backend, public_commands=public_commands, pay_url=pay_url))
+    snapshot: EntitlementSnapshot | None = None
+    if settings.bot_entitlement_snapshot_path:
+        snapshot = EntitlementSnapshot(
+            settings.bot_entitlement_snapshot_path,
+            max_age_seconds=settings.bot_entitlement_snapshot_max_age_seconds,
+        )
+    dp.message.middleware(
+        AccessGateMiddleware(access_cache=access_cache, public_commands=public_commands, pay_url=pay_url, snapshot=snapshot)
+    )
     dp["backend"] = backend
+    dp["access_cache"] = access_cache
     dp["pay_url"] = pay_url
     dp.include_router(start_router)
     dp.include_router(restore_router)
@@ -54,14 +98,16 @@ async def run_polling() -> None:
     settings = get_settings()
     backend = BackendApiClient(base_url=settings.bot_backend_base_url, internal_token=settings.bot_internal_token)
     bot = Bot(token=settings.telegram_bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    dp = await _build_dispatcher(backend, settings.allowed_public_commands_set, settings.pay_url)
+    dp = await _build_dispatcher(backend, settings)
 
     health_runner = await _start_health_server(port=settings.bot_port, mode="polling")
+    feed_task = _start_access_feed(dp, backend, settings)
     logger.info("bot_start_polling")
     try:
         await bot.delete_webhook(drop_pending_updates=False)
         await dp.start_polling(bot)
     finally:
+        await _stop_access_feed(feed_task)
         await health_runner.cleanup()
         await backend.close()
         await bot.session.close()
@@ -71,7 +117,7 @@ async def run_webhook() -> None:
     settings = get_settings()
     backend = BackendApiClient(base_url=settings.bot_backend_base_url, internal_token=settings.bot_internal_token)
     bot = Bot(token=settings.telegram_bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    dp = await _build_dispatcher(backend, settings.allowed_public_commands_set, settings.pay_url)
+    dp = await _build_dispatcher(backend, settings)
 
     await bot.set_webhook(settings.webhook_public_url, drop_pending_updates=False)
     logger.info("bot_set_webhook", extra={"url": settings.webhook_public_url})
@@ -88,6 +134,7 @@ async def run_webhook() -> None:
     await site.start()
 
     logger.info("bot_webhook_server_started", extra={"port": settings.bot_port, "path": webhook_path})
+    feed_task = _start_access_feed(dp, backend, settings)
 
     try:
         while True:
@@ -96,6 +143,7 @@ async def run_webhook() -> None:
         logger.info("bot_webhook_shutdown")
         raise
     finally:
+        await _stop_access_feed(feed_task)
         await bot.delete_webhook(drop_pending_updates=False)
         await runner.cleanup()
         await backend.close()
@@ -8,7 +8,8 @@ from urllib.parse import urlparse
 from aiogram import BaseMiddleware
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message, TelegramObject
 
-from app.client.backend_api import BackendApiClient
+from app.client.access_cache import AccessStatusCache, grants_access
+from app.client.entitlement_snapshot import EntitlementSnapshot
 
 logger = logging.getLogger("quiz.bot")
 
@@ -27,8 +28,16 @@ def _is_telegram_button_url(url: str) -> bool:
 
 
 class AccessGateMiddleware(BaseMiddleware):
-    def __init__(self, *, backend: BackendApiClient, public_commands: set[str], pay_url: str) -> None:
-        self._backend = backend
+    def __init__(
+        self,
+        *,
+        access_cache: AccessStatusCache,
+        public_commands: set[str],
+        pay_url: str,
+        snapshot: EntitlementSnapshot | None = None,
+    ) -> None:
+        self._access_cache = access_cache
+        self._snapshot = snapshot
         self._public_commands = {cmd.lower() for cmd in public_commands}
         self._pay_url = pay_url
 
@@ -60,14 +69,20 @@ class AccessGateMiddleware(BaseMiddleware):
         if not telegram_user_id:
             return await handler(event, data)
 
+        # A fresh cache entry wins (it reflects feed updates newer than the snapshot); otherwise a
+        # snapshot hit admits paid users without a backend round trip. Everyone else is checked online.
+        cached = self._access_cache.peek(telegram_user_id)
+        if cached is None and self._snapshot is not None and self._snapshot.contains(telegram_user_id):
+            return await handler(event, data)
+
         try:
-            status = await self._backend.access_status(telegram_user_id)
+            status = cached or await self._access_cache.get(telegram_user_id)
         except Exception as exc:  # noqa: BLE001
             logger.warning("bot_access_check_failed", extra={"error": str(exc)})
             await event.answer("Сервис временно недоступен, попробуйте еще раз через минуту.")
             return None
 
-        if status.is_paid or status.access_status == "grace_period":
+        if grants_access(status):
             return await handler(event, data)
 
         logger.info(